@@ -1,7 +1,21 @@
 # gemini.py
 import os
+import re
+import json
+import time
+import hashlib
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Union
 from dotenv import load_dotenv
+import httpx
 from crewai import LLM
+from litellm.llms.custom_httpx.http_handler import HTTPHandler
+from utils.disk_cache import DiskCache
+from utils.job_runner import check_cancelled
+from utils.rate_limiter import RateLimiter, backoff_delay, is_rate_limit_error, estimate_tokens
+from utils.prompt_budget import UsageCapture, record_llm_usage
+from utils.metrics import metrics
 
 load_dotenv()  # Carga el .env que tienes en la carpeta
 
@@ -11,8 +25,175 @@ gemini_api_key = os.getenv("GEMINI_API_KEY")
 
 # print(gemini_api_key)
 
-gemini_llm = LLM(
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+
+# Con streaming el contenido se muestra en la interfaz a medida que se genera
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() == "true"
+
+# Admisión compartida por todas las sesiones del proceso (ajustar al tier de la cuenta de Gemini)
+LLM_RPM = float(os.getenv("LLM_RPM", "60"))
+LLM_TPM = float(os.getenv("LLM_TPM", "1000000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_DEFAULT_OUTPUT_TOKENS = 1024
+
+gemini_rate_limiter = RateLimiter(
+    requests_per_minute=LLM_RPM,
+    tokens_per_minute=LLM_TPM,
+    max_concurrent=LLM_MAX_CONCURRENCY
+)
+
+# Un único pool HTTP keep-alive para todas las llamadas (litellm crea un cliente nuevo por llamada en streaming)
+gemini_http_client = HTTPHandler(
+    timeout=httpx.Timeout(timeout=600.0, connect=5.0),
+    concurrent_limit=max(LLM_MAX_CONCURRENCY, 1) * 2
+)
+
+# Activo dentro de `bypass_llm_cache()`: se ignora la caché al leer pero se guarda la respuesta nueva
+_bypass_cache = contextvars.ContextVar("bypass_llm_cache", default=False)
+
+
+@contextmanager
+def bypass_llm_cache():
+    """Fuerza llamadas reales al LLM (p. ej. desde "Regenerar Historia")"""
+    token = _bypass_cache.set(True)
+    try:
+        yield
+    finally:
+        _bypass_cache.reset(token)
+
+
+def llm_cache_bypassed() -> bool:
+    """True dentro de `bypass_llm_cache()` (el contenido memoizado del pipeline también se recalcula)"""
+    return _bypass_cache.get()
+
+
+def normalize_messages(messages: Union[str, List[Dict[str, Any]]]) -> List[Dict[str, str]]:
+    """Colapsa espacios para que prompts casi idénticos compartan entrada en la caché"""
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    return [
+        {
+            "role": message.get("role", "user"),
+            "content": re.sub(r"\s+", " ", str(message.get("content", ""))).strip()
+        }
+        for message in messages
+    ]
+
+
+def task_label(task: Any) -> str:
+    """Nombre con el que se contabilizan los tokens de una llamada"""
+    return getattr(task, "name", None) or "llamada_directa"
+
+
+def estimate_prompt_tokens(messages: Union[str, List[Dict[str, Any]]]) -> int:
+    return estimate_tokens(json.dumps(normalize_messages(messages), ensure_ascii=False))
+
+
+class CachedLLM(LLM):
+    """
+    LLM de CrewAI con caché persistente de respuestas y control de admisión.
+
+    Solo se cachean llamadas deterministas (temperature=0) sin herramientas
+    nativas, indexadas por modelo, parámetros y prompt normalizado. Las
+    llamadas reales pasan por el limitador del proceso y se reintentan con
+    backoff exponencial con jitter ante un 429. Los tokens de cada llamada se
+    anotan por tarea (ver utils.prompt_budget).
+    """
+
+    def __init__(self, *args, cache: Optional[DiskCache] = None, rate_limiter: Optional[RateLimiter] = None,
+                 max_retries: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+
+    def cache_key(self, messages: Union[str, List[Dict[str, Any]]]) -> str:
+        payload = {
+            "model": self.model,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+            "max_tokens": self.max_tokens,
+            "max_completion_tokens": self.max_completion_tokens,
+            "stop": self.stop,
+            "seed": self.seed,
+            "response_format": getattr(self.response_format, "__name__", None),
+            "messages": normalize_messages(messages)
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def is_cacheable(self, tools: Optional[List[dict]], available_functions: Optional[Dict[str, Any]]) -> bool:
+        return self.cache is not None and self.temperature == 0 and not tools and not available_functions
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None, from_agent=None):
+        # Un trabajo cancelado no debe gastar más llamadas al LLM
+        check_cancelled()
+
+        if not self.is_cacheable(tools, available_functions):
+            return self.admitted_call(messages, tools, callbacks, available_functions, from_task, from_agent)
+
+        key = self.cache_key(messages)
+        if not _bypass_cache.get():
+            cached = self.cache.get(key)
+            if cached is not None:
+                record_llm_usage(task_label(from_task), estimate_prompt_tokens(messages), estimate_tokens(cached), cached=True)
+                return cached
+
+        response = self.admitted_call(messages, tools, callbacks, available_functions, from_task, from_agent)
+        if isinstance(response, str) and response.strip():
+            self.cache.set(key, response)
+        return response
+
+    def admitted_call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None, from_agent=None):
+        """Llamada real al proveedor respetando RPM/TPM/concurrencia, con reintentos ante 429"""
+        if self.rate_limiter is None:
+            return self.metered_call(messages, tools, callbacks, available_functions, from_task, from_agent)
+
+        tokens = estimate_prompt_tokens(messages) + (self.max_tokens or LLM_DEFAULT_OUTPUT_TOKENS)
+
+        attempt = 0
+        while True:
+            with self.rate_limiter.slot(tokens):
+                try:
+                    return self.metered_call(messages, tools, callbacks, available_functions, from_task, from_agent)
+                except Exception as e:
+                    if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                        raise
+                    self.rate_limiter.record_throttle()
+            # Esperar fuera de la plaza para no bloquear a otras llamadas
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+            check_cancelled()
+
+    def metered_call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None, from_agent=None):
+        """Llamada al proveedor anotando los tokens que informa (o una estimación si no los informa)"""
+        usage = UsageCapture()
+        with metrics.span("llm_call"):
+            response = super().call(messages, tools, [*(callbacks or []), usage], available_functions, from_task, from_agent)
+        record_llm_usage(
+            task_label(from_task),
+            usage.prompt_tokens or estimate_prompt_tokens(messages),
+            usage.completion_tokens or estimate_tokens(str(response))
+        )
+        return response
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self.cache.stats() if self.cache is not None else None
+
+
+llm_cache = DiskCache(
+    os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm.sqlite")),
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "500")),
+    ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+) if LLM_CACHE_ENABLED else None
+
+gemini_llm = CachedLLM(
     model="gemini-2.5-flash",
     api_key=gemini_api_key,
-    temperature=0.0
-)
\ No newline at end of file
+    temperature=0.0,
+    stream=LLM_STREAMING,
+    client=gemini_http_client,
+    cache=llm_cache,
+    rate_limiter=gemini_rate_limiter,
+    max_retries=LLM_MAX_RETRIES
+)
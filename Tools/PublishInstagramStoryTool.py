@@ -1,9 +1,8 @@
 from crewai.tools import BaseTool
 from utils.publicar import login_user,post_image, generate_daily_schedule, schedule_and_post
+from utils.image_ingest import ingest_image
 from typing import Dict, Any, List
 import requests
-from io import BytesIO
-from PIL import Image
 from pathlib import Path
 import sys
 sys.path.append('../')
@@ -21,9 +20,7 @@ class PublishInstagramStoryTool(BaseTool):
         cl = login_user()        
         print(cl)
         response = requests.get(story_data.get('image_url'))
-        image = Image.open(BytesIO(response.content))
-        image = image.convert("RGB")
-        new_image= image.resize((1080,1080))
+        new_image = ingest_image(response.content).publish
         new_image.save("temporary.jpg")
         image_path = Path("temporary.jpg")
         caption = story_data.get('content')
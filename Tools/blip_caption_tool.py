@@ -1,16 +1,171 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional
 from crewai.tools import BaseTool
-from transformers import BlipProcessor, BlipForConditionalGeneration
 from PIL import Image
+from utils.disk_cache import DiskCache
+from utils.image_ingest import load_for_caption
+from utils.metrics import metrics
+from Tools.caption_worker import is_worker_enabled, is_worker_running, is_worker_starting, get_caption_worker_client
 
-# Cargamos BLIP una sola vez a nivel de módulo
-_processor = BlipProcessor.from_pretrained(
-    "Salesforce/blip-image-captioning-base",
-    use_fast=True
-)
-_blip_model = BlipForConditionalGeneration.from_pretrained(
-    "Salesforce/blip-image-captioning-base"
+BLIP_MODEL_NAME = "Salesforce/blip-image-captioning-base"
+BLIP_GENERATION_PARAMS = {"max_new_tokens": 50, "num_beams": 3}
+# Número máximo de imágenes por pasada de generate en los lotes
+BLIP_MAX_BATCH_SIZE = int(os.getenv("BLIP_MAX_BATCH_SIZE", "8"))
+# Backend de inferencia: "fp32" (por defecto) o "int8" (cuantización dinámica para CPU)
+BLIP_BACKEND = os.getenv("BLIP_BACKEND", "fp32").lower()
+BLIP_BACKENDS = ("fp32", "int8")
+
+# Prompts condicionales para una descripción por facetas (nombre → prefijo que BLIP completa)
+DEFAULT_FACET_PROMPTS = {
+    "escena": "a photography of",
+    "colores": "the main colors are",
+    "ambiente": "the mood is",
+}
+# Si está activo, la herramienta devuelve el caption junto con las facetas
+BLIP_FACETS_ENABLED = os.getenv("BLIP_FACETS", "false").lower() == "true"
+
+
+def parse_facet_prompts(value: Optional[str]) -> Dict[str, str]:
+    """Convierte 'nombre=prompt;nombre=prompt' en diccionario (o devuelve los prompts por defecto)"""
+    if not value:
+        return dict(DEFAULT_FACET_PROMPTS)
+    prompts = {}
+    for item in value.split(";"):
+        if "=" in item:
+            name, prompt = item.split("=", 1)
+            if name.strip() and prompt.strip():
+                prompts[name.strip()] = prompt.strip()
+    return prompts or dict(DEFAULT_FACET_PROMPTS)
+
+
+BLIP_FACET_PROMPTS = parse_facet_prompts(os.getenv("BLIP_FACET_PROMPTS"))
+
+# BLIP se carga una sola vez por proceso, en el primer uso o desde el hilo de warm-up
+_processor = None
+_blip_model = None
+_load_lock = threading.Lock()
+_warmup_thread: Optional[threading.Thread] = None
+_load_error: Optional[str] = None
+
+# Caché persistente de captions indexada por el contenido de la imagen
+caption_cache = DiskCache(
+    os.getenv("CAPTION_CACHE_PATH", os.path.join(".cache", "captions.sqlite")),
+    max_entries=int(os.getenv("CAPTION_CACHE_MAX_ENTRIES", "2000"))
 )
 
+
+def load_blip():
+    """Carga el processor y el modelo BLIP la primera vez que se necesitan"""
+    global _processor, _blip_model, _load_error
+    if _blip_model is None:
+        with _load_lock:
+            if _blip_model is None:
+                # Importación diferida: transformers tarda varios segundos en importarse
+                from transformers import BlipProcessor, BlipForConditionalGeneration
+
+                try:
+                    processor = BlipProcessor.from_pretrained(
+                        BLIP_MODEL_NAME,
+                        use_fast=True
+                    )
+                    model = BlipForConditionalGeneration.from_pretrained(
+                        BLIP_MODEL_NAME
+                    )
+                    model = prepare_blip_model(model, BLIP_BACKEND)
+                except Exception as e:
+                    _load_error = str(e)
+                    raise
+
+                _processor = processor
+                _blip_model = model
+                _load_error = None
+    return _processor, _blip_model
+
+
+def prepare_blip_model(model, backend: str = "fp32"):
+    """Deja el modelo listo para inferencia con el backend indicado"""
+    if backend not in BLIP_BACKENDS:
+        raise ValueError(f"Backend de BLIP no soportado: {backend} (opciones: {', '.join(BLIP_BACKENDS)})")
+
+    model.eval()
+    if backend == "int8":
+        model = quantize_blip(model)
+    return model
+
+
+def quantize_blip(model):
+    """Cuantización dinámica int8 de todas las capas lineales (decoder de texto incluido)"""
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def start_blip_warmup() -> threading.Thread:
+    """Inicia (una sola vez) la carga de BLIP en un hilo de fondo"""
+    global _warmup_thread
+    with _load_lock:
+        if _warmup_thread is None or (not _warmup_thread.is_alive() and _blip_model is None):
+            _warmup_thread = threading.Thread(target=_warmup, name="blip-warmup", daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+def _warmup():
+    try:
+        load_blip()
+    except Exception as e:
+        print(f"❌ Error precargando BLIP: {e}")
+
+
+def is_blip_ready() -> bool:
+    """Indica si el modelo ya está cargado en memoria"""
+    return _blip_model is not None
+
+
+def blip_status() -> str:
+    """Estado del modelo para la interfaz: 'ready', 'loading', 'error', 'idle' o 'worker'"""
+    if is_worker_enabled():
+        if is_worker_running():
+            return "worker"
+        if is_worker_starting():
+            return "loading"
+    if _blip_model is not None:
+        return "ready"
+    if _warmup_thread is not None and _warmup_thread.is_alive():
+        return "loading"
+    if _load_error:
+        return "error"
+    return "idle"
+
+
+def image_fingerprint(image: Image.Image) -> str:
+    """Hash de los píxeles decodificados (independiente del nombre o formato del archivo)"""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def caption_cache_key(image: Image.Image, **params) -> str:
+    """Clave de caché: píxeles + modelo + backend + parámetros de decodificación"""
+    config = json.dumps({"model": BLIP_MODEL_NAME, "backend": BLIP_BACKEND, **params}, sort_keys=True)
+    return hashlib.sha256(f"{image_fingerprint(image)}|{config}".encode()).hexdigest()
+
+
+def blip_config_key() -> Dict[str, object]:
+    """Configuración de BLIP que decide la descripción de una imagen (modelo, backend, decodificación y facetas)"""
+    return {
+        "model": BLIP_MODEL_NAME,
+        "backend": BLIP_BACKEND,
+        "generation": BLIP_GENERATION_PARAMS,
+        "facets": BLIP_FACETS_ENABLED,
+        "facet_prompts": BLIP_FACET_PROMPTS,
+    }
+
+
 class BlipCaptionTool(BaseTool):
     name: str = "Image Captioning Tool"
     description: str = (
@@ -24,19 +179,164 @@ class BlipCaptionTool(BaseTool):
         Devuelve → caption en texto
         """
         print(image_path)
-        image = Image.open(image_path).convert("RGB")
-
-        inputs = _processor(images=image, return_tensors="pt")
-        output = _blip_model.generate(
-            **inputs,
-            max_new_tokens=50,
-            num_beams=3
-        )
+        if BLIP_FACETS_ENABLED:
+            description = format_description(self.describe_image(image_path))
+            print(description)
+            return description
 
-        caption = _processor.decode(output[0], skip_special_tokens=True)
+        caption = self.caption_image(image_path)
         print(caption)
         return caption
 
+    def caption_image(self, image_path: str) -> str:
+        """Caption de una imagen: en el worker si está activo, si no con el modelo local"""
+        if is_worker_enabled():
+            try:
+                return get_caption_worker_client().caption(image_path)
+            except Exception as e:
+                print(f"⚠️ Worker de captions no disponible, usando el modelo local: {e}")
+        return self.caption_batch([image_path])[0]
+
+    def describe_image(self, image_path: str, prompts: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """Caption y facetas: en el worker si está activo, si no con el modelo local"""
+        prompts = prompts or BLIP_FACET_PROMPTS
+        if is_worker_enabled():
+            try:
+                return get_caption_worker_client().describe(image_path, prompts)
+            except Exception as e:
+                print(f"⚠️ Worker de captions no disponible, usando el modelo local: {e}")
+        return self.describe(image_path, prompts)
+
+    def caption_batch(self, image_paths: List[str], max_batch_size: Optional[int] = None) -> List[str]:
+        """
+        image_paths → rutas de las imágenes a describir
+        max_batch_size → máximo de imágenes por pasada de generate (BLIP_MAX_BATCH_SIZE por defecto)
+        Devuelve → un caption por imagen, en el mismo orden
+        """
+        batch_size = max(1, max_batch_size or BLIP_MAX_BATCH_SIZE)
+        # Decodificación rápida a tamaño de caption (draft JPEG + reduce + orientación EXIF)
+        with metrics.span("blip_decode"):
+            images = [load_for_caption(path) for path in image_paths]
+        keys = [caption_cache_key(image, **BLIP_GENERATION_PARAMS) for image in images]
+
+        captions: List[Optional[str]] = [caption_cache.get(key) for key in keys]
+        pending = [i for i, caption in enumerate(captions) if caption is None]
+
+        # Solo las imágenes que no están en caché pasan por el modelo
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            generated = generate_captions([images[i] for i in chunk])
+            for i, caption in zip(chunk, generated):
+                caption_cache.set(keys[i], caption)
+                captions[i] = caption
+
+        return captions
+
+    def describe(self, image_path: str, prompts: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """
+        image_path → ruta al archivo de imagen
+        prompts → facetas {nombre: prompt condicional}; BLIP_FACET_PROMPTS por defecto
+        Devuelve → {"caption": ..., faceta: texto, ...}
+        """
+        prompts = prompts or BLIP_FACET_PROMPTS
+        with metrics.span("blip_decode"):
+            image = load_for_caption(image_path)
+        caption_key = caption_cache_key(image, **BLIP_GENERATION_PARAMS)
+        facets_key = caption_cache_key(image, prompts=prompts, **BLIP_GENERATION_PARAMS)
+
+        caption = caption_cache.get(caption_key)
+        facets = caption_cache.get(facets_key)
+
+        if facets is None:
+            requested = dict(prompts)
+            if caption is None:
+                # Prompt vacío = caption incondicional, en la misma pasada del encoder
+                requested["caption"] = ""
+            facets = generate_facets([image], requested)[0]
+            if caption is None:
+                caption = facets.pop("caption")
+                caption_cache.set(caption_key, caption)
+            caption_cache.set(facets_key, facets)
+        elif caption is None:
+            caption = generate_captions([image])[0]
+            caption_cache.set(caption_key, caption)
+
+        return {"caption": caption, **facets}
+
+
+@metrics.timed("blip_generate")
+def generate_captions(images: List[Image.Image]) -> List[str]:
+    """Ejecuta BLIP sobre un lote de imágenes en una sola llamada a generate"""
+    processor, model = load_blip()
+    # El processor redimensiona todas las imágenes al mismo tamaño y las apila en un único tensor
+    inputs = processor(images=images, return_tensors="pt")
+    output = model.generate(
+        **inputs,
+        **BLIP_GENERATION_PARAMS
+    )
+    return processor.batch_decode(output, skip_special_tokens=True)
+
+
+@metrics.timed("blip_generate")
+def generate_facets(images: List[Image.Image], prompts: Dict[str, str]) -> List[Dict[str, str]]:
+    """
+    Ejecuta el encoder de visión una sola vez por imagen y el decoder de texto
+    para todos los prompts condicionales en lote.
+    """
+    import torch
+
+    processor, model = load_blip()
+    text_config = model.config.text_config
+    pixel_values = processor(images=images, return_tensors="pt").pixel_values
+
+    with torch.inference_mode():
+        image_embeds = model.vision_model(pixel_values=pixel_values)[0]
+
+    # Los prompts de igual longitud en tokens comparten lote sin necesidad de padding
+    groups: Dict[int, List[tuple]] = {}
+    for name, prompt in prompts.items():
+        ids = processor.tokenizer(prompt).input_ids
+        ids[0] = text_config.bos_token_id
+        # El último token es [SEP]; el decoder debe continuar el texto a partir del prompt
+        groups.setdefault(len(ids) - 1, []).append((name, ids[:-1]))
+
+    results: List[Dict[str, str]] = [{} for _ in images]
+    num_images = image_embeds.shape[0]
+    for group in groups.values():
+        names = [name for name, _ in group]
+        prompt_ids = torch.tensor([ids for _, ids in group], dtype=torch.long)
+
+        # Cada imagen se combina con cada prompt: (imágenes × prompts) secuencias en un único generate
+        input_ids = prompt_ids.repeat(num_images, 1)
+        encoder_states = image_embeds.repeat_interleave(len(group), dim=0)
+        encoder_mask = torch.ones(encoder_states.shape[:-1], dtype=torch.long)
+
+        with torch.inference_mode():
+            output = model.text_decoder.generate(
+                input_ids=input_ids,
+                eos_token_id=text_config.sep_token_id,
+                pad_token_id=text_config.pad_token_id,
+                encoder_hidden_states=encoder_states,
+                encoder_attention_mask=encoder_mask,
+                **BLIP_GENERATION_PARAMS
+            )
+
+        texts = processor.batch_decode(output, skip_special_tokens=True)
+        for index, text in enumerate(texts):
+            image_index, prompt_index = divmod(index, len(group))
+            results[image_index][names[prompt_index]] = text.strip()
+
+    return results
+
+
+def format_description(description: Dict[str, str]) -> str:
+    """Texto legible para el agente a partir del caption y las facetas"""
+    lines = [f"Descripción: {description.get('caption', '')}"]
+    for name, text in description.items():
+        if name != "caption":
+            lines.append(f"{name.capitalize()}: {text}")
+    return "\n".join(lines)
+
 
 # Instancia lista para usar en los agentes
-blip_caption_tool = BlipCaptionTool()
\ No newline at end of file
+blip_caption_tool = BlipCaptionTool()
@@ -0,0 +1,406 @@
+"""
+Proceso dedicado de inferencia BLIP.
+
+Mantiene el modelo en un proceso propio, recibe peticiones de caption por un
+socket local y agrupa las que llegan dentro de una ventana corta en un único
+lote de generate. Las peticiones con prompts devuelven también las facetas. Se arranca con:
+
+    CAPTION_WORKER_AUTHKEY=<clave> python -m Tools.caption_worker --port 6011 --window-ms 25 --max-batch 8 --threads 4
+
+La clave autentica ambos extremos (multiprocessing.connection deserializa cada mensaje
+con pickle). ensure_caption_worker() genera una nueva en cada arranque y se la pasa al
+subproceso por su entorno; solo si el worker se arranca a mano hay que definirla. Un puerto
+en el que escucha otro proceso (o un worker de un arranque anterior, con otra clave) no cuenta
+como worker disponible: ensure_caption_worker() avisa y arranca uno nuevo en un puerto libre.
+"""
+
+import os
+import sys
+import time
+import queue
+import socket
+import argparse
+import itertools
+import threading
+import subprocess
+from concurrent.futures import Future
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, deliver_challenge, answer_challenge
+from typing import Dict, List, Optional, Tuple
+
+WORKER_HOST = "127.0.0.1"
+WORKER_PORT = int(os.getenv("CAPTION_WORKER_PORT", "6011"))
+WORKER_WINDOW_MS = float(os.getenv("CAPTION_WORKER_WINDOW_MS", "25"))
+WORKER_MAX_BATCH = int(os.getenv("CAPTION_WORKER_MAX_BATCH", "8"))
+WORKER_THREADS = int(os.getenv("CAPTION_WORKER_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))
+WORKER_TIMEOUT = float(os.getenv("CAPTION_WORKER_TIMEOUT", "120"))
+WORKER_STARTUP_TIMEOUT = float(os.getenv("CAPTION_WORKER_STARTUP_TIMEOUT", "300"))
+WORKER_PROBE_TIMEOUT = float(os.getenv("CAPTION_WORKER_PROBE_TIMEOUT", "5"))
+
+# Estado de un puerto según probe_worker()
+WORKER_ABSENT = "absent"      # nadie escucha
+WORKER_READY = "ready"        # un worker que acepta la clave de este proceso
+WORKER_FOREIGN = "foreign"    # otro proceso, o un worker con otra clave
+
+# Clave compartida con el worker: la de CAPTION_WORKER_AUTHKEY o una aleatoria por arranque
+_authkey: Optional[bytes] = None
+_authkey_lock = threading.Lock()
+
+
+def is_worker_enabled() -> bool:
+    """Indica si los captions deben delegarse al proceso dedicado"""
+    return os.getenv("CAPTION_WORKER_ENABLED", "false").lower() == "true"
+
+
+def worker_authkey() -> bytes:
+    """Clave de autenticación del worker; sin CAPTION_WORKER_AUTHKEY se genera una por proceso"""
+    global _authkey
+    with _authkey_lock:
+        if _authkey is None:
+            configured = os.getenv("CAPTION_WORKER_AUTHKEY")
+            _authkey = configured.encode() if configured else os.urandom(32).hex().encode()
+    return _authkey
+
+
+# ---------------------------------------------------------------------------
+# Servidor (proceso dedicado)
+# ---------------------------------------------------------------------------
+
+class CaptionWorkerServer:
+    """Servidor de captions con micro-batching entre conexiones"""
+
+    def __init__(self, port: int = WORKER_PORT, window_ms: float = WORKER_WINDOW_MS,
+                 max_batch: int = WORKER_MAX_BATCH, num_threads: int = WORKER_THREADS,
+                 authkey: Optional[bytes] = None):
+        self.address = (WORKER_HOST, port)
+        self.authkey = authkey or worker_authkey()
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.num_threads = max(1, num_threads)
+        self._requests: "queue.Queue[Tuple[object, threading.Lock, int, str, Optional[Dict[str, str]]]]" = queue.Queue()
+
+    def serve_forever(self):
+        """Carga el modelo y atiende conexiones hasta que se detenga el proceso"""
+        import torch
+        from Tools.blip_caption_tool import load_blip
+
+        # Fijar los hilos de torch evita que varios lotes compitan por todos los núcleos
+        torch.set_num_threads(self.num_threads)
+        load_blip()
+        self.listen()
+
+    def listen(self):
+        """Atiende conexiones con el modelo ya cargado"""
+        threading.Thread(target=self._batch_loop, name="caption-batcher", daemon=True).start()
+
+        # Sin authkey en el Listener: la autenticación se hace en el hilo de cada conexión,
+        # así un cliente lento o malicioso no bloquea el bucle de accept para el resto
+        with Listener(self.address) as listener:
+            print(f"🛰️ Worker de captions escuchando en {self.address[0]}:{self.address[1]} "
+                  f"(ventana={self.window * 1000:.0f}ms, lote={self.max_batch}, hilos={self.num_threads})")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (EOFError, OSError):
+                    continue
+                threading.Thread(target=self._connection_loop, args=(conn,), daemon=True).start()
+
+    def _connection_loop(self, conn):
+        """Autentica al cliente, lee sus peticiones y las encola para el batcher"""
+        try:
+            deliver_challenge(conn, self.authkey)
+            answer_challenge(conn, self.authkey)
+        except (EOFError, OSError, AuthenticationError):
+            # Clientes sin la clave correcta o que cierran a mitad del handshake
+            conn.close()
+            return
+        except Exception as e:
+            print(f"⚠️ Conexión rechazada: {e}")
+            conn.close()
+            return
+
+        send_lock = threading.Lock()
+        try:
+            while True:
+                request = conn.recv()
+                self._requests.put((conn, send_lock, request['id'], request['image_path'], request.get('prompts')))
+        except (EOFError, OSError):
+            pass
+
+    def _batch_loop(self):
+        """Agrupa las peticiones que llegan dentro de la ventana y las procesa juntas"""
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            for (conn, send_lock, request_id, _, _), response in zip(batch, self._caption(batch)):
+                response['id'] = request_id
+                try:
+                    with send_lock:
+                        conn.send(response)
+                except (EOFError, OSError):
+                    pass
+
+    def _caption(self, batch) -> List[Dict]:
+        """Devuelve una respuesta por petición; aísla los errores de imágenes individuales"""
+        from Tools.blip_caption_tool import blip_caption_tool
+
+        responses: List[Optional[Dict]] = [None] * len(batch)
+        plain = []
+        for index, (_, _, _, image_path, prompts) in enumerate(batch):
+            if prompts:
+                # Caption + facetas: el encoder se comparte entre los prompts de cada imagen
+                responses[index] = self._respond(blip_caption_tool.describe, image_path, prompts)
+            else:
+                plain.append(index)
+
+        paths = [batch[index][3] for index in plain]
+        try:
+            captions = blip_caption_tool.caption_batch(paths, max_batch_size=self.max_batch) if paths else []
+            for index, caption in zip(plain, captions):
+                responses[index] = {'result': caption}
+        except Exception:
+            for index, path in zip(plain, paths):
+                responses[index] = self._respond(lambda image_path: blip_caption_tool.caption_batch([image_path])[0], path)
+        return responses
+
+    @staticmethod
+    def _respond(fn, *args) -> Dict:
+        try:
+            return {'result': fn(*args)}
+        except Exception as e:
+            return {'error': str(e)}
+
+
+# ---------------------------------------------------------------------------
+# Cliente (proceso de Streamlit)
+# ---------------------------------------------------------------------------
+
+class CaptionWorkerClient:
+    """Cliente compartido por todas las sesiones del proceso; devuelve Futures"""
+
+    def __init__(self, port: Optional[int] = None):
+        # Sin puerto explícito se usa el del worker de este proceso (worker_port())
+        self.port = port
+        self._conn = None
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def submit(self, image_path: str, prompts: Optional[Dict[str, str]] = None) -> Future:
+        """
+        Envía una petición y devuelve un Future con el resultado: el caption o,
+        si se pasan prompts, la descripción {"caption": ..., faceta: texto, ...}
+        """
+        future: Future = Future()
+        request_id = next(self._ids)
+        with self._pending_lock:
+            self._pending[request_id] = future
+
+        if self._conn is None:
+            # Si el worker aún está arrancando se espera a él en lugar de cargar BLIP en este proceso
+            wait_for_caption_worker()
+
+        with self._send_lock:
+            try:
+                self._ensure_connection()
+                self._conn.send({'id': request_id, 'image_path': os.path.abspath(image_path), 'prompts': prompts})
+                error = None
+            except Exception as e:
+                self._conn = None
+                error = e
+        if error is not None:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            future.set_exception(error)
+        return future
+
+    def caption(self, image_path: str, timeout: Optional[float] = WORKER_TIMEOUT) -> str:
+        """Versión bloqueante de submit()"""
+        return self.submit(image_path).result(timeout=timeout)
+
+    def describe(self, image_path: str, prompts: Dict[str, str],
+                 timeout: Optional[float] = WORKER_TIMEOUT) -> Dict[str, str]:
+        """Caption y facetas calculados en el worker (bloqueante)"""
+        return self.submit(image_path, prompts).result(timeout=timeout)
+
+    def _ensure_connection(self):
+        if self._conn is None:
+            self._conn = Client((WORKER_HOST, self.port or worker_port()), authkey=worker_authkey())
+            threading.Thread(target=self._receive_loop, args=(self._conn,), daemon=True).start()
+
+    def _receive_loop(self, conn):
+        """Resuelve los Futures a medida que llegan las respuestas del worker"""
+        try:
+            while True:
+                response = conn.recv()
+                with self._pending_lock:
+                    future = self._pending.pop(response['id'], None)
+                if future is None:
+                    continue
+                if 'error' in response:
+                    future.set_exception(RuntimeError(response['error']))
+                else:
+                    future.set_result(response['result'])
+        except (EOFError, OSError) as e:
+            # El worker se cayó: fallar las peticiones pendientes para que el llamador pueda reintentar
+            with self._send_lock:
+                if self._conn is conn:
+                    self._conn = None
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(ConnectionError(f"Worker de captions desconectado: {e}"))
+
+
+_client: Optional[CaptionWorkerClient] = None
+_client_lock = threading.Lock()
+_worker_process: Optional[subprocess.Popen] = None
+_worker_start_lock = threading.Lock()
+_startup_thread: Optional[threading.Thread] = None
+# Puerto del worker de este proceso: el configurado, o uno libre si ese lo ocupa otro proceso
+_worker_port = WORKER_PORT
+
+
+def get_caption_worker_client() -> CaptionWorkerClient:
+    """Cliente único por proceso"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = CaptionWorkerClient()
+    return _client
+
+
+def worker_port() -> int:
+    """Puerto en el que escucha (o arranca) el worker de este proceso"""
+    return _worker_port
+
+
+def probe_worker(port: Optional[int] = None, timeout: float = WORKER_PROBE_TIMEOUT) -> str:
+    """
+    Estado del puerto con el mismo handshake autenticado que usan las peticiones: WORKER_READY,
+    WORKER_ABSENT o WORKER_FOREIGN (escucha algo que no acepta nuestra clave, o que no responde)
+    """
+    address = (WORKER_HOST, port or worker_port())
+    outcome = []
+
+    def handshake():
+        try:
+            Client(address, authkey=worker_authkey()).close()
+            outcome.append(WORKER_READY)
+        except ConnectionRefusedError:
+            outcome.append(WORKER_ABSENT)
+        except Exception:
+            outcome.append(WORKER_FOREIGN)
+
+    # Client no admite timeout: un proceso que acepta la conexión y no contesta no bloquea al llamador
+    thread = threading.Thread(target=handshake, name="caption-worker-probe", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return outcome[0] if outcome else WORKER_FOREIGN
+
+
+def is_worker_running(port: Optional[int] = None) -> bool:
+    """Comprueba si en el puerto hay un worker que acepta la clave de este proceso"""
+    return probe_worker(port) == WORKER_READY
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind((WORKER_HOST, 0))
+        return probe.getsockname()[1]
+
+
+def ensure_caption_worker(port: Optional[int] = None, startup_timeout: float = WORKER_STARTUP_TIMEOUT) -> bool:
+    """Arranca el worker como subproceso si no está en marcha y espera a que acepte conexiones"""
+    global _worker_process, _worker_port
+    port = port or worker_port()
+    status = probe_worker(port)
+    if status == WORKER_READY:
+        _worker_port = port
+        return True
+
+    with _worker_start_lock:
+        if _worker_process is None or _worker_process.poll() is not None:
+            if status == WORKER_FOREIGN:
+                free_port = _free_port()
+                print(f"⚠️ El puerto {port} lo ocupa otro proceso o un worker de captions con otra clave "
+                      f"(p. ej. de un arranque anterior); se arranca el worker en el puerto {free_port}")
+                port = free_port
+            project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            # La clave viaja por el entorno del subproceso, nunca por la línea de comandos
+            env = dict(os.environ, CAPTION_WORKER_AUTHKEY=worker_authkey().decode())
+            _worker_process = subprocess.Popen(
+                [sys.executable, "-m", "Tools.caption_worker", "--port", str(port)],
+                cwd=project_root,
+                env=env
+            )
+            _worker_port = port
+        else:
+            # Ya hay un subproceso de este proceso arrancando: se espera a él en su puerto
+            port = _worker_port
+
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if is_worker_running(port):
+            return True
+        if _worker_process.poll() is not None:
+            # El subproceso terminó (puerto ocupado, error al cargar BLIP...): no tiene sentido seguir esperando
+            return False
+        time.sleep(0.5)
+    return False
+
+
+def start_caption_worker() -> threading.Thread:
+    """Inicia (una sola vez por proceso) el arranque del worker en un hilo de fondo"""
+    global _startup_thread
+    # Streamlit re-ejecuta main.py en cada interacción: solo se vuelve a intentar si el subproceso murió
+    with _worker_start_lock:
+        restart = (_startup_thread is not None and not _startup_thread.is_alive()
+                   and _worker_process is not None and _worker_process.poll() is not None)
+        if _startup_thread is None or restart:
+            _startup_thread = threading.Thread(target=ensure_caption_worker, name="caption-worker-start", daemon=True)
+            _startup_thread.start()
+    return _startup_thread
+
+
+def is_worker_starting() -> bool:
+    """Indica si el arranque del worker sigue en curso"""
+    return _startup_thread is not None and _startup_thread.is_alive()
+
+
+def wait_for_caption_worker(timeout: float = WORKER_STARTUP_TIMEOUT) -> bool:
+    """Espera a que termine el arranque en curso (si lo hay); True si el worker acepta conexiones"""
+    thread = _startup_thread
+    if thread is not None and thread.is_alive():
+        thread.join(timeout)
+    return is_worker_running()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker dedicado de captions BLIP")
+    parser.add_argument("--port", type=int, default=WORKER_PORT)
+    parser.add_argument("--window-ms", type=float, default=WORKER_WINDOW_MS,
+                        help="Tiempo máximo de espera para completar un lote")
+    parser.add_argument("--max-batch", type=int, default=WORKER_MAX_BATCH)
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS,
+                        help="Hilos de torch para la inferencia")
+    args = parser.parse_args()
+
+    if not os.getenv("CAPTION_WORKER_AUTHKEY"):
+        parser.error("CAPTION_WORKER_AUTHKEY no está definida (ensure_caption_worker la genera al arrancar el worker)")
+
+    CaptionWorkerServer(args.port, args.window_ms, args.max_batch, args.threads).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Generación de historias por lotes, sin interfaz
+
+Recorre una carpeta de imágenes y un CSV de especificaciones y ejecuta el
+mismo pipeline que la interfaz de Streamlit con concurrencia configurable.
+Cada historia terminada se anota en un checkpoint (JSONL), así que si el
+proceso se interrumpe basta con volver a lanzarlo para continuar.
+
+CSV (cabecera obligatoria):
+    image,platform,tone,additional_specs
+    playa.jpg,Instagram,Inspiracional,Mencionar el verano
+    ,LinkedIn,Profesional,          <- sin imagen: se aplica a todas las imágenes
+
+Uso:
+    python batch_generate.py fotos/ specs.csv --concurrency 4 --formats JSON Markdown
+    python batch_generate.py fotos/ specs.csv --direct          # modo rápido (BLIP directo)
+    python batch_generate.py fotos/ specs.csv --retry-failed    # reintentar solo los fallidos
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import argparse
+import threading
+import statistics
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp'}
+FILE_EXTENSIONS = {'JSON': 'json', 'Markdown': 'md', 'HTML': 'html', 'PDF': 'pdf'}
+# Nombres de plataforma aceptados en el CSV (sin distinguir mayúsculas) → nombre que usa el pipeline
+PLATFORM_NAMES = {
+    'facebook': 'Facebook',
+    'linkedin': 'LinkedIn',
+    'instagram': 'Instagram',
+    'twitter': 'Twitter/X',
+    'twitter/x': 'Twitter/X',
+    'x': 'Twitter/X',
+}
+
+
+def list_images(folder: str) -> List[str]:
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    )
+
+
+def load_jobs(image_folder: str, csv_path: str) -> List[Dict[str, Any]]:
+    """Combina las filas del CSV con las imágenes (una fila sin imagen se aplica a todas)"""
+    images = list_images(image_folder)
+    jobs = []
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        # La fila 1 es la cabecera
+        for line, row in enumerate(csv.DictReader(f), start=2):
+            row = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+            if not row.get('platform'):
+                continue
+            platform = PLATFORM_NAMES.get(row['platform'].lower())
+            if platform is None:
+                # Sin esto el pipeline caería en silencio en la tarea de Twitter
+                raise ValueError(
+                    f"{csv_path}:{line}: plataforma desconocida '{row['platform']}' "
+                    f"(opciones: {', '.join(sorted(set(PLATFORM_NAMES.values())))})"
+                )
+            user_specs = {
+                'platform': platform,
+                'tone': (row.get('tone') or 'profesional').lower(),
+                'additional_specs': row.get('additional_specs', '')
+            }
+            targets = [os.path.join(image_folder, row['image'])] if row.get('image') else images
+            for image_path in targets:
+                image = os.path.relpath(image_path, image_folder)
+                jobs.append({
+                    'key': job_key(image_path, image, user_specs),
+                    'image': image,
+                    'image_path': image_path,
+                    'user_specs': user_specs
+                })
+    return jobs
+
+
+def file_digest(path: str) -> Optional[str]:
+    """Hash del contenido del archivo (None si no se puede leer; el trabajo fallará al ejecutarse)"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def job_key(image_path: str, image: str, user_specs: Dict[str, Any]) -> str:
+    """
+    Contenido de la imagen + ruta relativa a la carpeta + especificaciones: dos imágenes con el mismo
+    nombre en subcarpetas distintas son trabajos distintos, y la clave no cambia si se mueve la carpeta
+    """
+    payload = json.dumps([file_digest(image_path), image, user_specs], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class Checkpoint:
+    """Registro JSONL de trabajos terminados; una línea por trabajo, escrita al terminar"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # última línea cortada por una interrupción
+                    self.entries[entry['key']] = entry
+
+    def is_done(self, key: str, retry_failed: bool) -> bool:
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        return entry['status'] == 'ok' or not retry_failed
+
+    def record(self, entry: Dict[str, Any]):
+        with self._lock:
+            self.entries[entry['key']] = entry
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def save_outputs(file_manager, story: Dict[str, Any], formats: List[str], key: str) -> List[str]:
+    """Guarda con FileManager usando un nombre único por trabajo (evita colisiones entre hilos)"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    savers = {
+        'JSON': file_manager.save_as_json,
+        'Markdown': file_manager.save_as_markdown,
+        'HTML': file_manager.save_as_html,
+        'PDF': file_manager.save_as_pdf,
+    }
+    return [
+        savers[fmt](story, f"historia_{timestamp}_{key[:8]}.{FILE_EXTENSIONS[fmt]}")
+        for fmt in formats
+    ]
+
+
+def run_job(pipeline, file_manager, job: Dict[str, Any], formats: List[str], direct: bool) -> Dict[str, Any]:
+    start = time.perf_counter()
+    entry = {
+        'key': job['key'],
+        'image': job['image'],
+        'platform': job['user_specs']['platform'],
+        'tone': job['user_specs']['tone'],
+    }
+    try:
+        story = pipeline.execute_story_creation(job['image_path'], job['user_specs'], direct_caption=direct)
+        story['original_filename'] = os.path.basename(job['image_path'])
+        entry['files'] = save_outputs(file_manager, story, formats, job['key'])
+        entry['title'] = story['content'].get('title')
+        token_usage = story.get('token_usage') or {}
+        entry['prompt_tokens'] = token_usage.get('prompt_tokens')
+        entry['completion_tokens'] = token_usage.get('completion_tokens')
+        entry['status'] = 'ok'
+    except Exception as e:
+        entry['status'] = 'failed'
+        entry['error'] = str(e)
+    entry['latency_s'] = round(time.perf_counter() - start, 3)
+    entry['finished_at'] = datetime.now().isoformat()
+    return entry
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(entries: List[Dict[str, Any]], skipped: int, wall_seconds: float) -> Dict[str, Any]:
+    latencies = [entry['latency_s'] for entry in entries if entry['status'] == 'ok']
+    ok = len(latencies)
+    return {
+        'processed': len(entries),
+        'ok': ok,
+        'failed': len(entries) - ok,
+        'skipped': skipped,
+        'wall_seconds': wall_seconds,
+        'stories_per_minute': ok / wall_seconds * 60 if wall_seconds > 0 else 0.0,
+        'latency_p50': statistics.median(latencies) if latencies else None,
+        'latency_p95': percentile(latencies, 0.95) if latencies else None,
+        'latency_max': max(latencies) if latencies else None,
+    }
+
+
+def print_summary(summary: Dict[str, Any]):
+    print("\n📊 Resumen del lote\n")
+    print(f"   ✅ Generadas:  {summary['ok']}")
+    print(f"   ❌ Fallidas:   {summary['failed']}")
+    print(f"   ⏭️  Ya hechas:  {summary['skipped']} (checkpoint)")
+    print(f"   ⏱️  Tiempo:     {summary['wall_seconds']:.1f}s")
+    print(f"   🚀 Throughput: {summary['stories_per_minute']:.1f} historias/min")
+    if summary['latency_p50'] is not None:
+        print(
+            f"   📈 Latencia:   p50 {summary['latency_p50']:.1f}s · p95 {summary['latency_p95']:.1f}s · "
+            f"máx {summary['latency_max']:.1f}s"
+        )
+    if summary.get('metrics_path'):
+        print(f"   📏 Latencia por etapa: {summary['metrics_path']}")
+
+
+def run_batch(image_folder: str, csv_path: str, formats: List[str], concurrency: int, output: str,
+              checkpoint_path: Optional[str] = None, direct: bool = False, retry_failed: bool = False,
+              pipeline=None) -> Dict[str, Any]:
+    from utils.file_manager import FileManager
+    from utils.metrics import metrics
+
+    if pipeline is None:
+        from crew.story_pipeline import StoryPipeline
+        pipeline = StoryPipeline()
+
+    file_manager = FileManager(output)
+    checkpoint = Checkpoint(checkpoint_path or os.path.join(output, 'batch_checkpoint.jsonl'))
+
+    jobs = load_jobs(image_folder, csv_path)
+    pending = [job for job in jobs if not checkpoint.is_done(job['key'], retry_failed)]
+    skipped = len(jobs) - len(pending)
+    print(f"🗂️  {len(jobs)} historias en el lote, {skipped} ya hechas, {len(pending)} pendientes")
+
+    entries = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(run_job, pipeline, file_manager, job, formats, direct) for job in pending]
+        for done, future in enumerate(as_completed(futures), start=1):
+            entry = future.result()
+            checkpoint.record(entry)
+            entries.append(entry)
+            icon = "✅" if entry['status'] == 'ok' else "❌"
+            detail = entry.get('title') or entry.get('error', '')
+            print(f"{icon} [{done}/{len(pending)}] {entry['image']} · {entry['platform']} · {entry['latency_s']:.1f}s · {detail}")
+
+    summary = summarize(entries, skipped, time.perf_counter() - start)
+    summary['metrics_path'] = metrics.write_prometheus(os.path.join(output, 'metrics.prom'))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generación de historias por lotes")
+    parser.add_argument("images", help="Carpeta con las imágenes")
+    parser.add_argument("specs", help="CSV con columnas image, platform, tone, additional_specs")
+    parser.add_argument("--formats", nargs="+", choices=list(FILE_EXTENSIONS), default=["JSON"])
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "2")))
+    parser.add_argument("--output", default="stories", help="Carpeta de salida (FileManager)")
+    parser.add_argument("--checkpoint", help="Ruta del checkpoint (por defecto <output>/batch_checkpoint.jsonl)")
+    parser.add_argument("--direct", action="store_true", help="Modo rápido: BLIP directo sin agente de visión")
+    parser.add_argument("--retry-failed", action="store_true", help="Volver a ejecutar los trabajos fallidos")
+    args = parser.parse_args()
+
+    try:
+        summary = run_batch(
+            args.images, args.specs, args.formats, args.concurrency, args.output,
+            checkpoint_path=args.checkpoint, direct=args.direct, retry_failed=args.retry_failed
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    print_summary(summary)
+    sys.exit(0 if summary['failed'] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark del coste de construcción de agentes y tareas por historia
+
+Compara el flujo anterior (un Agent nuevo en cada llamada, con el agente de
+visión y el de contenido construidos dos veces por historia) frente al pool
+de agentes por proceso, donde solo se instancian las tareas.
+
+Uso:
+    python benchmark_agent_pool.py --stories 50 --platform Instagram
+"""
+
+import sys
+import time
+import argparse
+import statistics
+from typing import Dict, List
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from crew.agents import StoryAgents
+from crew.tasks import StoryTasks
+from crew.agent_pool import AgentPool, borrowing
+
+CONTENT_TASKS = {
+    "Facebook": ("create_facebook_content_task", "facebook_agent"),
+    "LinkedIn": ("create_linkedin_content_task", "linkedin_agent"),
+    "Instagram": ("create_instagram_content_task", "instagram_agent"),
+    "Twitter/X": ("create_twitter_content_task", "twitter_agent"),
+}
+
+
+def build_story_unpooled(agents: StoryAgents, tasks: StoryTasks, platform: str):
+    """Réplica del flujo anterior: cada tarea construye su agente y el crew construye otro"""
+    task_name, agent_name = CONTENT_TASKS[platform]
+    tasks.analyze_image_task("imagen.jpg")
+    agents.vision_agent()
+    getattr(tasks, task_name)("", {"platform": platform, "tone": "Profesional"})
+    getattr(agents, agent_name)()
+
+
+def build_story_pooled(agents: StoryAgents, tasks: StoryTasks, platform: str):
+    """Flujo actual: las tareas toman agentes del pool y se devuelven al terminar"""
+    task_name, _ = CONTENT_TASKS[platform]
+    with borrowing():
+        tasks.analyze_image_task("imagen.jpg")
+        getattr(tasks, task_name)("", {"platform": platform, "tone": "Profesional"})
+
+
+def measure(build, agents: StoryAgents, stories: int, platform: str) -> List[float]:
+    tasks = StoryTasks(agents)
+    latencies = []
+    for _ in range(stories):
+        start = time.perf_counter()
+        build(agents, tasks, platform)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def benchmark(stories: int, platform: str) -> Dict[str, List[float]]:
+    return {
+        "antes": measure(build_story_unpooled, StoryAgents(pool=None), stories, platform),
+        "pool": measure(build_story_pooled, StoryAgents(pool=AgentPool()), stories, platform),
+    }
+
+
+def print_report(results: Dict[str, List[float]]):
+    print("\n📊 Construcción de agentes y tareas por historia\n")
+    print(f"{'Modo':<8} {'primera ms':>11} {'p50 ms':>10} {'media ms':>10}")
+    for mode, latencies in results.items():
+        print(
+            f"{mode:<8} {latencies[0]:>11.2f} {statistics.median(latencies):>10.2f} "
+            f"{statistics.mean(latencies):>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pool de agentes")
+    parser.add_argument("--stories", type=int, default=50)
+    parser.add_argument("--platform", choices=list(CONTENT_TASKS), default="Instagram")
+    args = parser.parse_args()
+
+    print_report(benchmark(args.stories, args.platform))
+
+
+if __name__ == "__main__":
+    main()
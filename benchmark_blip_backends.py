@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los backends de captioning BLIP (fp32 vs int8)
+
+Mide latencia por lote, memoria residente máxima y concordancia de los
+captions de cada backend frente a la ruta fp32. Cada backend se ejecuta en
+un proceso independiente para que el pico de memoria de uno no contamine al otro.
+
+Uso:
+    python benchmark_blip_backends.py imagen1.jpg imagen2.png --runs 5
+    python benchmark_blip_backends.py --tiny      # modelo aleatorio pequeño, sin descargas
+"""
+
+import sys
+import time
+import argparse
+import statistics
+import multiprocessing
+from typing import Dict, List, Any
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+
+def tiny_blip_config():
+    """Configuración BLIP mínima con pesos aleatorios (para pruebas y CI)"""
+    from transformers import BlipConfig
+
+    return BlipConfig(
+        vision_config=dict(
+            hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+            num_attention_heads=2, image_size=64, patch_size=16
+        ),
+        text_config=dict(
+            vocab_size=120, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+            num_attention_heads=2, max_position_embeddings=64,
+            bos_token_id=30, pad_token_id=0, sep_token_id=2, eos_token_id=2
+        )
+    )
+
+
+def peak_rss_mb() -> float:
+    """Memoria residente máxima del proceso actual en MB (None si no está disponible)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo reporta en KB, macOS en bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _load_inputs(image_paths: List[str], tiny: bool):
+    import torch
+
+    if tiny:
+        torch.manual_seed(0)
+        return None, {"pixel_values": torch.rand(max(1, len(image_paths) or 4), 3, 64, 64)}
+
+    from PIL import Image
+    from transformers import BlipProcessor
+    from Tools.blip_caption_tool import BLIP_MODEL_NAME
+
+    processor = BlipProcessor.from_pretrained(BLIP_MODEL_NAME, use_fast=True)
+    images = [Image.open(path).convert("RGB") for path in image_paths]
+    return processor, processor(images=images, return_tensors="pt")
+
+
+def run_backend(backend: str, image_paths: List[str], runs: int, tiny: bool, results):
+    """Ejecuta un backend en el proceso actual y deja las métricas en `results`"""
+    import torch
+    from transformers import BlipForConditionalGeneration
+    from Tools.blip_caption_tool import BLIP_MODEL_NAME, BLIP_GENERATION_PARAMS, prepare_blip_model
+
+    if tiny:
+        torch.manual_seed(0)
+        model = BlipForConditionalGeneration(tiny_blip_config())
+        params = {"max_new_tokens": 8, "num_beams": BLIP_GENERATION_PARAMS["num_beams"]}
+    else:
+        model = BlipForConditionalGeneration.from_pretrained(BLIP_MODEL_NAME)
+        params = BLIP_GENERATION_PARAMS
+
+    model = prepare_blip_model(model, backend)
+    processor, inputs = _load_inputs(image_paths, tiny)
+
+    latencies = []
+    with torch.inference_mode():
+        model.generate(**inputs, **params)  # calentamiento
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = model.generate(**inputs, **params)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    if processor:
+        captions = processor.batch_decode(output, skip_special_tokens=True)
+    else:
+        captions = [" ".join(str(token) for token in row.tolist()) for row in output]
+
+    results[backend] = {
+        "latencies_ms": latencies,
+        "peak_rss_mb": peak_rss_mb(),
+        "captions": captions
+    }
+
+
+def caption_agreement(reference: List[str], candidate: List[str]) -> Dict[str, float]:
+    """Coincidencia exacta y solapamiento medio de palabras (Jaccard) frente a la referencia"""
+    exact = sum(1 for a, b in zip(reference, candidate) if a.strip() == b.strip())
+    overlaps = []
+    for a, b in zip(reference, candidate):
+        words_a, words_b = set(a.lower().split()), set(b.lower().split())
+        union = words_a | words_b
+        overlaps.append(len(words_a & words_b) / len(union) if union else 1.0)
+    return {
+        "exact_match": exact / len(reference) if reference else 0.0,
+        "token_overlap": statistics.mean(overlaps) if overlaps else 0.0
+    }
+
+
+def benchmark(backends: List[str], image_paths: List[str], runs: int, tiny: bool) -> Dict[str, Any]:
+    """Ejecuta cada backend en un proceso separado y compara contra fp32"""
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager()
+    results = manager.dict()
+
+    for backend in backends:
+        process = context.Process(target=run_backend, args=(backend, image_paths, runs, tiny, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"❌ El backend {backend} terminó con código {process.exitcode}")
+
+    results = dict(results)
+    reference = results.get("fp32", {}).get("captions", [])
+    for backend, data in results.items():
+        data["agreement"] = caption_agreement(reference, data["captions"]) if reference else None
+    return results
+
+
+def print_report(results: Dict[str, Any]):
+    print("\n📊 Resultados del benchmark BLIP\n")
+    print(f"{'Backend':<8} {'p50 ms':>10} {'media ms':>10} {'RSS MB':>10} {'exacto':>8} {'solape':>8}")
+    for backend, data in results.items():
+        latencies = data["latencies_ms"]
+        rss = f"{data['peak_rss_mb']:.0f}" if data["peak_rss_mb"] is not None else "n/a"
+        agreement = data.get("agreement") or {}
+        print(
+            f"{backend:<8} {statistics.median(latencies):>10.1f} {statistics.mean(latencies):>10.1f} "
+            f"{rss:>10} {agreement.get('exact_match', 0):>8.0%} {agreement.get('token_overlap', 0):>8.0%}"
+        )
+
+    for backend, data in results.items():
+        print(f"\n{backend}:")
+        for caption in data["captions"]:
+            print(f"   • {caption}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de backends de captioning BLIP")
+    parser.add_argument("images", nargs="*", help="Imágenes a describir")
+    parser.add_argument("--backends", nargs="+", default=["fp32", "int8"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--tiny", action="store_true",
+                        help="Usar un BLIP pequeño con pesos aleatorios (no descarga nada)")
+    args = parser.parse_args()
+
+    if not args.images and not args.tiny:
+        parser.error("Indica al menos una imagen o usa --tiny")
+
+    backends = args.backends if "fp32" in args.backends else ["fp32"] + args.backends
+    print_report(benchmark(backends, args.images, args.runs, args.tiny))
+
+
+if __name__ == "__main__":
+    main()
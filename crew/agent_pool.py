@@ -0,0 +1,118 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+def llm_config_key(llm: Any) -> Tuple:
+    """Clave estable de la configuración de un LLM (modelo, temperatura, endpoint)"""
+    return (
+        type(llm).__name__,
+        getattr(llm, "model", None),
+        getattr(llm, "temperature", None),
+        getattr(llm, "base_url", None),
+        getattr(llm, "stream", None),
+    )
+
+
+class AgentPool:
+    """
+    Pool de agentes por proceso, indexado por rol y configuración del LLM.
+
+    Un agente se presta en exclusiva con `acquire` y vuelve al pool con
+    `release`, así un mismo Agent nunca se ejecuta en dos crews a la vez
+    (sesiones de Streamlit concurrentes o generación multiplataforma).
+    """
+
+    def __init__(self, max_idle_per_key: int = 4):
+        self.max_idle_per_key = max_idle_per_key
+        self._idle: Dict[Hashable, List[Any]] = defaultdict(list)
+        self._checked_out: Dict[int, Tuple[Hashable, Any]] = {}
+        self._lock = threading.Lock()
+        self._created = 0
+        self._reused = 0
+
+    def acquire(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Devuelve un agente libre para `key` o construye uno nuevo con `factory`"""
+        with self._lock:
+            idle = self._idle.get(key)
+            agent = idle.pop() if idle else None
+            if agent is not None:
+                self._reused += 1
+
+        if agent is None:
+            agent = factory()
+            with self._lock:
+                self._created += 1
+
+        with self._lock:
+            self._checked_out[id(agent)] = (key, agent)
+        return agent
+
+    def release(self, *agents: Any):
+        """Devuelve agentes al pool (ignora los que no salieron de él)"""
+        with self._lock:
+            for agent in agents:
+                entry = self._checked_out.pop(id(agent), None)
+                if entry is None:
+                    continue
+                key, _ = entry
+                idle = self._idle[key]
+                if len(idle) < self.max_idle_per_key:
+                    idle.append(agent)
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+            self._checked_out.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "created": self._created,
+                "reused": self._reused,
+                "idle": sum(len(agents) for agents in self._idle.values()),
+                "checked_out": len(self._checked_out),
+            }
+
+
+# Pool compartido por todo el proceso (todas las sesiones de Streamlit)
+agent_pool = AgentPool()
+
+# Agentes prestados en el bloque `borrowing()` en curso: (pool, agente)
+_borrowed: ContextVar[Optional[List[Tuple[AgentPool, Any]]]] = ContextVar("borrowed_agents", default=None)
+
+
+@contextmanager
+def borrowing():
+    """
+    Todo agente que se tome del pool dentro del bloque vuelve a él al salir, también si
+    construir la tarea falla o el trabajo se cancela antes del kickoff. Los bloques anidados
+    comparten el préstamo del más externo.
+    """
+    if _borrowed.get() is not None:
+        yield
+        return
+
+    scope: List[Tuple[AgentPool, Any]] = []
+    token = _borrowed.set(scope)
+    try:
+        yield
+    finally:
+        _borrowed.reset(token)
+        for pool, agent in scope:
+            pool.release(agent)
+
+
+def borrow(pool: AgentPool, key: Hashable, factory: Callable[[], Any]) -> Any:
+    """
+    `acquire` ligado al bloque `borrowing()` en curso. Fuera de un bloque nadie lo devolvería,
+    así que se construye un agente nuevo sin pasar por el pool.
+    """
+    scope = _borrowed.get()
+    if scope is None:
+        return factory()
+    agent = pool.acquire(key, factory)
+    scope.append((pool, agent))
+    return agent
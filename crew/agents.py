@@ -1,15 +1,33 @@
+import functools
 from crewai import Agent
 from Models.gemini import gemini_llm
+from crew.agent_pool import agent_pool, llm_config_key, borrow
 from Tools.blip_caption_tool import blip_caption_tool
 from Tools.SpeechTranscriptionTool import speech_transcription_tool
 from Tools.SaveStoryTool import save_story_tool
 from Tools.PublishInstagramStoryTool import publish_instagram_story_tool
 
 
+def pooled(builder):
+    """
+    Reutiliza agentes del pool del proceso en vez de construir uno nuevo por historia.
+    El préstamo dura hasta el final del bloque `borrowing()` que rodea la construcción.
+    """
+    @functools.wraps(builder)
+    def wrapper(self):
+        if self.pool is None:
+            return builder(self)
+        key = (builder.__name__, llm_config_key(self.llm))
+        return borrow(self.pool, key, lambda: builder(self))
+    return wrapper
+
+
 class StoryAgents:
-    def __init__(self):
-        self.llm = gemini_llm
+    def __init__(self, llm=None, pool=agent_pool):
+        self.llm = llm or gemini_llm
+        self.pool = pool
     
+    @pooled
     def voice_agent(self):
         return Agent(
             role="Voice Transcriptor",
@@ -26,6 +44,7 @@ class StoryAgents:
 
         )
     
+    @pooled
     def user_interaction_agent(self):
         return Agent(
             role="Agente de Interacción con Usuario",
@@ -39,6 +58,7 @@ class StoryAgents:
             llm=self.llm
         )
     
+    @pooled
     def vision_agent(self):
         return Agent(
             role="Agente de Análisis Visual",
@@ -53,6 +73,7 @@ class StoryAgents:
             llm=self.llm
         )
     
+    @pooled
     def facebook_agent(self):
         return Agent(
             role="Especialista en Contenido para Facebook",
@@ -65,6 +86,7 @@ class StoryAgents:
             llm=self.llm
         )
     
+    @pooled
     def linkedin_agent(self):
         return Agent(
             role="Especialista en Contenido para LinkedIn",
@@ -78,6 +100,7 @@ class StoryAgents:
             llm=self.llm
         )
     
+    @pooled
     def instagram_agent(self):
         return Agent(
             role="Especialista en Contenido para Instagram",
@@ -90,6 +113,7 @@ class StoryAgents:
             llm=self.llm
         )
     
+    @pooled
     def twitter_agent(self):
         return Agent(
             role="Especialista en Contenido para Twitter/X",
@@ -102,6 +126,7 @@ class StoryAgents:
             llm=self.llm
         )
     
+    @pooled
     def storage_agent(self):
         return Agent(
             role="Agente de Almacenamiento y Gestión",
@@ -116,6 +141,7 @@ class StoryAgents:
             tools=[save_story_tool]
         )
 
+    @pooled
     def publication_agent(self):
         return Agent(
             role="Agente de Publicaciones en Redes Sociales",
@@ -1,29 +1,51 @@
 import streamlit as st
 import os
 import json
+import time
+import uuid
+from functools import partial
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from crewai import Crew, Process
 from crew.agents import StoryAgents
+from crew.agent_pool import borrowing
 from crew.tasks import StoryTasks
+from crew.story_pipeline import StoryPipeline, PLATFORMS, MAX_CANDIDATES
+from Models.gemini import gemini_llm, gemini_rate_limiter, bypass_llm_cache
 from utils.supabase_client import SupabaseManager
 from utils.file_manager import FileManager
 from utils.config import update_credentials_interface
 from utils.publicar import login_user,post_image, generate_daily_schedule, schedule_and_post
+from Tools.blip_caption_tool import blip_caption_tool, blip_status
+from utils.image_ingest import ingest_image
+from utils.json_salvage import salvage_stats
+from utils.prompt_budget import process_token_ledger, budget_stats
+from utils.metrics import metrics
+from utils.job_runner import job_runner, current_job, COMPLETED, CANCELLED
+from utils.speculative import speculative_runner, temp_copy, write_temp_image
+from utils.section_regen import section_options, section_label, regenerate_section
+from utils.platform_rules import validate_content, enforce_platform_rules
 from typing import Dict, Any, List
 import requests
-from io import BytesIO
-from PIL import Image
 from pathlib import Path
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Cada cuántos segundos se consulta el estado del trabajo de generación en segundo plano
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '1'))
+# Refresco del resumen de latencias en la pestaña "Sistema"
+METRICS_REFRESH_SECONDS = 5
 
 class StoryCrew:
     def __init__(self):
         try:
             self.agents = StoryAgents()
             self.tasks = StoryTasks(self.agents)
+            self.pipeline = StoryPipeline(self.agents, self.tasks)
         except Exception as e:
             st.warning(f"⚠️ Error inicializando agentes: {str(e)}")
             self.agents = None
             self.tasks = None
+            self.pipeline = None
         
         try:
             self.supabase_manager = SupabaseManager()
@@ -33,6 +55,10 @@ class StoryCrew:
         
         self.file_manager = FileManager()
         
+        # Identifica a esta sesión de Streamlit como dueña del trabajo especulativo que lance
+        ctx = get_script_run_ctx()
+        self.session_token = ctx.session_id if ctx else uuid.uuid4().hex
+        
         # Inicializar estado de la sesión
         if 'current_story' not in st.session_state:
             st.session_state.current_story = None
@@ -48,6 +74,19 @@ class StoryCrew:
             st.session_state.story_saved_successfully = False
         if 'user_id' not in st.session_state:
             st.session_state.user_id = "demo_user"  # En producción, esto vendría de autenticación
+        if 'generation_job' not in st.session_state:
+            st.session_state.generation_job = None
+        if 'story_variants' not in st.session_state:
+            st.session_state.story_variants = None
+        if 'speculative_key' not in st.session_state:
+            # Imagen cuyo caption y subida se están adelantando
+            st.session_state.speculative_key = None
+        if 'claimed_upload' not in st.session_state:
+            # Última imagen usada para generar: {'key', 'image_url'} (se reutiliza la URL si se vuelve a generar)
+            st.session_state.claimed_upload = None
+        if 'direct_caption_mode' not in st.session_state:
+            # Modo rápido: BLIP se ejecuta directamente y solo hay una llamada al LLM
+            st.session_state.direct_caption_mode = os.getenv('STORY_PIPELINE_MODE', 'agent').lower() == 'direct'
     
     def run_interface(self):
         """Ejecuta la interfaz principal de Streamlit"""
@@ -62,6 +101,16 @@ class StoryCrew:
                 key="main_mode"
             )
             
+            # Estado de carga del modelo de visión
+            vision_status = {
+                "ready": "✅ Modelo de visión listo",
+                "loading": "⏳ Cargando modelo de visión...",
+                "error": "❌ Error cargando el modelo de visión",
+                "idle": "💤 Modelo de visión sin cargar (se cargará en el primer uso)",
+                "worker": "🛰️ Modelo de visión en proceso dedicado"
+            }
+            st.caption(vision_status[blip_status()])
+            
             # Sección de workflow de agentes
             if st.session_state.crew_workflow:
                 st.divider()
@@ -69,7 +118,7 @@ class StoryCrew:
                 
                 with st.expander("Ver Progreso en Tiempo Real", expanded=True):
                     for step in st.session_state.crew_workflow:
-                        status_icon = "✅" if step['status'] == 'completed' else "🔄" if step['status'] == 'running' else "⏳"
+                        status_icon = {'completed': "✅", 'running': "🔄", 'failed': "❌"}.get(step['status'], "⏳")
                         st.write(f"{status_icon} **{step['agent']}**: {step['task']}")
                         if step.get('result'):
                             st.caption(f"Resultado: {step['result'][:100]}...")
@@ -89,6 +138,9 @@ class StoryCrew:
         if st.session_state.template_story:
             st.info("📋 Editando historia desde plantilla")
             self.edit_template_interface()
+            # La regeneración con IA corre como trabajo en segundo plano, igual que una generación nueva
+            if st.session_state.generation_job:
+                self.generation_job_interface()
             return
         
         # Paso 1: Selección de imagen
@@ -101,13 +153,14 @@ class StoryCrew:
         )
         
         if uploaded_file is not None:
+            # Decodificar una sola vez (variantes de caption, vista previa y publicación)
+            ingested = ingest_image(uploaded_file.getvalue())
+            
             # Mostrar imagen
-            st.image(uploaded_file, caption="Imagen seleccionada")
+            st.image(ingested.preview_bytes(), caption="Imagen seleccionada")
             
-            # Guardar imagen temporalmente
-            temp_image_path = f"temp_{uploaded_file.name}"
-            with open(temp_image_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            # Adelantar caption y subida mientras el usuario configura la historia
+            speculative_key = self.start_speculative_work(ingested.fingerprint, uploaded_file)
             
             # Paso 2: Configuración de la historia
             st.subheader("2️⃣ Configura tu historia")
@@ -117,9 +170,14 @@ class StoryCrew:
             with col1:
                 platform = st.selectbox(
                     "Plataforma de publicación:",
-                    ["Facebook", "LinkedIn", "Instagram", "Twitter/X"],
+                    PLATFORMS,
                     help="Selecciona la red social donde publicarás"
                 )
+                
+                fan_out = st.checkbox(
+                    "🌐 Generar para todas las plataformas",
+                    help="Analiza la imagen una sola vez y crea en paralelo una versión para cada red social"
+                )
             
             with col2:
                 tone_options = [
@@ -152,14 +210,27 @@ class StoryCrew:
                 help="Proporciona detalles específicos sobre lo que quieres incluir en tu historia"
             )
             
-            # Paso 3: Generar historia
-            if st.button("🚀 Generar Historia", type="primary"):
+            st.checkbox(
+                "⚡ Modo rápido (análisis directo con BLIP, sin agente de visión)",
+                key="direct_caption_mode",
+                help="Evita una llamada completa al LLM: el caption de la imagen se pasa directamente al agente de contenido"
+            )
+            
+            candidates = st.select_slider(
+                "🎲 Alternativas por generación:",
+                options=list(range(1, MAX_CANDIDATES + 1)),
+                key="content_candidates",
+                help="Varias versiones del post en una sola respuesta del agente: cuesta casi lo mismo que una y luego eliges la que prefieras"
+            )
+            
+            # Paso 3: Generar historia (en segundo plano para que sobreviva a los reruns)
+            if st.button("🚀 Generar Historia", type="primary", disabled=bool(st.session_state.generation_job)):
                 # Limpiar workflow anterior
                 st.session_state.crew_workflow = []
                 
-                # Crear placeholder para workflow en tiempo real
-                workflow_placeholder = st.empty()
-                
+                # Copia de la imagen propia de este trabajo (otras sesiones o generaciones no la tocan);
+                # el trabajo la borra al terminar
+                job_image_path = None
                 try:
                     # Crear especificaciones del usuario
                     user_specs = {
@@ -167,42 +238,62 @@ class StoryCrew:
                         'tone': tone.lower(),
                         'additional_specs': additional_specs
                     }
+                    if candidates > 1:
+                        user_specs['candidates'] = candidates
+                    
+                    # La generación se queda con el trabajo adelantado (ya no se deshace al cambiar de imagen)
+                    speculation = self.claim_speculative_work(speculative_key)
                     
-                    # Subir imagen a Supabase primero (si está disponible)
-                    image_url = ""
+                    # La subida a Supabase (normalmente ya adelantada) se resuelve dentro del trabajo,
+                    # en paralelo con el crew: la URL solo hace falta al final
+                    job_image_path = write_temp_image(uploaded_file.getvalue(), uploaded_file.name, prefix="job_")
+                    upload = None
                     if self.supabase_manager:
-                        with st.spinner("Subiendo imagen..."):
-                            image_url = self.upload_image_to_supabase(temp_image_path, uploaded_file.name)
+                        upload = self.image_upload_task(speculative_key, speculation, job_image_path, uploaded_file.name)
+                        st.session_state.claimed_upload = {'key': speculative_key, 'image_url': ""}
                     else:
                         st.info("ℹ️ Supabase no configurado - la imagen no se subirá al almacenamiento remoto.")
                     
                     # Verificar que los agentes estén disponibles
                     if not self.agents or not self.tasks:
                         st.error("❌ Los agentes de IA no están configurados. Verifica tu clave de Gemini en Configuración.")
+                        os.remove(job_image_path)
                         return
                     
-                    # Ejecutar el crew con seguimiento en tiempo real
-                    with st.spinner("Analizando imagen y creando contenido..."):
-                        result = self.execute_story_creation(temp_image_path, user_specs, workflow_placeholder)
-                        
-                        if result:
-                            # Agregar URL de imagen al resultado
-                            result['image_url'] = image_url
-                            result['original_filename'] = uploaded_file.name
-                            
-                            st.session_state.current_story = result
-                            st.session_state.story_approved = False
-                            st.session_state.show_storage_options = False
-                            st.success("✅ ¡Historia creada exitosamente!")
-                            st.rerun()
+                    # El trabajo no puede leer st.session_state: se resuelve aquí todo lo que necesita
+                    direct_caption = st.session_state.get('direct_caption_mode', False)
+                    with self.llm_cache_context():
+                        job_id = job_runner.submit(
+                            "Multiplataforma" if fan_out else platform,
+                            self.run_generation_job, job_image_path, user_specs, fan_out, direct_caption, speculation,
+                            upload
+                        )
+                    # Desde aquí el archivo es del trabajo
+                    job_image_path = None
+                    
+                    st.session_state.generation_job = {
+                        'id': job_id,
+                        'fan_out': fan_out,
+                        'upload_key': speculative_key,
+                        'original_filename': uploaded_file.name
+                    }
+                    st.rerun()
                         
                 except Exception as e:
+                    if job_image_path and os.path.exists(job_image_path):
+                        os.remove(job_image_path)
                     st.error(f"❌ Error al crear la historia: {str(e)}")
-                
-                finally:
-                    # Limpiar archivo temporal
-                    if os.path.exists(temp_image_path):
-                        os.remove(temp_image_path)
+        else:
+            # Sin imagen: se abandona lo que se hubiera adelantado para la anterior
+            self.abandon_speculative_work()
+        
+        # Progreso del trabajo de generación en curso
+        if st.session_state.generation_job:
+            self.generation_job_interface()
+        
+        # Mostrar versiones por plataforma si se generaron en paralelo
+        if st.session_state.story_variants and not st.session_state.current_story:
+            self.display_story_variants(st.session_state.story_variants)
         
         # Mostrar historia actual si existe
         if st.session_state.current_story:
@@ -211,72 +302,312 @@ class StoryCrew:
             if st.session_state.story_approved or st.session_state.show_storage_options:
                 self.storage_options_interface(st.session_state.current_story)
     
-    def execute_story_creation(self, image_path: str, user_specs: Dict[str, Any], workflow_placeholder=None) -> Dict[str, Any]:
-        """Ejecuta el proceso de creación de historia usando CrewAI"""
+    def start_speculative_work(self, fingerprint: str, uploaded_file) -> str:
+        """
+        Lanza en segundo plano el caption y la subida de la imagen recién elegida, indexados por
+        el hash del contenido, el usuario (la subida es suya) y la sesión: dos pestañas con la misma
+        imagen no comparten ni se deshacen el trabajo. Es idempotente entre reruns.
+        """
+        user_id = st.session_state.user_id
+        key = f"{fingerprint}:{user_id}:{self.session_token}"
+        
+        if st.session_state.speculative_key != key:
+            self.abandon_speculative_work()
+            st.session_state.speculative_key = key
+        
+        claimed = st.session_state.claimed_upload
+        if claimed and claimed['key'] == key:
+            # Ya se generó con esta imagen: su caption está en caché y su URL se reutiliza
+            return key
+        
+        data, filename = uploaded_file.getvalue(), uploaded_file.name
+        tasks, on_abandon = {}, {}
+        if self.pipeline:
+            direct_caption = st.session_state.get('direct_caption_mode', False)
+            tasks['caption'] = partial(self.speculative_caption, data, filename, direct_caption)
+        if self.supabase_manager:
+            tasks['upload'] = partial(self.speculative_upload, data, filename, user_id)
+            on_abandon['upload'] = lambda result: self.supabase_manager.delete_image(result['path'])
+        
+        speculative_runner.start(key, self.session_token, tasks, on_abandon)
+        return key
+    
+    def abandon_speculative_work(self):
+        """El usuario cambió o quitó la imagen: cancelar y deshacer el trabajo adelantado"""
+        if st.session_state.speculative_key:
+            speculative_runner.release(st.session_state.speculative_key, self.session_token)
+            st.session_state.speculative_key = None
+    
+    def claim_speculative_work(self, key: str):
+        st.session_state.speculative_key = None
+        return speculative_runner.claim(key)
+    
+    def image_upload_task(self, key: str, speculation, image_path: str, filename: str):
+        """
+        Subida que el trabajo ejecuta en paralelo con el crew: la URL de una generación anterior
+        con la misma imagen, la subida adelantada o, si no la hay o falló, una subida nueva.
+        """
+        claimed = st.session_state.claimed_upload
+        if claimed and claimed['key'] == key and claimed['image_url']:
+            image_url = claimed['image_url']
+            return lambda: image_url
+        return partial(self.upload_image_in_background, speculation, image_path, st.session_state.user_id, filename)
+    
+    def upload_image_in_background(self, speculation, image_path: str, user_id: str, filename: str) -> str:
+        """Sube la imagen (o espera la subida adelantada) sin tocar st.session_state"""
+        uploaded = speculation.result('upload') if speculation else None
+        if uploaded:
+            return uploaded['url']
+        result = self.supabase_manager.upload_image(image_path, user_id, filename)
+        if not result['success']:
+            raise RuntimeError(result['error'])
+        return result['url']
+    
+    def speculative_caption(self, data: bytes, filename: str, direct_caption: bool):
+        """
+        Deja en la caché de captions lo que pedirá la generación: caption y facetas en modo rápido,
+        y solo el caption en modo agente (las facetas son la decodificación más cara y allí no se usan).
+        """
+        with temp_copy(data, filename) as path:
+            if direct_caption:
+                self.pipeline.describe_image_directly(path)
+            else:
+                blip_caption_tool.caption_image(path)
+        return True
+    
+    def speculative_upload(self, data: bytes, filename: str, user_id: str):
+        """Sube la imagen sin tocar st.session_state (se ejecuta fuera del hilo de Streamlit)"""
+        with temp_copy(data, filename) as path:
+            result = self.supabase_manager.upload_image(path, user_id, filename)
+        if not result['success']:
+            print(f"⚠️ Subida adelantada fallida: {result['error']}")
+            return None
+        return result
+    
+    def run_generation_job(self, image_path: str, user_specs: Dict[str, Any], fan_out: bool, direct_caption: bool,
+                           speculation=None, upload=None):
+        """Cuerpo del trabajo en segundo plano (sin acceso a st.session_state)"""
+        # La subida de la imagen es independiente del crew hasta que el resultado necesita su image_url
+        upload_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image_upload")
+        upload_future = upload_pool.submit(upload) if upload else None
+        try:
+            if speculation is not None:
+                # Si el caption adelantado sigue en curso, esperarlo evita ejecutar BLIP dos veces
+                speculation.result('caption')
+            if fan_out:
+                result = self.execute_multi_platform_creation(image_path, user_specs, direct_caption=direct_caption)
+            else:
+                result = self.execute_story_creation(image_path, user_specs, direct_caption=direct_caption)
+            
+            image_url, upload_error = self.join_image_upload(upload_future)
+            stories = (result.values() if fan_out else [result]) if result else []
+            for story in stories:
+                story['image_url'] = image_url
+                if upload_error:
+                    story['upload_error'] = upload_error
+            return result
+        finally:
+            # La subida lee el archivo temporal (propio de este trabajo): se espera antes de borrarlo
+            upload_pool.shutdown(wait=True)
+            if os.path.exists(image_path):
+                os.remove(image_path)
+    
+    @staticmethod
+    def join_image_upload(upload_future):
+        """(image_url, error): un fallo en la subida no invalida la historia, solo la deja sin imagen remota"""
+        if upload_future is None:
+            return "", None
+        try:
+            return upload_future.result() or "", None
+        except Exception as e:
+            print(f"⚠️ No se pudo subir la imagen: {e}")
+            return "", str(e)
+    
+    def generation_job_interface(self):
+        """Muestra el trabajo en curso (refresco parcial periódico) o recoge su resultado"""
+        job = job_runner.get(st.session_state.generation_job['id'])
+        if job is None or job.done:
+            self.finish_generation_job(job)
+            return
         
-        # Crear tareas
-        analyze_task = self.tasks.analyze_image_task(image_path)
-        # Determinar qué agente de plataforma usar
-        platform = user_specs['platform'].lower()
-        if platform == 'facebook':
-            content_task = self.tasks.create_facebook_content_task("", user_specs)
-            content_agent = self.agents.facebook_agent()
-        elif platform == 'linkedin':
-            content_task = self.tasks.create_linkedin_content_task("", user_specs)
-            content_agent = self.agents.linkedin_agent()
-        elif platform == 'instagram':
-            content_task = self.tasks.create_instagram_content_task("", user_specs)
-            content_agent = self.agents.instagram_agent()
-        else:  # Twitter/X
-            content_task = self.tasks.create_twitter_content_task("", user_specs)
-            content_agent = self.agents.twitter_agent()
-        
-        # Actualizar workflow
-        self.update_workflow("Agente de Visión", "Analizando imagen", "running", workflow_placeholder)
-        
-        # Crear crew
-        crew = Crew(
-            # self.agents.voice_agent, self.agents.user_interaction_agent(), 
-            agents=[self.agents.vision_agent(), content_agent],
-            tasks=[analyze_task, content_task],
-            process=Process.sequential,
-            verbose=True
+        st.fragment(self.render_generation_job, run_every=JOB_POLL_SECONDS)()
+    
+    def render_stage_latency(self):
+        """Resumen p50/p95/p99 por etapa (BLIP, LLM, Supabase, archivos, publicación)"""
+        stage_latency = metrics.summary()
+        if not stage_latency:
+            return
+        st.markdown("**⏱️ Latencia por etapa:**")
+        st.dataframe(
+            [
+                {
+                    'Etapa': stage,
+                    'Llamadas': values['count'],
+                    'Errores': values['errors'],
+                    'p50 (ms)': round(values['p50'] * 1000),
+                    'p95 (ms)': round(values['p95'] * 1000),
+                    'p99 (ms)': round(values['p99'] * 1000)
+                }
+                for stage, values in stage_latency.items()
+            ],
+            hide_index=True
         )
+        if st.button("📤 Exportar métricas (Prometheus)", key="export_metrics"):
+            st.success(f"✅ Métricas exportadas a `{metrics.write_prometheus()}`")
+
+    def render_generation_job(self):
+        """Fragmento que consulta el estado del trabajo sin bloquear el resto de la interfaz"""
+        job_info = st.session_state.generation_job
+        job = job_runner.get(job_info['id']) if job_info else None
+        if job is None or job.done:
+            st.rerun(scope="app")
+        
+        snapshot = job.snapshot()
+        status_text = "⏳ En cola" if snapshot['status'] == 'queued' else f"🔄 Generando ({snapshot['elapsed']:.0f}s)"
+        if snapshot['cancel_requested']:
+            status_text = "🛑 Cancelando..."
+        
+        st.markdown(f"**{status_text}** — {snapshot['name']}")
+        self.render_workflow_steps(snapshot['progress'], snapshot['draft'])
+        
+        if st.button("⏹️ Cancelar generación", key="cancel_generation_job", disabled=snapshot['cancel_requested']):
+            job_runner.cancel(job.id)
+            st.rerun(scope="fragment")
+    
+    def finish_generation_job(self, job):
+        """Pasa el resultado del trabajo terminado a la sesión"""
+        job_info = st.session_state.generation_job
         
-        # Ejecutar crew con seguimiento
-        self.update_workflow("Agente de Visión", "Analizando imagen", "running", workflow_placeholder)
+        if job is None:
+            st.session_state.generation_job = None
+            st.warning("⚠️ El trabajo de generación ya no está disponible.")
+            return
+        
+        st.session_state.crew_workflow = job.snapshot()['progress']
+        
+        if job.status == COMPLETED and job.result:
+            stories = list(job.result.values()) if job_info['fan_out'] else [job.result]
+            for story in stories:
+                if job_info['original_filename']:
+                    story['original_filename'] = job_info['original_filename']
+            
+            # La URL llega con el resultado; se recuerda para reutilizarla si se vuelve a generar con la misma imagen
+            image_url = stories[0].get('image_url', "") if stories else ""
+            claimed = st.session_state.claimed_upload
+            if claimed and claimed['key'] == job_info['upload_key']:
+                claimed['image_url'] = image_url
+            
+            if job_info.get('template'):
+                # Regeneración desde plantilla: la historia anterior pasa a versiones si existe en Supabase
+                self.create_version_backup(job_info['template'])
+                st.session_state.template_story = None
+            
+            if job_info['fan_out']:
+                st.session_state.story_variants = job.result
+                st.session_state.current_story = None
+            else:
+                st.session_state.current_story = job.result
+            
+            st.session_state.story_approved = False
+            st.session_state.show_storage_options = False
+            st.session_state.generation_job = None
+            job_runner.forget(job.id)
+            st.rerun()
         
-        result = crew.kickoff()
+        if job.status == CANCELLED:
+            st.info("🛑 Generación cancelada.")
+        else:
+            st.error(f"❌ Error al crear la historia: {job.error or 'no se generó contenido'}")
         
-        self.update_workflow("Agente de Visión", "Análisis completado", "completed", workflow_placeholder)
-        self.update_workflow(f"Agente de {user_specs['platform']}", "Creando contenido", "completed", workflow_placeholder)
+        st.session_state.generation_job = None
+        job_runner.forget(job.id)
+    
+    def execute_story_creation(self, image_path: str, user_specs: Dict[str, Any], workflow_placeholder=None,
+                               direct_caption: bool = None, source: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Ejecuta el proceso de creación de historia usando CrewAI"""
+        if direct_caption is None:
+            direct_caption = st.session_state.get('direct_caption_mode', False)
+        
+        return self.pipeline.execute_story_creation(
+            image_path, user_specs, direct_caption=direct_caption,
+            progress=self.workflow_progress(workflow_placeholder),
+            stream_callback=self.stream_preview_callback(workflow_placeholder),
+            source=source
+        )
+    
+    def execute_multi_platform_creation(self, image_path: str, user_specs: Dict[str, Any], platforms: List[str] = None,
+                                        workflow_placeholder=None, max_workers: int = None,
+                                        direct_caption: bool = None) -> Dict[str, Dict[str, Any]]:
+        """Analiza la imagen una vez y genera en paralelo el contenido de cada plataforma"""
+        if direct_caption is None:
+            direct_caption = st.session_state.get('direct_caption_mode', False)
+        
+        return self.pipeline.execute_multi_platform_creation(
+            image_path, user_specs, platforms=platforms, max_workers=max_workers,
+            direct_caption=direct_caption, progress=self.workflow_progress(workflow_placeholder)
+        )
+    
+    def workflow_progress(self, placeholder=None):
+        """Adapta update_workflow al callback de progreso del pipeline"""
+        return lambda agent, task, status: self.update_workflow(agent, task, status, placeholder)
+    
+    def llm_cache_context(self):
+        """Omite la caché de respuestas del LLM en la generación que sigue a «Regenerar Historia»"""
+        if st.session_state.pop('bypass_llm_cache', False):
+            return bypass_llm_cache()
+        return nullcontext()
+    
+    def platform_rules_notice(self, story_data: Dict[str, Any]):
+        """Avisa de lo que incumple las reglas de la plataforma (validación local, sin LLM) y ofrece corregirlo"""
+        platform = story_data.get('platform', '')
+        issues = validate_content(story_data.get('content', {}), platform)
+        if not issues:
+            return
         
-        # Procesar resultado
-        try:
-            # El resultado debería ser un JSON string del último task
-            content_data = json.loads(str(result))
-            
-            return {
-                'content': content_data,
-                'platform': user_specs['platform'],
-                'tone': user_specs['tone'],
-                'image_path': image_path,
-                'created_at': datetime.now().isoformat(),
-                'user_specs': user_specs
-            }
-        except json.JSONDecodeError:
-            # Si no es JSON válido, crear estructura básica
-            return {
-                'content': {
-                    'title': 'Historia Generada',
-                    'full_text': str(result)
-                },
-                'platform': user_specs['platform'],
-                'tone': user_specs['tone'],
-                'image_path': image_path,
-                'created_at': datetime.now().isoformat(),
-                'user_specs': user_specs
-            }
+        st.warning("⚠️ El contenido no cumple las reglas de " + platform + ":\n\n" +
+                   "\n".join(f"- {issue['message']}" for issue in issues))
+        if st.button("🛠️ Ajustar a la plataforma", key="enforce_platform_rules"):
+            with st.spinner("Ajustando contenido..."):
+                content, report = enforce_platform_rules(story_data['content'], platform, llm=gemini_llm)
+            story_data['content'] = content
+            story_data['platform_check'] = report
+            st.rerun()
+    
+    def display_story_candidates(self, story_data: Dict[str, Any]):
+        """Alternativas generadas en la misma llamada: vista previa de cada una y elección"""
+        candidates = story_data['candidates']
+        selected = story_data.get('selected_candidate', 0)
+        st.markdown(f"**🎲 {len(candidates)} alternativas** (generadas en una sola llamada al LLM)")
+        
+        tabs = st.tabs([f"{'✅ ' if i == selected else ''}Alternativa {i + 1}" for i in range(len(candidates))])
+        for i, (tab, candidate) in enumerate(zip(tabs, candidates)):
+            with tab:
+                self.render_story_preview({**story_data, 'content': candidate})
+                if i != selected and st.button("✅ Usar esta alternativa", key=f"use_candidate_{i}"):
+                    story_data['content'] = dict(candidate)
+                    story_data['selected_candidate'] = i
+                    st.rerun()
+    
+    def display_story_variants(self, variants: Dict[str, Dict[str, Any]]):
+        """Muestra las versiones generadas para cada plataforma y permite elegir una"""
+        st.subheader("🌐 Versiones por Plataforma")
+        
+        tabs = st.tabs(list(variants.keys()))
+        for tab, (platform, story) in zip(tabs, variants.items()):
+            with tab:
+                st.markdown(f"**📖 {story.get('content', {}).get('title', 'Historia Generada')}**")
+                self.render_story_preview(story)
+                
+                if st.button("✅ Usar esta versión", key=f"use_variant_{platform}"):
+                    st.session_state.current_story = story
+                    st.session_state.story_variants = None
+                    st.session_state.story_approved = False
+                    st.session_state.show_storage_options = False
+                    st.rerun()
+        
+        if st.button("🗑️ Descartar versiones", key="discard_variants"):
+            st.session_state.story_variants = None
+            st.rerun()
     
     def display_story_result(self, story_data: Dict[str, Any]):
         """Muestra el resultado de la historia creada"""
@@ -304,16 +635,51 @@ class StoryCrew:
                 st.metric("Tono", story_data.get('tone', 'N/A').title())
             with col3:
                 st.metric("Fecha", datetime.fromisoformat(story_data.get('created_at', datetime.now().isoformat())).strftime("%d/%m/%Y"))
+            if story_data.get('upload_error'):
+                st.warning(f"⚠️ No se pudo subir la imagen: {story_data['upload_error']}. La historia se generó sin imagen remota.")
 
+        token_usage = story_data.get('token_usage')
+        if token_usage and token_usage.get('calls'):
+            per_task = " · ".join(
+                f"{task_name}: {usage['prompt_tokens']}+{usage['completion_tokens']}"
+                for task_name, usage in token_usage['tasks'].items()
+            )
+            st.caption(
+                f"🔢 Tokens: {token_usage['prompt_tokens']} de prompt, {token_usage['completion_tokens']} de respuesta ({per_task})"
+            )
+        
+        agent_trace = story_data.get('agent_trace')
+        if agent_trace:
+            with st.expander("⏱️ Tiempos por agente"):
+                st.dataframe(
+                    [
+                        {
+                            'Agente': agent['agent'],
+                            'Duración (s)': agent['duration_s'],
+                            'LLM (s)': agent['llm_seconds'],
+                            'Herramientas (s)': agent['tool_seconds'],
+                            'Llamadas LLM': agent['llm_calls'],
+                            'Tokens': agent['prompt_tokens'] + agent['completion_tokens']
+                        }
+                        for agent in agent_trace
+                    ],
+                    hide_index=True
+                )
         
         # Vista previa visual de la historia
-        st.markdown("**📱 Vista Previa de Publicación:**")
-        self.render_story_preview(story_data)
+        if len(story_data.get('candidates') or []) > 1:
+            self.display_story_candidates(story_data)
+        else:
+            st.markdown("**📱 Vista Previa de Publicación:**")
+            self.render_story_preview(story_data)
+        
+        self.platform_rules_notice(story_data)
         
         # Botones de acción
         col1, col2 = st.columns(2)
         with col1:
             if st.button("✏️ Regenerar Historia", key="regenerate_story"):
+                st.session_state.bypass_llm_cache = True
                 st.session_state.current_story = None
                 st.session_state.story_approved = False
                 st.session_state.show_storage_options = False
@@ -651,6 +1017,14 @@ class StoryCrew:
         
         st.info("📝 Editando historia desde plantilla")
         
+        section_report = st.session_state.pop('section_regen_report', None)
+        if section_report:
+            st.success(
+                f"✅ {section_label(section_report['field'], section_report['index'])} regenerado en "
+                f"{section_report['seconds']:.1f}s ({section_report['prompt_tokens']} tokens de prompt, "
+                f"{section_report['completion_tokens']} de respuesta)"
+            )
+        
         # Botón para cancelar edición
         if st.button("❌ Cancelar Edición"):
             st.session_state.template_story = None
@@ -774,14 +1148,33 @@ class StoryCrew:
                 help="Instrucciones adicionales para la regeneración"
             )
             
+            # Regenerar una sola sección: una llamada corta con el resto del post como contexto fijo
+            sections = section_options(content, template.get('platform', ''))
+            selected_section = st.selectbox(
+                "Sección a regenerar:",
+                sections,
+                format_func=lambda option: section_label(*option),
+                help="Solo se reescribe esta sección; el resto del post se mantiene tal cual"
+            )
+            
             # Botones de acción
-            col1, col2 = st.columns(2)
+            col1, col2, col3 = st.columns(3)
             with col1:
-                regenerate_clicked = st.form_submit_button("🔄 Regenerar con IA", type="primary")
+                regenerate_clicked = st.form_submit_button(
+                    "🔄 Regenerar con IA", type="primary", disabled=bool(st.session_state.generation_job)
+                )
             with col2:
+                regenerate_section_clicked = st.form_submit_button("🎯 Regenerar Sección")
+            with col3:
                 save_manual_clicked = st.form_submit_button("💾 Guardar Edición Manual")
             
-            if regenerate_clicked:
+            if regenerate_section_clicked and selected_section:
+                self.regenerate_template_section(
+                    template, selected_section, new_tone, new_title, new_hook,
+                    new_body, new_cta, new_hashtags_text, new_additional_specs
+                )
+            
+            elif regenerate_clicked:
                 # Regenerar usando IA con el contenido editado
                 self.regenerate_from_template(
                     new_platform, new_tone, new_title, new_hook, 
@@ -795,6 +1188,40 @@ class StoryCrew:
                     new_hook, new_body, new_cta, new_hashtags_text
                 )
     
+    def regenerate_template_section(self, template: Dict[str, Any], section, tone: str, title: str, hook: str,
+                                    body: List[str], cta: str, hashtags: str, additional_specs: str):
+        """Regenera solo la sección elegida sobre el contenido que hay ahora en el formulario"""
+        content = dict(template.get('content', {}))
+        content.update({
+            'title': title,
+            'call_to_action': cta,
+            'hashtags': [tag.strip() for tag in hashtags.split() if tag.strip().startswith('#')]
+        })
+        if 'hook' in content or hook:
+            content['hook'] = hook
+        if 'body' in content or body:
+            content['body'] = body
+        
+        field, index = section
+        with st.spinner(f"Regenerando {section_label(field, index).lower()}..."):
+            try:
+                # El usuario pide explícitamente otra versión: sin caché de respuestas
+                with bypass_llm_cache():
+                    new_content, report = regenerate_section(
+                        gemini_llm, content, template.get('platform', ''), field, index,
+                        tone=tone.lower(), instructions=additional_specs
+                    )
+            except Exception as e:
+                st.error(f"❌ Error al regenerar la sección: {str(e)}")
+                return
+        
+        template['content'] = new_content
+        # Los párrafos tienen clave propia: se descartan para que el formulario muestre el contenido nuevo
+        for key in [key for key in st.session_state if str(key).startswith('paragraph_')] + ['new_paragraph']:
+            st.session_state.pop(key, None)
+        st.session_state.section_regen_report = report
+        st.rerun()
+    
     def regenerate_from_template(self, platform: str, tone: str, title: str, 
                                hook: str, body: List[str], cta: str, 
                                hashtags: str, additional_specs: str):
@@ -816,27 +1243,70 @@ class StoryCrew:
             """
         }
         
-        with st.spinner("Regenerando historia con IA..."):
-            try:
-                # Usar imagen por defecto o la de la plantilla
-                temp_image_path = st.session_state.template_story.get('image_path', 'default_image.jpg')
-                
-                # Ejecutar crew para regenerar
-                result = self.execute_story_creation(temp_image_path, user_specs)
-                
-                if result:
-                    # Mover la historia actual a versiones si existe en Supabase
-                    self.create_version_backup(st.session_state.template_story)
-                    
-                    st.session_state.current_story = result
-                    st.session_state.template_story = None
-                    st.session_state.story_approved = False
-                    st.session_state.show_storage_options = False
-                    st.success("✅ Historia regenerada exitosamente!")
-                    st.rerun()
-                    
-            except Exception as e:
-                st.error(f"❌ Error al regenerar: {str(e)}")
+        template = st.session_state.template_story
+        if st.session_state.generation_job:
+            st.warning("⚠️ Ya hay una generación en curso.")
+            return
+        
+        # El trabajo no puede leer st.session_state: el modo se resuelve aquí
+        direct_caption = {'direct': True, 'agent': False}.get(template.get('pipeline_mode'))
+        if direct_caption is None:
+            direct_caption = st.session_state.get('direct_caption_mode', False)
+        
+        st.session_state.crew_workflow = []
+        try:
+            # Siempre con llamada real al LLM (el contexto se copia al trabajo)
+            with bypass_llm_cache():
+                job_id = job_runner.submit(
+                    f"Regenerar ({platform})",
+                    self.run_regeneration_job, dict(template), user_specs, direct_caption
+                )
+        except Exception as e:
+            st.error(f"❌ Error al regenerar: {str(e)}")
+            return
+        
+        st.session_state.generation_job = {
+            'id': job_id,
+            'fan_out': False,
+            'upload_key': None,
+            'original_filename': template.get('original_filename'),
+            'template': template
+        }
+        st.rerun()
+    
+    def run_regeneration_job(self, template: Dict[str, Any], user_specs: Dict[str, Any], direct_caption: bool):
+        """Cuerpo del trabajo de regeneración desde plantilla (sin acceso a st.session_state)"""
+        # El temporal de la imagen se borró al generar: se reutilizan la huella y la descripción
+        # guardadas en la historia (la descripción sale de la caché de etapas, sin volver a analizar)
+        with self.template_image(template) as image_path:
+            result = self.execute_story_creation(image_path, user_specs, direct_caption=direct_caption, source=template)
+        
+        if result:
+            for key in ('image_url', 'original_filename'):
+                if template.get(key):
+                    result[key] = template[key]
+        return result
+    
+    @contextmanager
+    def template_image(self, template: Dict[str, Any]):
+        """
+        Ruta de la imagen de la plantilla: la original si sigue en disco; si no hay descripción
+        guardada (historias antiguas o de Supabase), una copia descargada de su URL; si no, None.
+        """
+        image_path = template.get('image_path')
+        if image_path and os.path.exists(image_path):
+            yield image_path
+            return
+        
+        image_url = template.get('image_url') or (template.get('images') or [None])[0]
+        if template.get('image_description') or not image_url:
+            yield None
+            return
+        
+        response = requests.get(image_url, timeout=30)
+        response.raise_for_status()
+        with temp_copy(response.content, os.path.basename(image_url.split('?')[0]) or "imagen.jpg") as path:
+            yield path
     
     def save_manual_edit(self, original_story: Dict[str, Any], platform: str, 
                         tone: str, title: str, hook: str, body: List[str], 
@@ -921,8 +1391,62 @@ class StoryCrew:
             st.warning(f"Error subiendo imagen: {str(e)}")
             return ""
     
+    def stream_preview_callback(self, placeholder):
+        """Callback que pinta en el placeholder el borrador del contenido mientras llega del LLM"""
+        job = current_job()
+        if job is not None:
+            # En segundo plano el borrador se guarda en el trabajo y lo pinta el fragmento de sondeo
+            return job.update_draft
+        if not placeholder:
+            return None
+        
+        last_render = [0.0]
+        
+        def on_fields(fields: Dict[str, Any]):
+            # Limitar los repintados de Streamlit a ~10 por segundo
+            now = time.monotonic()
+            if now - last_render[0] < 0.1:
+                return
+            last_render[0] = now
+            self.render_workflow(placeholder, draft=fields)
+        
+        return on_fields
+    
+    def render_workflow(self, placeholder, draft: Dict[str, Any] = None):
+        """Pinta el progreso de los agentes y, si existe, el borrador en streaming"""
+        with placeholder.container():
+            self.render_workflow_steps(st.session_state.crew_workflow, draft)
+    
+    def render_workflow_steps(self, steps: List[Dict[str, Any]], draft: Dict[str, Any] = None):
+        st.markdown("### 🤖 Progreso de Agentes")
+        for step in steps:
+            status_icon = {'completed': "✅", 'running': "🔄", 'failed': "❌"}.get(step['status'], "⏳")
+            st.write(f"{status_icon} **{step['agent']}**: {step['task']} ({step['timestamp']})")
+        
+        if draft:
+            st.markdown("**✍️ Generando contenido...**")
+            if draft.get('title'):
+                st.markdown(f"**📖 {draft['title']}**")
+            if draft.get('hook'):
+                st.markdown(f"*{draft['hook']}*")
+            for paragraph in draft.get('body') or []:
+                st.write(paragraph)
+            if draft.get('main_tweet'):
+                st.write(draft['main_tweet'])
+            for tweet in draft.get('thread') or []:
+                st.write(f"🧵 {tweet}")
+            if draft.get('call_to_action'):
+                st.write(f"👉 {draft['call_to_action']}")
+    
     def update_workflow(self, agent: str, task: str, status: str, placeholder=None):
         """Actualiza el workflow de agentes en tiempo real"""
+        job = current_job()
+        if job is not None:
+            # Dentro de un trabajo en segundo plano: cada paso es también un punto de cancelación
+            job.raise_if_cancelled()
+            job.update_step(agent, task, status)
+            return
+        
         # Buscar si ya existe una entrada para este agente
         existing_index = None
         for i, step in enumerate(st.session_state.crew_workflow):
@@ -944,11 +1468,7 @@ class StoryCrew:
         
         # Actualizar el placeholder si existe
         if placeholder:
-            with placeholder.container():
-                st.markdown("### 🤖 Progreso de Agentes")
-                for step in st.session_state.crew_workflow:
-                    status_icon = "✅" if step['status'] == 'completed' else "🔄" if step['status'] == 'running' else "⏳"
-                    st.write(f"{status_icon} **{step['agent']}**: {step['task']} ({step['timestamp']})")
+            self.render_workflow(placeholder)
     
     def view_archived_stories_interface(self):
         """Interfaz para ver historias archivadas"""
@@ -1134,23 +1654,13 @@ class StoryCrew:
     def publish_agentic(self, story_data: Dict[str, Any]):
         
         
-        publish_task = self.tasks.publish_task(story_data)
-        publication_agent = self.agents.publication_agent()
-        
-        # Actualizar workflow
-        # self.update_workflow("Agente de Publicación", "Publicando...", "running", workflow_placeholder)
-    
-        crew3 = Crew(
-            # self.agents.voice_agent, self.agents.user_interaction_agent(), 
-            agents=[publication_agent],
-            tasks=[publish_task],
-            process=Process.sequential,
-            verbose=True
-        )
-        
-        # self.update_workflow("Agente de Publicación", "Publicando historia", "running", workflow_placeholder)
-        
-        result = crew3.kickoff()
+        with borrowing():
+            publish_task = self.tasks.publish_task(story_data)
+            
+            # Actualizar workflow
+            # self.update_workflow("Agente de Publicación", "Publicando...", "running", workflow_placeholder)
+            
+            result = self.pipeline.run_crew([publish_task])
         
         # self.update_workflow("Agente de Publicación", "Publicación completado", "completed", workflow_placeholder)
         
@@ -1162,9 +1672,7 @@ class StoryCrew:
         cl = login_user()        
         print(cl)
         response = requests.get(story_data.get('image_url'))
-        image = Image.open(BytesIO(response.content))
-        image = image.convert("RGB")
-        new_image= image.resize((1080,1080))
+        new_image = ingest_image(response.content).publish
         new_image.save("temporary.jpg")
         image_path = Path("temporary.jpg")
         caption = story_data.get('content')
@@ -1318,6 +1826,66 @@ class StoryCrew:
             st.markdown("**Información del Sistema:**")
             st.write(f"• Usuario actual: `{st.session_state.user_id}`")
             st.write(f"• Directorio de historias: `{self.file_manager.base_path}`")
+            st.write(f"• Modelo de visión (BLIP): `{blip_status()}`")
+            
+            llm_stats = gemini_llm.cache_stats()
+            if llm_stats:
+                st.write(
+                    f"• Caché del LLM: {llm_stats['entries']} respuestas, "
+                    f"{llm_stats['hit_rate']:.0%} de aciertos ({llm_stats['hits']}/{llm_stats['hits'] + llm_stats['misses']})"
+                )
+            else:
+                st.write("• Caché del LLM: desactivada")
+            
+            limiter_stats = gemini_rate_limiter.stats()
+            st.write(
+                f"• Cola del LLM: {limiter_stats['calls']} llamadas, espera media "
+                f"{limiter_stats['queue_wait_ms_mean']:.0f} ms (p95 {limiter_stats['queue_wait_ms_p95']:.0f} ms), "
+                f"{limiter_stats['in_flight']} en curso, {limiter_stats['throttled']} respuestas 429"
+            )
+            
+            parse_stats = salvage_stats.stats()
+            if parse_stats['total']:
+                st.write(
+                    f"• JSON de contenido: {parse_stats['needed_salvage']}/{parse_stats['total']} respuestas necesitaron rescate, "
+                    f"{parse_stats['salvage_rate']:.0%} rescatadas ({parse_stats['repair_calls']} llamadas de reparación)"
+                )
+            
+            if self.pipeline:
+                for stage, counts in self.pipeline.stages.stats().items():
+                    if counts['hits'] or counts['misses']:
+                        st.write(
+                            f"• Etapa `{stage}`: {counts['hits']} reutilizadas de la caché, {counts['misses']} recalculadas"
+                        )
+
+            speculative_stats = speculative_runner.stats()
+            if speculative_stats['started']:
+                st.write(
+                    f"• Trabajo adelantado al subir imagen: {speculative_stats['claimed']} aprovechados, "
+                    f"{speculative_stats['abandoned']} descartados, {speculative_stats['pending']} pendientes"
+                )
+            
+            token_usage = process_token_ledger.summary()
+            if token_usage['calls']:
+                st.write(
+                    f"• Tokens del LLM: {token_usage['prompt_tokens']} de prompt y "
+                    f"{token_usage['completion_tokens']} de respuesta en {token_usage['calls']} llamadas"
+                )
+                for task_name, usage in sorted(token_usage['tasks'].items(), key=lambda item: -item[1]['prompt_tokens']):
+                    st.caption(
+                        f"{task_name}: {usage['prompt_tokens']} prompt · {usage['completion_tokens']} respuesta · "
+                        f"{usage['calls']} llamadas ({usage['cached_calls']} desde caché)"
+                    )
+            
+            prompt_budget = budget_stats.stats()
+            if prompt_budget['over_budget']:
+                st.write(
+                    f"• Presupuesto de prompt: {prompt_budget['over_budget']}/{prompt_budget['checked']} bloques lo superaron "
+                    f"({prompt_budget['truncated']} recortados)"
+                )
+            
+            # Se refresca sola mientras la pestaña está abierta
+            st.fragment(self.render_stage_latency, run_every=METRICS_REFRESH_SECONDS)()
             
             # Botón para limpiar caché
             if st.button("🧹 Limpiar Caché de Sesión"):
@@ -0,0 +1,311 @@
+import os
+import contextvars
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from crewai import Crew, Process
+from crew.agents import StoryAgents
+from crew.agent_pool import borrowing, llm_config_key
+from crew.tasks import StoryTasks, ANALYZE_IMAGE_TEMPLATE, CONTENT_TASK_TEMPLATES
+from Models.gemini import gemini_llm, llm_cache_bypassed
+from Tools.blip_caption_tool import blip_caption_tool, blip_config_key, format_description
+from utils.llm_stream import stream_task_output
+from utils.json_salvage import salvage_story_content, salvage_candidates
+from utils.platform_rules import enforce_platform_rules
+from utils.prompt_budget import TokenLedger, track_tokens
+from utils.metrics import metrics
+from utils.agent_trace import AgentTrace, trace_agents
+from utils.stage_graph import StageGraph, StageRun, stage_cache, file_fingerprint
+
+PLATFORMS = ["Facebook", "LinkedIn", "Instagram", "Twitter/X"]
+
+# Más alternativas por respuesta alargan la salida y aumentan el riesgo de JSON cortado
+MAX_CANDIDATES = int(os.getenv("MAX_CONTENT_CANDIDATES", "4"))
+
+# progress(agente, tarea, estado) — mismo formato que el workflow de la interfaz
+ProgressCallback = Callable[[str, str, str], None]
+
+# Nombre con el que una etapa reutilizada de la caché aparece en el progreso de agentes
+STAGE_LABELS = {
+    'description': "Análisis de Imagen",
+    'content': "Creación de Contenido"
+}
+
+
+def _no_progress(agent: str, task: str, status: str):
+    pass
+
+
+def content_platform(platform: str) -> str:
+    """Plantilla de tarea de una plataforma de la interfaz (Twitter/X y cualquier otra usan la de Twitter)"""
+    platform = platform.lower()
+    return platform if platform in ('facebook', 'linkedin', 'instagram') else 'twitter'
+
+
+def candidate_count(user_specs: Dict[str, Any]) -> int:
+    """Alternativas pedidas en una sola llamada al agente de contenido (`user_specs['candidates']`)"""
+    return max(1, min(int(user_specs.get('candidates') or 1), MAX_CANDIDATES))
+
+
+class StoryPipeline:
+    """
+    Pipeline de generación de historias sin dependencias de Streamlit.
+    Lo usan la interfaz (StoryCrew) y la generación por lotes (batch_generate.py).
+    """
+
+    def __init__(self, agents: StoryAgents = None, tasks: StoryTasks = None, cache=stage_cache):
+        self.agents = agents or StoryAgents()
+        self.tasks = tasks or StoryTasks(self.agents)
+
+        # imagen → descripción → contenido por plataforma. El decodificado y el caption de BLIP ya se
+        # memoizan por el hash de la imagen (utils.image_ingest y la caché de captions)
+        self.stages = StageGraph(cache)
+        # La descripción depende también de la configuración de BLIP y, en modo agente, de la tarea y el LLM
+        self.stages.add('description', self.description_stage, inputs=['image_path', 'mode'],
+                        key_fn=self.description_stage_key)
+        # version 2: el contenido guardado ya pasó por las reglas de la plataforma. La clave incluye la
+        # plantilla de la tarea y el LLM: editar las instrucciones o cambiar de modelo no sirve contenido viejo
+        self.stages.add('content', self.content_stage, inputs=['description', 'user_specs'], version="2",
+                        key_fn=self.content_stage_key)
+
+    def execute_story_creation(self, image_path: str, user_specs: Dict[str, Any], direct_caption: bool = False,
+                               progress: ProgressCallback = None, stream_callback=None,
+                               source: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Ejecuta el proceso de creación de historia usando CrewAI.
+        El progreso llega de los eventos reales de CrewAI (inicio y fin de tareas, herramientas,
+        llamadas al LLM) y la traza completa se guarda en la historia como `agent_trace`.
+        Cada etapa se reutiliza de la caché si sus entradas no cambiaron; `source` es una historia
+        anterior cuya imagen ya no está en disco (se usan su huella y su descripción).
+        """
+        with track_tokens() as ledger, trace_agents(progress) as trace, metrics.span("story_generation"):
+            pipeline_mode = 'direct' if direct_caption else 'agent'
+            run = self.run_stages('content', self.image_inputs(image_path, source), pipeline_mode, trace,
+                                  user_specs=user_specs, stream_callback=stream_callback)
+            story = self.build_story_result(run, image_path, user_specs, pipeline_mode)
+        story['token_usage'] = ledger.summary()
+        story['agent_trace'] = trace.summary(story['token_usage'])
+        return story
+
+    def image_inputs(self, image_path: Optional[str], source: Optional[Dict[str, Any]] = None):
+        """
+        (valores, huellas) de la imagen para el grafo: la huella es el hash del contenido, no la ruta.
+        Si el archivo ya no existe (el temporal se borra al terminar), una historia anterior aporta
+        su huella y su descripción.
+        """
+        if image_path and os.path.exists(image_path):
+            return {'image_path': image_path}, {'image_path': file_fingerprint(image_path)}
+
+        source = source or {}
+        values, fingerprints = {'image_path': None}, {}
+        if source.get('image_fingerprint'):
+            fingerprints['image_path'] = source['image_fingerprint']
+        if source.get('image_description'):
+            values['description'] = source['image_description']
+        if not fingerprints and 'description' not in values:
+            raise FileNotFoundError("No se encuentra la imagen de la historia ni una descripción guardada de ella")
+        return values, fingerprints
+
+    def run_stages(self, target: str, image_inputs, pipeline_mode: str, trace: AgentTrace, **values) -> StageRun:
+        """Resuelve `target` en el grafo; "Regenerar" (bypass de la caché del LLM) recalcula el contenido"""
+        image_values, fingerprints = image_inputs
+        return self.stages.run(
+            target,
+            {**image_values, **values, 'mode': pipeline_mode, 'trace': trace},
+            fingerprints=fingerprints,
+            refresh=['content'] if llm_cache_bypassed() else [],
+            on_hit=lambda name: self.report_cached_stage(trace, name)
+        )
+
+    @staticmethod
+    def report_cached_stage(trace: AgentTrace, name: str):
+        with trace.stage(STAGE_LABELS.get(name, name), "Reutilizado de la caché"):
+            pass
+
+    def description_stage(self, values: Dict[str, Any]) -> str:
+        """Etapa 'description': caption directo de BLIP o Agente de Visión, según el modo"""
+        image_path = values['image_path']
+        if not image_path:
+            raise FileNotFoundError("La imagen ya no está disponible y su descripción no está en caché")
+        if values['mode'] == 'direct':
+            # Modo rápido: caption en Python y una sola llamada al LLM (agente de plataforma)
+            with values['trace'].stage("Análisis Directo (BLIP)", "Analizando imagen"):
+                return self.describe_image_directly(image_path)
+        return self.analyze_image(image_path)
+
+    def content_stage(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Etapa 'content': agente de la plataforma sobre la descripción ya calculada"""
+        user_specs = values['user_specs']
+        result = self.generate_platform_content(values['description'], user_specs,
+                                                stream_callback=values.get('stream_callback'))
+        # El resultado debería ser un JSON string del último task; si viene con texto extra,
+        # bloques ```json o cortado, se rescata y solo se piden al LLM los campos que falten
+        platform = user_specs['platform']
+        if candidate_count(user_specs) > 1:
+            candidates, parse_report = salvage_candidates(str(result), platform, llm=gemini_llm)
+        else:
+            content_data, parse_report = salvage_story_content(str(result), platform, llm=gemini_llm)
+            candidates = [content_data]
+
+        # Límites de la plataforma: se corrigen localmente y solo lo que no se pueda va al LLM
+        checked = [enforce_platform_rules(candidate, platform, llm=gemini_llm) for candidate in candidates]
+        candidates = [content for content, _ in checked]
+        stage = {'content': candidates[0], 'content_parse': parse_report, 'platform_check': checked[0][1]}
+        if candidate_count(user_specs) > 1:
+            stage['candidates'] = candidates
+        return stage
+
+    def description_stage_key(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Lo que decide la descripción además de la imagen y el modo: BLIP (modelo, backend, facetas)
+        y, si la escribe el Agente de Visión, la plantilla de su tarea y la configuración del LLM
+        """
+        key = {'blip': blip_config_key()}
+        if values['mode'] != 'direct':
+            key['template'] = ANALYZE_IMAGE_TEMPLATE
+            key['llm'] = llm_config_key(self.agents.llm)
+        return key
+
+    def content_stage_key(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Lo que decide la salida del agente de contenido además de sus entradas (descripción y
+        especificaciones): la plantilla de la tarea de la plataforma y la configuración del LLM
+        """
+        return {
+            'template': CONTENT_TASK_TEMPLATES[content_platform(values['user_specs']['platform'])],
+            'llm': llm_config_key(self.agents.llm)
+        }
+
+    def build_story_result(self, run: StageRun, image_path: str, user_specs: Dict[str, Any], pipeline_mode: str,
+                           analysis: Optional[StageRun] = None) -> Dict[str, Any]:
+        """Convierte la salida de las etapas en la estructura de historia"""
+        analysis = analysis or run
+        story = {
+            'content': run['content']['content'],
+            'platform': user_specs['platform'],
+            'tone': user_specs['tone'],
+            'image_path': image_path,
+            'image_fingerprint': analysis.fingerprints.get('image_path'),
+            'image_description': analysis['description'],
+            'created_at': datetime.now().isoformat(),
+            'user_specs': user_specs,
+            'pipeline_mode': pipeline_mode,
+            'content_parse': run['content']['content_parse'],
+            'platform_check': run['content'].get('platform_check'),
+            'stages': {'description': analysis.status.get('description'), 'content': run.status.get('content')}
+        }
+        if run['content'].get('candidates'):
+            # Alternativas de la misma llamada; 'content' es la elegida (la primera por defecto)
+            story['candidates'] = run['content']['candidates']
+            story['selected_candidate'] = 0
+        return story
+
+    def execute_multi_platform_creation(self, image_path: str, user_specs: Dict[str, Any], platforms: List[str] = None,
+                                        max_workers: int = None, direct_caption: bool = False,
+                                        progress: ProgressCallback = None,
+                                        source: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, Any]]:
+        """Analiza la imagen una vez y genera en paralelo el contenido de cada plataforma"""
+        platforms = platforms or PLATFORMS
+        max_workers = max_workers or int(os.getenv('FANOUT_MAX_WORKERS', '4'))
+        progress = progress or _no_progress
+        pipeline_mode = 'direct' if direct_caption else 'agent'
+
+        # El lote completo (análisis + todas las plataformas) cuenta como una generación en las métricas
+        with metrics.span("story_generation"):
+            return self.fan_out(image_path, user_specs, platforms, max_workers, pipeline_mode, progress, source)
+
+    def fan_out(self, image_path: str, user_specs: Dict[str, Any], platforms: List[str], max_workers: int,
+                pipeline_mode: str, progress: ProgressCallback, source: Optional[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        # 1) Análisis de imagen una sola vez (sus tokens y su traza se reparten entre todas las variantes)
+        with track_tokens() as analysis_ledger, trace_agents(progress) as analysis_trace:
+            analysis = self.run_stages('description', self.image_inputs(image_path, source), pipeline_mode, analysis_trace)
+
+        for platform in platforms:
+            progress(f"Agente de {platform}", "Creando contenido", "running")
+
+        # 2) Generación concurrente por plataforma (el progreso se notifica desde este hilo)
+        variants = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(platforms)))) as executor:
+            futures = {
+                # copy_context propaga a los hilos el modo de caché del LLM (bypass) y el trabajo actual
+                executor.submit(contextvars.copy_context().run, self.generate_variant, image_path, analysis,
+                                {**user_specs, 'platform': platform}, pipeline_mode, analysis_ledger, analysis_trace): platform
+                for platform in platforms
+            }
+            for future in as_completed(futures):
+                platform = futures[future]
+                try:
+                    variant = variants[platform] = future.result()
+                    seconds = sum(agent['duration_s'] or 0 for agent in variant['agent_trace'] if agent['agent'] not in analysis_trace.agents)
+                    progress(f"Agente de {platform}", f"Contenido creado en {seconds:.1f}s", "completed")
+                except Exception as e:
+                    progress(f"Agente de {platform}", f"Error: {str(e)}", "failed")
+
+        # Mantener el orden de plataformas solicitado
+        return {platform: variants[platform] for platform in platforms if platform in variants}
+
+    def generate_variant(self, image_path: str, analysis: StageRun, user_specs: Dict[str, Any], pipeline_mode: str,
+                         analysis_ledger: TokenLedger, analysis_trace: AgentTrace) -> Dict[str, Any]:
+        """Contenido de una plataforma del fan-out, con sus propios tokens y traza más los del análisis compartido"""
+        # Sin callback de progreso: este hilo no es el que notifica a la interfaz
+        with track_tokens() as ledger, trace_agents() as trace:
+            # La descripción entra con la huella de su etapa: la caché de contenido es la misma que sin fan-out
+            description = ({'description': analysis['description']}, {'description': analysis.fingerprints['description']})
+            run = self.run_stages('content', description, pipeline_mode, trace, user_specs=user_specs)
+            story = self.build_story_result(run, image_path, user_specs, pipeline_mode, analysis=analysis)
+        ledger.merge(analysis_ledger, prefix="compartido:")
+        trace.merge(analysis_trace)
+        story['token_usage'] = ledger.summary()
+        story['agent_trace'] = trace.summary(story['token_usage'])
+        return story
+
+    def analyze_image(self, image_path: str) -> str:
+        """Ejecuta solo el Agente de Visión y devuelve la descripción de la imagen"""
+        with borrowing():
+            return str(self.run_crew([self.tasks.analyze_image_task(image_path)]))
+
+    def generate_platform_content(self, image_description: str, user_specs: Dict[str, Any], stream_callback=None):
+        """Ejecuta el agente de contenido de una plataforma a partir de una descripción ya calculada"""
+        with borrowing():
+            content_task, _ = self.build_content_task(image_description, user_specs)
+            return self.run_crew([content_task], stream_callback=stream_callback)
+
+    def run_crew(self, tasks: List[Any], stream_callback=None):
+        """
+        Ejecuta un crew secuencial con los agentes de sus tareas. Los agentes vuelven al pool
+        al cerrar el bloque `borrowing()` en el que se construyeron las tareas.
+        Con `stream_callback` recibe los campos del JSON de la última tarea mientras se generan.
+        """
+        agents = []
+        for task in tasks:
+            if not any(agent is task.agent for agent in agents):
+                agents.append(task.agent)
+
+        crew = Crew(
+            agents=agents,
+            tasks=tasks,
+            process=Process.sequential,
+            verbose=True
+        )
+        streaming = stream_task_output(tasks[-1], stream_callback) if stream_callback else nullcontext()
+        with streaming:
+            return crew.kickoff()
+
+    def build_content_task(self, image_description: str, user_specs: Dict[str, Any]):
+        """Devuelve la tarea y el agente de contenido para la plataforma indicada"""
+        platform = content_platform(user_specs['platform'])
+        if platform == 'facebook':
+            content_task = self.tasks.create_facebook_content_task(image_description, user_specs)
+        elif platform == 'linkedin':
+            content_task = self.tasks.create_linkedin_content_task(image_description, user_specs)
+        elif platform == 'instagram':
+            content_task = self.tasks.create_instagram_content_task(image_description, user_specs)
+        else:
+            content_task = self.tasks.create_twitter_content_task(image_description, user_specs)
+        content_task = self.tasks.request_candidates(content_task, candidate_count(user_specs))
+        return content_task, content_task.agent
+
+    def describe_image_directly(self, image_path: str) -> str:
+        """Caption y facetas de BLIP sin pasar por el agente de visión"""
+        return format_description(blip_caption_tool.describe_image(image_path))
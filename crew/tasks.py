@@ -1,30 +1,14 @@
 from crewai import Task
 from typing import Dict, List, Any
+from utils.prompt_budget import (
+    compact_json, compact_story_data, extra_user_specs, fit_to_budget, STORAGE_FIELDS, PUBLISH_FIELDS
+)
 
-class StoryTasks:
-    def __init__(self, agents):
-        self.agents = agents
-    
-    def speech_transcription_task(self, image_path: str) -> Task:
-        return Task(
-            description= (
-                "Captura el audio de la voz del usuario y genera una transcripción del pedido del usuario."
-                "Interpreta correctamente las palabras que pueden ser principalmente en español con algunas palabras en inglés."
-                "Corrige ruidos o errores del lenguaje para que el texto transcripto sea correcto desde el punto de vista semántico y sintáctico."        
-                "Extrae e identifica: 1) ruta/nombre del archivo de imagen requerido, 2) Tono deseado para la publicación, 3) Red social de destino."
-                "Si no puedes identificar estos tres campos, vuelve a iniciar la interacción con el usuario."
-                "No inventes nuevo texto, sólo entrega una transcripción clara y estructurada."
-        
-            ),
-            expected_output=(
-                "Un texto con la transcripción de lo dicho por el usuario, estructurada con las siguientes claves: image_name, tone, social_network, full_transcription."
-            ),
-            agent=self.agents.voice_agent()
-        )
-
-    def analyze_image_task(self, image_path: str) -> Task:
-        return Task(
-            description=f"""
+# Plantillas de las tareas de análisis y de contenido. Las instrucciones fijas de cada plataforma
+# forman el prefijo y los datos variables van en {context}; también entran en la clave de caché
+# de las etapas de la generación (crew/story_pipeline.py), sin construir la tarea ni pedir un agente
+ANALYZE_IMAGE_TEMPLATE = {
+    'description': """
             Analiza la imagen ubicada en: {image_path}
             
             Tu trabajo es:
@@ -38,19 +22,13 @@ class StoryTasks:
             
             Proporciona una descripción rica y detallada que sirva como base para crear contenido compelling.
             """,
-            agent=self.agents.vision_agent(),
-            expected_output="Una descripción detallada y rica de la imagen que incluya elementos visuales, emociones, contexto y posibles interpretaciones para crear contenido."
-        )
-    
-    def create_facebook_content_task(self, image_description: str, user_specs: Dict[str, Any]) -> Task:
-        return Task(
-            description=f"""
-            Crea contenido optimizado para Facebook basado en:
-            
-            Descripción de la imagen: {image_description}
-            Especificaciones del usuario: {user_specs}
-            Tono deseado: {user_specs.get('tone', 'profesional')}
-            Especificaciones adicionales: {user_specs.get('additional_specs', 'Ninguna')}
+    'expected_output': "Una descripción detallada y rica de la imagen que incluya elementos visuales, emociones, contexto y posibles interpretaciones para crear contenido."
+}
+
+CONTENT_TASK_TEMPLATES = {
+    'facebook': {
+        'description': """
+            Crea contenido optimizado para Facebook a partir de la imagen y las especificaciones indicadas al final.
             
             Crea un post de Facebook que incluya:
             1. Un hook atractivo que capture la atención en los primeros segundos
@@ -60,9 +38,10 @@ class StoryTasks:
             5. El texto completo optimizado para Facebook
             
             El contenido debe ser engaging, apropiado para el tono especificado, y diseñado para generar interacción.
+            
+            {context}
             """,
-            agent=self.agents.facebook_agent(),
-            expected_output="""Un objeto JSON con la estructura:
+        'expected_output': """Un objeto JSON con la estructura:
             {
                 "title": "Título del post",
                 "hook": "Gancho inicial atractivo",
@@ -70,17 +49,10 @@ class StoryTasks:
                 "call_to_action": "Llamada a la acción específica",
                 "full_text": "Texto completo del post optimizado para Facebook"
             }"""
-        )
-    
-    def create_linkedin_content_task(self, image_description: str, user_specs: Dict[str, Any]) -> Task:
-        return Task(
-            description=f"""
-            Crea contenido profesional optimizado para LinkedIn basado en:
-            
-            Descripción de la imagen: {image_description}
-            Especificaciones del usuario: {user_specs}
-            Tono deseado: {user_specs.get('tone', 'profesional')}
-            Especificaciones adicionales: {user_specs.get('additional_specs', 'Ninguna')}
+    },
+    'linkedin': {
+        'description': """
+            Crea contenido profesional optimizado para LinkedIn a partir de la imagen y las especificaciones indicadas al final.
             
             Crea un post de LinkedIn que incluya:
             1. Un hook profesional que genere curiosidad
@@ -91,9 +63,10 @@ class StoryTasks:
             6. Tono profesional pero accesible
             
             El contenido debe posicionar al autor como experto y generar conversación profesional.
+            
+            {context}
             """,
-            agent=self.agents.linkedin_agent(),
-            expected_output="""Un objeto JSON con la estructura:
+        'expected_output': """Un objeto JSON con la estructura:
             {
                 "title": "Título del post",
                 "hook": "Gancho profesional inicial",
@@ -102,17 +75,10 @@ class StoryTasks:
                 "hashtags": ["#hashtag1", "#hashtag2", "#hashtag3"],
                 "full_text": "Texto completo del post optimizado para LinkedIn"
             }"""
-        )
-    
-    def create_instagram_content_task(self, image_description: str, user_specs: Dict[str, Any]) -> Task:
-        return Task(
-            description=f"""
-            Crea contenido visual optimizado para Instagram basado en:
-            
-            Descripción de la imagen: {image_description}
-            Especificaciones del usuario: {user_specs}
-            Tono deseado: {user_specs.get('tone', 'profesional')}
-            Especificaciones adicionales: {user_specs.get('additional_specs', 'Ninguna')}
+    },
+    'instagram': {
+        'description': """
+            Crea contenido visual optimizado para Instagram a partir de la imagen y las especificaciones indicadas al final.
             
             Crea un post de Instagram que incluya:
             1. Un caption que complemente perfectamente la imagen
@@ -123,9 +89,10 @@ class StoryTasks:
             6. Llamada a la acción que fomente engagement
             
             El contenido debe ser visualmente atractivo y optimizado para el algoritmo de Instagram.
+            
+            {context}
             """,
-            agent=self.agents.instagram_agent(),
-            expected_output="""Un objeto JSON con la estructura:
+        'expected_output': """Un objeto JSON con la estructura:
             {
                 "title": "Título del post",
                 "hook": "Gancho visual inicial",
@@ -134,17 +101,10 @@ class StoryTasks:
                 "hashtags": ["#hashtag1", "#hashtag2", "#hashtag3"],
                 "full_text": "Caption completo optimizado para Instagram"
             }"""
-        )
-    
-    def create_twitter_content_task(self, image_description: str, user_specs: Dict[str, Any]) -> Task:
-        return Task(
-            description=f"""
-            Crea contenido conciso optimizado para Twitter/X basado en:
-            
-            Descripción de la imagen: {image_description}
-            Especificaciones del usuario: {user_specs}
-            Tono deseado: {user_specs.get('tone', 'profesional')}
-            Especificaciones adicionales: {user_specs.get('additional_specs', 'Ninguna')}
+    },
+    'twitter': {
+        'description': """
+            Crea contenido conciso optimizado para Twitter/X a partir de la imagen y las especificaciones indicadas al final.
             
             Crea contenido para Twitter que incluya:
             1. Un tweet principal impactante y conciso
@@ -154,9 +114,10 @@ class StoryTasks:
             5. Tono apropiado para la cultura de Twitter
             
             El contenido debe ser punchy, generar conversación y estar optimizado para retweets.
+            
+            {context}
             """,
-            agent=self.agents.twitter_agent(),
-            expected_output="""Un objeto JSON con la estructura:
+        'expected_output': """Un objeto JSON con la estructura:
             {
                 "title": "Título del contenido",
                 "main_tweet": "Tweet principal",
@@ -165,15 +126,101 @@ class StoryTasks:
                 "call_to_action": "Llamada a la acción",
                 "full_text": "Contenido completo para Twitter"
             }"""
+    }
+}
+
+
+class StoryTasks:
+    def __init__(self, agents):
+        self.agents = agents
+
+    def content_context(self, image_description: str, user_specs: Dict[str, Any]) -> str:
+        """
+        Datos variables de las tareas de contenido. Van al final de la descripción para que
+        las instrucciones de cada plataforma formen un prefijo idéntico entre historias.
+        """
+        lines = [
+            f"Tono deseado: {user_specs.get('tone', 'profesional')}",
+            f"Especificaciones adicionales: {user_specs.get('additional_specs') or 'Ninguna'}"
+        ]
+        extra = extra_user_specs(user_specs)
+        if extra:
+            lines.append(f"Otras especificaciones: {extra}")
+        if image_description:
+            lines.append(f"Descripción de la imagen: {fit_to_budget(image_description, 'descripción de la imagen')}")
+        return "\n            ".join(lines)
+    
+    def content_task(self, platform: str, image_description: str, user_specs: Dict[str, Any], agent) -> Task:
+        """Tarea de contenido de una plataforma ('facebook', 'linkedin', 'instagram' o 'twitter') a partir de su plantilla"""
+        template = CONTENT_TASK_TEMPLATES[platform]
+        return Task(
+            name=f"{platform}_content",
+            description=template['description'].format(context=self.content_context(image_description, user_specs)),
+            agent=agent,
+            expected_output=template['expected_output']
+        )
+    
+    def request_candidates(self, task: Task, count: int) -> Task:
+        """Pide `count` alternativas del mismo post en una sola respuesta (una llamada al LLM para todas)"""
+        if count <= 1:
+            return task
+        # La instrucción va al final: el prefijo con las instrucciones de la plataforma no cambia
+        task.description += f"""
+            Genera {count} alternativas claramente distintas entre sí (gancho, enfoque y estructura) con las mismas especificaciones.
+            """
+        structure = task.expected_output.split("estructura:", 1)[-1]
+        task.expected_output = (
+            f'Un objeto JSON {{"candidates": [...]}} con {count} alternativas, cada una con la estructura:{structure}'
         )
+        return task
+    
+    def speech_transcription_task(self, image_path: str, agent=None) -> Task:
+        return Task(
+            name="speech_transcription",
+            description= (
+                "Captura el audio de la voz del usuario y genera una transcripción del pedido del usuario."
+                "Interpreta correctamente las palabras que pueden ser principalmente en español con algunas palabras en inglés."
+                "Corrige ruidos o errores del lenguaje para que el texto transcripto sea correcto desde el punto de vista semántico y sintáctico."        
+                "Extrae e identifica: 1) ruta/nombre del archivo de imagen requerido, 2) Tono deseado para la publicación, 3) Red social de destino."
+                "Si no puedes identificar estos tres campos, vuelve a iniciar la interacción con el usuario."
+                "No inventes nuevo texto, sólo entrega una transcripción clara y estructurada."
+        
+            ),
+            expected_output=(
+                "Un texto con la transcripción de lo dicho por el usuario, estructurada con las siguientes claves: image_name, tone, social_network, full_transcription."
+            ),
+            agent=agent or self.agents.voice_agent()
+        )
+
+    def analyze_image_task(self, image_path: str, agent=None) -> Task:
+        return Task(
+            name="analyze_image",
+            description=ANALYZE_IMAGE_TEMPLATE['description'].format(image_path=image_path),
+            agent=agent or self.agents.vision_agent(),
+            expected_output=ANALYZE_IMAGE_TEMPLATE['expected_output']
+        )
+    
+    def create_facebook_content_task(self, image_description: str, user_specs: Dict[str, Any], agent=None) -> Task:
+        return self.content_task('facebook', image_description, user_specs, agent or self.agents.facebook_agent())
+    
+    def create_linkedin_content_task(self, image_description: str, user_specs: Dict[str, Any], agent=None) -> Task:
+        return self.content_task('linkedin', image_description, user_specs, agent or self.agents.linkedin_agent())
+    
+    def create_instagram_content_task(self, image_description: str, user_specs: Dict[str, Any], agent=None) -> Task:
+        return self.content_task('instagram', image_description, user_specs, agent or self.agents.instagram_agent())
+    
+    def create_twitter_content_task(self, image_description: str, user_specs: Dict[str, Any], agent=None) -> Task:
+        return self.content_task('twitter', image_description, user_specs, agent or self.agents.twitter_agent())
     
     def storage_task(self, story_data: Dict[str, Any], local_formats: List[str], 
-                   save_to_supabase: bool, update_existing: bool = False) -> Task:
+                   save_to_supabase: bool, update_existing: bool = False, agent=None) -> Task:
+        story_json = fit_to_budget(compact_json(compact_story_data(story_data, STORAGE_FIELDS)), 'historia a almacenar')
         return Task(
+            name="storage",
             description=f"""
             Gestiona el almacenamiento del contenido creado según las opciones especificadas:
             
-            Contenido a almacenar: {story_data}
+            Contenido a almacenar: {story_json}
             Formatos de almacenamiento Locales seleccionados: {local_formats}
             Guardar o no en supabase: {save_to_supabase} 
             Actualizar historia existente: {update_existing}
@@ -188,7 +235,7 @@ class StoryTasks:
             
             Mantén la integridad de los datos y asegúrate de que el contenido esté correctamente estructurado.
             """,
-            agent=self.agents.storage_agent(),
+            agent=agent or self.agents.storage_agent(),
             expected_output="""Un objeto JSON con la estructura:
             {
                 "success": True,
@@ -197,10 +244,12 @@ class StoryTasks:
             
         )   
 
-    def publish_task(self, story_data: Dict[str, Any]) -> Task:
+    def publish_task(self, story_data: Dict[str, Any], agent=None) -> Task:
+        story_json = fit_to_budget(compact_json(compact_story_data(story_data, PUBLISH_FIELDS)), 'historia a publicar')
         return Task(
+            name="publish",
             description=f"""
-            Gestiona la publicación de la historia seleccionada almacenada en el Json {story_data}:
+            Gestiona la publicación de la historia seleccionada almacenada en el Json {story_json}:
             
             Ruta de la imagen a publicar: en el campo 'image_url' del Json
             Texto a publicar: en el campo 'content' del json
@@ -212,7 +261,7 @@ class StoryTasks:
             3. Proporcionar confirmación de que la publicación fue exitosa.
             
             """,
-            agent=self.agents.publication_agent(),
+            agent=agent or self.agents.publication_agent(),
             expected_output="""Un texto con el resultado de la publicación."""
             
         )      
@@ -3,6 +3,9 @@ import os
 from dotenv import load_dotenv
 from crew.story_crew import StoryCrew
 from utils.config import check_environment_variables
+from Tools.blip_caption_tool import start_blip_warmup
+from Tools.caption_worker import is_worker_enabled, start_caption_worker
+from utils.metrics import start_metrics_server
 import agentops
 
 # Cargar variables de entorno
@@ -12,6 +15,16 @@ os.getenv('GEMINI_API_KEY')
 
 agentops_key = os.getenv('AGENTOPS_API_KEY')
 
+# Precargar BLIP en segundo plano para que la primera página no espere al modelo
+if is_worker_enabled():
+    # El modelo vive en un proceso dedicado compartido por todas las sesiones
+    start_caption_worker()
+elif os.getenv('BLIP_WARMUP', 'true').lower() == 'true':
+    start_blip_warmup()
+
+# Endpoint /metrics (formato Prometheus) si METRICS_PORT está definido
+start_metrics_server()
+
 # agentops.init(
 #     api_key= agentops_key,
 #     tags=['crewai']
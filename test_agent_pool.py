@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the per-process agent pool
+"""
+
+import sys
+import threading
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from crew.agent_pool import AgentPool, llm_config_key, borrowing, borrow
+
+
+class FakeAgent:
+    def __init__(self, role):
+        self.role = role
+
+
+class FakeLLM:
+    def __init__(self, model, temperature):
+        self.model = model
+        self.temperature = temperature
+
+
+def test_agents_are_reused_after_release():
+    """Test that a released agent is handed out again instead of rebuilt"""
+    print("🧪 Testing agent reuse...")
+
+    pool = AgentPool()
+    first = pool.acquire("vision", lambda: FakeAgent("vision"))
+    pool.release(first)
+    second = pool.acquire("vision", lambda: FakeAgent("vision"))
+
+    assert first is second
+    assert pool.stats()["created"] == 1
+    assert pool.stats()["reused"] == 1
+
+    print("✅ Agents are reused")
+    return True
+
+
+def test_checked_out_agents_are_exclusive():
+    """Test that concurrent callers never share the same agent"""
+    print("🧪 Testing exclusive checkout...")
+
+    pool = AgentPool()
+    acquired = []
+    lock = threading.Lock()
+
+    def worker():
+        agent = pool.acquire("facebook", lambda: FakeAgent("facebook"))
+        with lock:
+            acquired.append(agent)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(agent) for agent in acquired}) == 4
+    pool.release(*acquired)
+    assert pool.stats()["idle"] == 4
+
+    print("✅ Checkout is exclusive")
+    return True
+
+
+def test_llm_config_is_part_of_the_key():
+    """Test that agents with different LLM settings are pooled separately"""
+    print("🧪 Testing LLM config keys...")
+
+    pool = AgentPool()
+    cold = ("vision", llm_config_key(FakeLLM("gemini-2.5-flash", 0.0)))
+    warm = ("vision", llm_config_key(FakeLLM("gemini-2.5-flash", 0.7)))
+
+    agent = pool.acquire(cold, lambda: FakeAgent("vision"))
+    pool.release(agent)
+    assert pool.acquire(warm, lambda: FakeAgent("vision")) is not agent
+    assert pool.acquire(cold, lambda: FakeAgent("vision")) is agent
+
+    print("✅ LLM config separates pools")
+    return True
+
+
+def test_borrowed_agents_return_on_failure():
+    """Test that agents go back to the pool when building the task fails before the crew runs"""
+    print("🧪 Testing release on failure...")
+
+    pool = AgentPool()
+    for _ in range(3):
+        try:
+            with borrowing():
+                borrow(pool, "vision", lambda: FakeAgent("vision"))
+                with borrowing():
+                    borrow(pool, "instagram", lambda: FakeAgent("instagram"))
+                # Los bloques anidados no devuelven nada antes de tiempo
+                assert pool.stats()["checked_out"] == 2
+                raise RuntimeError("fallo construyendo la tarea")
+        except RuntimeError:
+            pass
+
+    stats = pool.stats()
+    assert stats["checked_out"] == 0 and stats["idle"] == 2
+    assert stats["created"] == 2 and stats["reused"] == 4
+
+    # Fuera de un bloque no se presta nada que nadie vaya a devolver
+    borrow(pool, "vision", lambda: FakeAgent("vision"))
+    assert pool.stats()["checked_out"] == 0 and pool.stats()["created"] == 2
+
+    print("✅ Agents are released at the build site")
+    return True
+
+
+def main():
+    """Run all agent pool tests"""
+    print("🧪 Running agent pool tests...\n")
+
+    tests = [
+        test_agents_are_reused_after_release,
+        test_checked_out_agents_are_exclusive,
+        test_llm_config_is_part_of_the_key,
+        test_borrowed_agents_return_on_failure
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
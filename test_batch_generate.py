@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the headless batch generation CLI
+"""
+
+import os
+import sys
+import json
+import tempfile
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from PIL import Image
+from batch_generate import load_jobs, run_batch
+
+
+class FakePipeline:
+    """Sustituye al pipeline de CrewAI: devuelve una historia fija y puede fallar a propósito"""
+
+    def __init__(self, fail_platforms=()):
+        self.fail_platforms = set(fail_platforms)
+        self.calls = []
+
+    def execute_story_creation(self, image_path, user_specs, direct_caption=False):
+        self.calls.append((os.path.basename(image_path), user_specs['platform']))
+        if user_specs['platform'] in self.fail_platforms:
+            raise RuntimeError("cuota agotada")
+        return {
+            'content': {'title': f"Historia {user_specs['platform']}", 'full_text': 'Texto'},
+            'platform': user_specs['platform'],
+            'tone': user_specs['tone'],
+            'user_specs': user_specs
+        }
+
+
+def _fixture(tmp):
+    images = os.path.join(tmp, "fotos")
+    os.makedirs(images)
+    for name in ("a.jpg", "b.png"):
+        Image.new("RGB", (32, 32)).save(os.path.join(images, name))
+    specs = os.path.join(tmp, "specs.csv")
+    with open(specs, "w", encoding="utf-8") as f:
+        f.write("image,platform,tone,additional_specs\n")
+        f.write(",Instagram,Divertido,\n")
+        f.write("a.jpg,LinkedIn,Profesional,Mencionar el equipo\n")
+    return images, specs
+
+
+def test_rows_without_image_apply_to_every_image():
+    """Test CSV expansion into jobs"""
+    print("🧪 Testing job expansion...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        images, specs = _fixture(tmp)
+        jobs = load_jobs(images, specs)
+
+    combos = sorted((os.path.basename(job['image_path']), job['user_specs']['platform']) for job in jobs)
+    assert combos == [("a.jpg", "Instagram"), ("a.jpg", "LinkedIn"), ("b.png", "Instagram")]
+    assert len({job['key'] for job in jobs}) == 3
+
+    print("✅ Jobs expanded correctly")
+    return True
+
+
+def test_checkpoint_resumes_and_retries_failed():
+    """Test that a second run skips finished jobs and can retry failures"""
+    print("🧪 Testing checkpoint resume...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        images, specs = _fixture(tmp)
+        output = os.path.join(tmp, "stories")
+
+        first = run_batch(images, specs, ["JSON"], 2, output, pipeline=FakePipeline(fail_platforms={"LinkedIn"}))
+        assert first['ok'] == 2 and first['failed'] == 1
+        assert len([name for name in os.listdir(output) if name.endswith('.json')]) == 2
+
+        resumed = FakePipeline()
+        second = run_batch(images, specs, ["JSON"], 2, output, pipeline=resumed)
+        assert second['skipped'] == 3 and resumed.calls == []
+
+        retried = FakePipeline()
+        third = run_batch(images, specs, ["JSON"], 2, output, retry_failed=True, pipeline=retried)
+        assert retried.calls == [("a.jpg", "LinkedIn")]
+        assert third['ok'] == 1 and third['latency_p50'] is not None
+
+        with open(os.path.join(output, "batch_checkpoint.jsonl"), encoding="utf-8") as f:
+            statuses = [json.loads(line)['status'] for line in f]
+        assert statuses.count('ok') == 3
+
+    print("✅ Checkpoint resume works")
+    return True
+
+
+def test_same_name_in_other_folder_and_unknown_platform():
+    """Test that equal file names in different folders are different jobs and bad platforms are rejected"""
+    print("🧪 Testing job keys and platform validation...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        images = os.path.join(tmp, "fotos")
+        for folder, color in (("enero", (255, 0, 0)), ("febrero", (0, 0, 255))):
+            os.makedirs(os.path.join(images, folder))
+            Image.new("RGB", (32, 32), color).save(os.path.join(images, folder, "IMG_0001.jpg"))
+        specs = os.path.join(tmp, "specs.csv")
+        with open(specs, "w", encoding="utf-8") as f:
+            f.write("image,platform,tone,additional_specs\n")
+            f.write("enero/IMG_0001.jpg,instagram,Divertido,\n")
+            f.write("febrero/IMG_0001.jpg,Instagram,Divertido,\n")
+            f.write("febrero/IMG_0001.jpg,twitter,Divertido,\n")
+
+        jobs = load_jobs(images, specs)
+        assert len({job['key'] for job in jobs}) == 3
+        assert [job['user_specs']['platform'] for job in jobs] == ["Instagram", "Instagram", "Twitter/X"]
+
+        output = os.path.join(tmp, "stories")
+        pipeline = FakePipeline()
+        assert run_batch(images, specs, ["JSON"], 2, output, pipeline=pipeline)['ok'] == 3
+        assert run_batch(images, specs, ["JSON"], 2, output, pipeline=FakePipeline())['skipped'] == 3
+
+        with open(specs, "a", encoding="utf-8") as f:
+            f.write("enero/IMG_0001.jpg,Tiktok,Divertido,\n")
+        try:
+            load_jobs(images, specs)
+            raise AssertionError("debería rechazar la plataforma")
+        except ValueError as e:
+            assert "Tiktok" in str(e) and ":5:" in str(e)
+
+    print("✅ Job keys and platforms are validated")
+    return True
+
+
+def main():
+    """Run all batch tests"""
+    print("🧪 Running batch generation tests...\n")
+
+    tests = [
+        test_rows_without_image_apply_to_every_image,
+        test_checkpoint_resumes_and_retries_failed,
+        test_same_name_in_other_folder_and_unknown_platform
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the BLIP inference backends and conditional captioning
+using a tiny random model (no model download required)
+"""
+
+import os
+import sys
+import tempfile
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+
+def _tiny_model():
+    import torch
+    from transformers import BlipForConditionalGeneration
+    from benchmark_blip_backends import tiny_blip_config
+
+    torch.manual_seed(0)
+    return BlipForConditionalGeneration(tiny_blip_config())
+
+
+def test_int8_backend_quantizes_linear_layers():
+    """Test that the int8 backend replaces nn.Linear with dynamic quantized layers"""
+    print("🧪 Testing int8 quantization...")
+
+    import torch
+    from Tools.blip_caption_tool import prepare_blip_model
+
+    model = prepare_blip_model(_tiny_model(), "int8")
+
+    float_linears = [m for m in model.modules() if type(m) is torch.nn.Linear]
+    assert not float_linears, f"{len(float_linears)} capas lineales sin cuantizar"
+    assert not model.training
+
+    print("✅ int8 backend quantizes linear layers")
+    return True
+
+
+def test_backends_generate_same_shape():
+    """Test that fp32 and int8 backends both produce captions for a batch"""
+    print("🧪 Testing generation with both backends...")
+
+    import torch
+    from Tools.blip_caption_tool import prepare_blip_model
+
+    pixel_values = torch.rand(2, 3, 64, 64)
+    outputs = {}
+    for backend in ("fp32", "int8"):
+        model = prepare_blip_model(_tiny_model(), backend)
+        with torch.inference_mode():
+            outputs[backend] = model.generate(pixel_values=pixel_values, max_new_tokens=6, num_beams=2)
+
+    assert outputs["fp32"].shape[0] == outputs["int8"].shape[0] == 2
+
+    print("✅ Both backends generate captions")
+    return True
+
+
+def test_unknown_backend_is_rejected():
+    """Test that an unsupported backend raises a clear error"""
+    print("🧪 Testing unknown backend...")
+
+    from Tools.blip_caption_tool import prepare_blip_model
+
+    try:
+        prepare_blip_model(_tiny_model(), "fp8")
+    except ValueError as e:
+        assert "fp8" in str(e)
+    else:
+        raise AssertionError("Se esperaba ValueError para un backend desconocido")
+
+    print("✅ Unknown backend rejected")
+    return True
+
+
+def _tiny_processor(vocab_dir: str):
+    from transformers import BlipProcessor, BlipImageProcessor, BertTokenizerFast
+
+    words = ["[PAD]", "[UNK]", "[SEP]", "[CLS]", "[MASK]"] + [f"w{i}" for i in range(25)] + ["[DEC]"]
+    words += ["a", "photography", "of", "the", "main", "colors", "are", "mood", "is"]
+    words += [f"x{i}" for i in range(120 - len(words))]
+    vocab_file = os.path.join(vocab_dir, "vocab.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(words))
+
+    return BlipProcessor(
+        image_processor=BlipImageProcessor(size={"height": 64, "width": 64}),
+        tokenizer=BertTokenizerFast(vocab_file)
+    )
+
+
+def test_facets_match_per_prompt_generate():
+    """Test that shared-encoder facets equal one generate() call per prompt"""
+    print("🧪 Testing multi-prompt conditional captioning...")
+
+    from PIL import Image
+    import Tools.blip_caption_tool as blip
+
+    with tempfile.TemporaryDirectory() as tmp:
+        processor = _tiny_processor(tmp)
+        model = _tiny_model().eval()
+        previous = (blip._processor, blip._blip_model, blip.BLIP_GENERATION_PARAMS)
+        blip._processor, blip._blip_model = processor, model
+        blip.BLIP_GENERATION_PARAMS = {"max_new_tokens": 6, "num_beams": 2}
+
+        try:
+            images = [Image.new("RGB", (80, 60), (200, 10, 10)), Image.new("RGB", (64, 64), (10, 10, 200))]
+            # El prompt vacío equivale al caption incondicional
+            prompts = {"caption": "", "escena": "a photography of", "colores": "the main colors are", "ambiente": "the mood is"}
+            facets = blip.generate_facets(images, prompts)
+
+            for image, result in zip(images, facets):
+                for name, prompt in prompts.items():
+                    inputs = processor(images=image, text=prompt, return_tensors="pt")
+                    output = model.generate(
+                        pixel_values=inputs.pixel_values, input_ids=inputs.input_ids,
+                        max_new_tokens=6, num_beams=2
+                    )
+                    expected = processor.decode(output[0], skip_special_tokens=True).strip()
+                    assert result[name] == expected, (name, result[name], expected)
+        finally:
+            blip._processor, blip._blip_model, blip.BLIP_GENERATION_PARAMS = previous
+
+    print("✅ Facets match per-prompt generation")
+    return True
+
+
+def test_caption_agreement():
+    """Test the agreement metrics used by the benchmark"""
+    print("🧪 Testing caption agreement metrics...")
+
+    from benchmark_blip_backends import caption_agreement
+
+    agreement = caption_agreement(
+        ["a dog on the beach", "a red car"],
+        ["a dog on the beach", "a blue car"]
+    )
+    assert agreement["exact_match"] == 0.5
+    assert 0.5 < agreement["token_overlap"] < 1.0
+
+    print("✅ Agreement metrics work correctly")
+    return True
+
+
+def main():
+    """Run all backend tests"""
+    print("🧪 Running BLIP inference tests...\n")
+
+    tests = [
+        test_int8_backend_quantizes_linear_layers,
+        test_backends_generate_same_shape,
+        test_unknown_backend_is_rejected,
+        test_facets_match_per_prompt_generate,
+        test_caption_agreement
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
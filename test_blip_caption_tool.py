@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Test script to verify BlipCaptionTool end to end (cache, batching and tool entry point)
+using a tiny random model (no model download required)
+"""
+
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from PIL import Image
+
+import Tools.blip_caption_tool as blip
+from utils.disk_cache import DiskCache
+from test_blip_backends import _tiny_model, _tiny_processor
+
+
+@contextmanager
+def stub_blip(weight_std: float = None):
+    """
+    Modelo BLIP diminuto, caché temporal y contador de llamadas al modelo. Con `weight_std` los pesos
+    se reinician con esa desviación para que imágenes distintas den captions distintos.
+    """
+    import torch
+
+    calls = []
+    originals = {name: getattr(blip, name) for name in (
+        '_processor', '_blip_model', 'BLIP_GENERATION_PARAMS', 'BLIP_FACETS_ENABLED', 'caption_cache',
+        'generate_captions', 'generate_facets'
+    )}
+
+    def counted(name):
+        def wrapper(images, *args):
+            calls.append((name, len(images)))
+            return originals[name](images, *args)
+        return wrapper
+
+    with tempfile.TemporaryDirectory() as tmp:
+        blip._processor, blip._blip_model = _tiny_processor(tmp), _tiny_model().eval()
+        if weight_std:
+            torch.manual_seed(1)
+            with torch.no_grad():
+                for parameter in blip._blip_model.parameters():
+                    parameter.normal_(0, weight_std)
+        blip.BLIP_GENERATION_PARAMS = {"max_new_tokens": 6, "num_beams": 2}
+        blip.BLIP_FACETS_ENABLED = False
+        blip.caption_cache = DiskCache(os.path.join(tmp, "captions.sqlite"))
+        blip.generate_captions = counted('generate_captions')
+        blip.generate_facets = counted('generate_facets')
+        try:
+            yield tmp, calls
+        finally:
+            blip.caption_cache.close()
+            for name, value in originals.items():
+                setattr(blip, name, value)
+
+
+def _save_image(folder: str, name: str, size, color) -> str:
+    path = os.path.join(folder, name)
+    Image.new("RGB", size, color).save(path)
+    return path
+
+
+def test_cache_hit_skips_model():
+    """Test that a second _run on the same image is served from the caption cache"""
+    print("🧪 Testing caption cache hit/miss...")
+
+    with stub_blip() as (tmp, calls):
+        path = _save_image(tmp, "playa.png", (96, 64), (200, 120, 40))
+        first = blip.blip_caption_tool._run(path)
+        assert calls == [('generate_captions', 1)]
+
+        # Mismos píxeles con otro nombre de archivo: acierto de caché, sin pasar por el modelo
+        copy = _save_image(tmp, "copia.png", (96, 64), (200, 120, 40))
+        assert blip.blip_caption_tool._run(copy) == first
+        assert len(calls) == 1 and blip.caption_cache.stats()['hits'] == 1
+
+        # Otro modelo u otros parámetros de decodificación cambian la clave
+        image = blip.load_for_caption(path)
+        key = blip.caption_cache_key(image, **blip.BLIP_GENERATION_PARAMS)
+        assert blip.caption_cache_key(image, max_new_tokens=7, num_beams=2) != key
+        previous_model = blip.BLIP_MODEL_NAME
+        blip.BLIP_MODEL_NAME = "Salesforce/blip-image-captioning-large"
+        try:
+            assert blip.caption_cache_key(image, **blip.BLIP_GENERATION_PARAMS) != key
+            blip.blip_caption_tool._run(path)
+            assert calls[-1] == ('generate_captions', 1) and len(calls) == 2
+        finally:
+            blip.BLIP_MODEL_NAME = previous_model
+
+        # Un prompt condicional distinto no reutiliza las facetas guardadas
+        blip.blip_caption_tool.describe(path, {"escena": "a photography of"})
+        blip.blip_caption_tool.describe(path, {"escena": "a photography of"})
+        assert calls[-1] == ('generate_facets', 1) and len(calls) == 3
+        blip.blip_caption_tool.describe(path, {"ambiente": "the mood is"})
+        assert calls[-1] == ('generate_facets', 1) and len(calls) == 4
+
+    print("✅ Cache hits skip the model and key changes miss")
+    return True
+
+
+def test_caption_batch_matches_single_images():
+    """Test that batched captions match per-image captions and keep the input order"""
+    print("🧪 Testing batched captioning...")
+
+    specs = [("alto.png", (60, 120), (200, 10, 10)), ("ancho.png", (160, 70), (10, 10, 200)),
+             ("cuadrado.png", (90, 90), (10, 180, 10)), ("pequeño.png", (40, 30), (250, 250, 250))]
+
+    with stub_blip(weight_std=0.5) as (tmp, calls):
+        paths = [_save_image(tmp, name, size, color) for name, size, color in specs]
+        single = [blip.blip_caption_tool.caption_batch([path])[0] for path in paths]
+    assert len(set(single)) > 2, single
+
+    with stub_blip(weight_std=0.5) as (tmp, calls):
+        paths = [_save_image(tmp, name, size, color) for name, size, color in specs]
+        # Una imagen ya en caché en medio del lote: el resto se agrupa sin alterar el orden
+        blip.blip_caption_tool.caption_batch([paths[1]])
+        batched = blip.blip_caption_tool.caption_batch(paths, max_batch_size=2)
+        assert batched == single, (batched, single)
+        assert calls == [('generate_captions', 1), ('generate_captions', 2), ('generate_captions', 1)]
+
+        # Rutas repetidas y orden invertido
+        assert blip.blip_caption_tool.caption_batch(paths[::-1] + paths[:1]) == single[::-1] + single[:1]
+        assert len(calls) == 3
+
+    print("✅ Batched captions match single-image captions")
+    return True
+
+
+def test_run_end_to_end():
+    """Test the tool entry point with and without facets"""
+    print("🧪 Testing _run end to end...")
+
+    with stub_blip() as (tmp, calls):
+        path = _save_image(tmp, "playa.png", (96, 64), (200, 120, 40))
+        caption = blip.blip_caption_tool._run(path)
+        assert caption == blip.blip_caption_tool.caption_batch([path])[0]
+        assert calls == [('generate_captions', 1)]
+
+        blip.BLIP_FACETS_ENABLED = True
+        description = blip.blip_caption_tool._run(path)
+        assert description.startswith(f"Descripción: {caption}")
+        for name in blip.BLIP_FACET_PROMPTS:
+            assert f"{name.capitalize()}: " in description
+        assert calls[-1] == ('generate_facets', 1)
+
+    print("✅ _run returns captions and facets")
+    return True
+
+
+def test_facets_through_the_worker():
+    """Test that facets are not dropped when the caption worker is enabled"""
+    print("🧪 Testing facets with the caption worker...")
+
+    import socket
+    import threading
+    import Tools.caption_worker as worker
+
+    with stub_blip() as (tmp, calls):
+        path = _save_image(tmp, "playa.png", (96, 64), (200, 120, 40))
+        local = blip.format_description(blip.blip_caption_tool.describe(path))
+        blip.caption_cache.clear()
+        calls.clear()
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        server = worker.CaptionWorkerServer(port=port, window_ms=5)
+        threading.Thread(target=server.listen, daemon=True).start()
+
+        previous_client, previous_env = worker._client, os.environ.get("CAPTION_WORKER_ENABLED")
+        worker._client = worker.CaptionWorkerClient(port=port)
+        os.environ["CAPTION_WORKER_ENABLED"] = "true"
+        blip.BLIP_FACETS_ENABLED = True
+        try:
+            for _ in range(100):
+                if worker.is_worker_running(port):
+                    break
+                threading.Event().wait(0.05)
+            assert blip.blip_caption_tool._run(path) == local
+            # La petición la resolvió el worker (su conexión sigue abierta) con una sola pasada de facetas
+            assert worker._client._conn is not None
+            assert calls == [('generate_facets', 1)]
+            assert blip.blip_caption_tool.caption_image(path) == local.splitlines()[0][len("Descripción: "):]
+        finally:
+            worker._client = previous_client
+            if previous_env is None:
+                os.environ.pop("CAPTION_WORKER_ENABLED", None)
+            else:
+                os.environ["CAPTION_WORKER_ENABLED"] = previous_env
+
+    print("✅ Facets are computed by the worker")
+    return True
+
+
+def test_config_key_covers_description_settings():
+    """Test that the key used by the description stage changes with every BLIP setting"""
+    print("🧪 Testing BLIP config key...")
+
+    base = blip.blip_config_key()
+    changes = {
+        'BLIP_MODEL_NAME': "Salesforce/blip-image-captioning-large",
+        'BLIP_BACKEND': "int8",
+        'BLIP_GENERATION_PARAMS': {"max_new_tokens": 30, "num_beams": 3},
+        'BLIP_FACETS_ENABLED': not blip.BLIP_FACETS_ENABLED,
+        'BLIP_FACET_PROMPTS': {"escena": "a picture of"},
+    }
+    for name, value in changes.items():
+        previous = getattr(blip, name)
+        setattr(blip, name, value)
+        try:
+            assert blip.blip_config_key() != base, name
+        finally:
+            setattr(blip, name, previous)
+    assert blip.blip_config_key() == base
+
+    print("✅ Every BLIP setting is part of the key")
+    return True
+
+
+def main():
+    """Run all caption tool tests"""
+    print("🧪 Running caption tool tests...\n")
+
+    tests = [
+        test_cache_hit_skips_model,
+        test_caption_batch_matches_single_images,
+        test_run_end_to_end,
+        test_facets_through_the_worker,
+        test_config_key_covers_description_settings
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the caption worker protocol (authentication and accept loop)
+without loading BLIP
+"""
+
+import os
+import sys
+import socket
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from Tools.caption_worker import (
+    CaptionWorkerServer, CaptionWorkerClient, worker_authkey, probe_worker, is_worker_running,
+    WORKER_ABSENT, WORKER_READY, WORKER_FOREIGN
+)
+
+
+class EchoServer(CaptionWorkerServer):
+    """Servidor real con el modelo sustituido por un caption a partir de la ruta"""
+
+    def _caption(self, batch):
+        return [{'result': f"caption de {image_path}"} for _, _, _, image_path, _ in batch]
+
+
+def _start_server(authkey: bytes) -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = EchoServer(port=port, window_ms=5, authkey=authkey)
+    threading.Thread(target=server.listen, daemon=True).start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return port
+        except OSError:
+            threading.Event().wait(0.05)
+    raise RuntimeError("el servidor no arrancó")
+
+
+def test_authkey_is_random_per_process():
+    """Test that there is no fixed default key"""
+    print("🧪 Testing worker authkey...")
+
+    key = worker_authkey()
+    assert key != b"streamlitcrewai-captions"
+    if not os.getenv("CAPTION_WORKER_AUTHKEY"):
+        assert len(key) == 64
+    assert worker_authkey() == key
+
+    print("✅ Authkey is generated per process")
+    return True
+
+
+def test_wrong_key_is_rejected():
+    """Test that a client without the key cannot talk to the worker"""
+    print("🧪 Testing rejected clients...")
+
+    port = _start_server(b"clave-correcta")
+    try:
+        Client(("127.0.0.1", port), authkey=b"otra-clave")
+        raise AssertionError("debería rechazarse")
+    except AuthenticationError:
+        pass
+
+    conn = Client(("127.0.0.1", port), authkey=b"clave-correcta")
+    conn.send({'id': 1, 'image_path': "/tmp/a.jpg"})
+    assert conn.recv() == {'result': "caption de /tmp/a.jpg", 'id': 1}
+    conn.close()
+
+    print("✅ Only clients with the key are served")
+    return True
+
+
+def test_stalled_client_does_not_block_others():
+    """Test that a connection stuck in the handshake does not block the accept loop"""
+    print("🧪 Testing stalled handshake...")
+
+    port = _start_server(worker_authkey())
+    # Abre la conexión y nunca responde al reto de autenticación
+    stalled = socket.create_connection(("127.0.0.1", port))
+    try:
+        client = CaptionWorkerClient(port=port)
+        assert client.caption("/tmp/b.jpg", timeout=5) == "caption de /tmp/b.jpg"
+    finally:
+        stalled.close()
+
+    print("✅ Other clients are served while one stalls")
+    return True
+
+
+def test_probe_requires_our_key():
+    """Test that a stale worker with another key or an unrelated listener is not reported as running"""
+    print("🧪 Testing authenticated health probe...")
+
+    # Worker de un arranque anterior: escucha, pero con otra clave
+    stale = _start_server(b"clave-de-otro-arranque")
+    assert probe_worker(stale) == WORKER_FOREIGN and not is_worker_running(stale)
+
+    # Otro proceso que acepta conexiones y nunca responde
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        assert probe_worker(listener.getsockname()[1], timeout=0.5) == WORKER_FOREIGN
+
+    # Puerto libre: nadie escucha
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        free = probe.getsockname()[1]
+    assert probe_worker(free) == WORKER_ABSENT
+
+    ours = _start_server(worker_authkey())
+    assert probe_worker(ours) == WORKER_READY and is_worker_running(ours)
+    # El sondeo completa el handshake y cierra: el worker sigue atendiendo peticiones
+    assert CaptionWorkerClient(port=ours).caption("/tmp/c.jpg", timeout=5) == "caption de /tmp/c.jpg"
+
+    print("✅ Only a worker with our key counts as running")
+    return True
+
+
+def test_stale_worker_port_is_replaced():
+    """Test that ensure_caption_worker starts a new worker on a free port instead of trusting a stale one"""
+    print("🧪 Testing stale worker replacement...")
+
+    import Tools.caption_worker as worker
+
+    class FakeProcess:
+        """Sustituye al subproceso: el servidor de prueba arranca en el puerto que recibiría"""
+
+        def __init__(self, command, **kwargs):
+            port = int(command[command.index("--port") + 1])
+            server = EchoServer(port=port, window_ms=5)
+            threading.Thread(target=server.listen, daemon=True).start()
+
+        def poll(self):
+            return None
+
+    stale = _start_server(b"clave-de-otro-arranque")
+    previous = worker.subprocess.Popen, worker._worker_process, worker._worker_port
+    worker.subprocess.Popen = FakeProcess
+    worker._worker_process, worker._worker_port = None, stale
+    try:
+        assert worker.ensure_caption_worker(startup_timeout=10)
+        assert worker.worker_port() != stale and worker.is_worker_running()
+        assert CaptionWorkerClient().caption("/tmp/d.jpg", timeout=5) == "caption de /tmp/d.jpg"
+    finally:
+        worker.subprocess.Popen, worker._worker_process, worker._worker_port = previous
+
+    print("✅ A stale worker is replaced")
+    return True
+
+
+def main():
+    """Run all caption worker tests"""
+    print("🧪 Running caption worker tests...\n")
+
+    tests = [
+        test_authkey_is_random_per_process,
+        test_wrong_key_is_rejected,
+        test_stalled_client_does_not_block_others,
+        test_probe_requires_our_key,
+        test_stale_worker_port_is_replaced
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the persistent LRU cache used for captions
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from utils.disk_cache import DiskCache
+
+
+def test_hit_and_miss_counters():
+    """Test hit/miss accounting"""
+    print("🧪 Testing hit/miss counters...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = DiskCache(os.path.join(tmp, "cache.sqlite"), max_entries=10)
+
+        assert cache.get("missing") is None
+        cache.set("key", "una persona en la playa")
+        assert cache.get("key") == "una persona en la playa"
+
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['entries'] == 1
+        cache.close()
+
+    print("✅ Hit/miss counters work correctly")
+    return True
+
+
+def test_lru_eviction():
+    """Test that the least recently used entry is evicted first"""
+    print("🧪 Testing LRU eviction...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = DiskCache(os.path.join(tmp, "cache.sqlite"), max_entries=2)
+
+        cache.set("a", 1)
+        time.sleep(0.01)
+        cache.set("b", 2)
+        time.sleep(0.01)
+        cache.get("a")  # "a" pasa a ser la más reciente
+        time.sleep(0.01)
+        cache.set("c", 3)
+
+        assert "a" in cache
+        assert "b" not in cache
+        assert "c" in cache
+        assert cache.stats()['evictions'] == 1
+        cache.close()
+
+    print("✅ LRU eviction works correctly")
+    return True
+
+
+def test_persistence_and_ttl():
+    """Test that entries survive a reopen and expire after the TTL"""
+    print("🧪 Testing persistence and TTL...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cache.sqlite")
+        writer = DiskCache(path)
+        writer.set("persisted", {"caption": "un perro"})
+        writer.close()
+
+        reader = DiskCache(path)
+        assert reader.get("persisted") == {"caption": "un perro"}
+        reader.close()
+
+        expiring = DiskCache(path, ttl_seconds=0.01)
+        expiring.set("short", "valor")
+        time.sleep(0.05)
+        assert expiring.get("short") is None
+        expiring.close()
+
+    print("✅ Persistence and TTL work correctly")
+    return True
+
+
+def main():
+    """Run all cache tests"""
+    print("🧪 Running disk cache tests...\n")
+
+    tests = [
+        test_hit_and_miss_counters,
+        test_lru_eviction,
+        test_persistence_and_ttl
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
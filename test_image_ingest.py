@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the shared image ingest pipeline
+"""
+
+import sys
+from io import BytesIO
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from PIL import Image
+from utils.image_ingest import ingest_image, CAPTION_MIN_SIDE, PREVIEW_MAX_SIDE, PUBLISH_SIZE
+
+
+def _encode(image: Image.Image, fmt: str, **kwargs) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def test_variant_sizes_for_large_jpeg():
+    """Test that a phone-sized JPEG produces the three variants"""
+    print("🧪 Testing variant sizes...")
+
+    data = _encode(Image.new("RGB", (4000, 3000), (120, 30, 200)), "JPEG")
+    ingested = ingest_image(data)
+
+    assert ingested.original_size == (4000, 3000)
+    assert ingested.publish.size == PUBLISH_SIZE
+    assert max(ingested.preview.size) == PREVIEW_MAX_SIDE
+    assert min(ingested.caption.size) == CAPTION_MIN_SIDE
+    assert ingested.caption.mode == "RGB"
+
+    print("✅ Variant sizes are correct")
+    return True
+
+
+def test_exif_orientation_is_applied():
+    """Test that EXIF orientation rotates portrait photos upright"""
+    print("🧪 Testing EXIF orientation...")
+
+    image = Image.new("RGB", (1600, 1200), (10, 200, 10))
+    exif = image.getexif()
+    exif[0x0112] = 6  # Rotada 90° (típico de fotos de móvil en vertical)
+    ingested = ingest_image(_encode(image, "JPEG", exif=exif.tobytes()))
+
+    width, height = ingested.preview.size
+    assert height > width, f"Se esperaba orientación vertical, se obtuvo {ingested.preview.size}"
+
+    print("✅ EXIF orientation applied")
+    return True
+
+
+def test_palette_png_and_cache():
+    """Test palette images and the per-upload cache"""
+    print("🧪 Testing palette PNG and cache...")
+
+    data = _encode(Image.new("P", (500, 400)), "PNG")
+    first = ingest_image(data)
+    second = ingest_image(data)
+
+    assert first is second
+    assert first.caption.mode == "RGB"
+    assert first.preview_bytes()[:2] == b"\xff\xd8"  # JPEG
+
+    print("✅ Palette PNG and cache work correctly")
+    return True
+
+
+def main():
+    """Run all ingest tests"""
+    print("🧪 Running image ingest tests...\n")
+
+    tests = [
+        test_variant_sizes_for_large_jpeg,
+        test_exif_orientation_is_applied,
+        test_palette_png_and_cache
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the background generation job runner
+"""
+
+import sys
+import time
+import threading
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from utils.job_runner import JobRunner, current_job, check_cancelled, COMPLETED, FAILED, CANCELLED
+
+
+def _wait(runner, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    job = runner.get(job_id)
+    while not job.done and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_result_and_progress_are_polled():
+    """Test that progress and result are visible through the job handle"""
+    print("🧪 Testing job result and progress...")
+
+    runner = JobRunner(max_workers=1)
+
+    def generate(platform):
+        job = current_job()
+        job.update_step("Agente de Visión", "Análisis completado", "completed")
+        job.update_draft({"title": "Borrador"})
+        return {"platform": platform}
+
+    job = _wait(runner, runner.submit("Instagram", generate, "Instagram"))
+
+    assert job.status == COMPLETED
+    assert job.result == {"platform": "Instagram"}
+    snapshot = job.snapshot()
+    assert snapshot['progress'][0]['agent'] == "Agente de Visión"
+    assert snapshot['draft'] == {"title": "Borrador"}
+
+    print("✅ Result and progress polled")
+    return True
+
+
+def test_running_job_is_cancelled_at_next_checkpoint():
+    """Test cooperative cancellation of a running job"""
+    print("🧪 Testing cancellation...")
+
+    runner = JobRunner(max_workers=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        check_cancelled()  # p. ej. antes de la siguiente llamada al LLM
+        return "no debería llegar"
+
+    running_id = runner.submit("lento", slow)
+    queued_id = runner.submit("en cola", lambda: "tampoco")
+    started.wait(5)
+
+    assert runner.cancel(queued_id)
+    assert runner.cancel(running_id)
+    release.set()
+
+    assert _wait(runner, running_id).status == CANCELLED
+    assert _wait(runner, queued_id).status == CANCELLED
+
+    print("✅ Jobs cancelled")
+    return True
+
+
+def test_errors_are_reported():
+    """Test that an exception marks the job as failed with its message"""
+    print("🧪 Testing failed jobs...")
+
+    runner = JobRunner(max_workers=1)
+
+    def broken():
+        raise RuntimeError("cuota agotada")
+
+    job = _wait(runner, runner.submit("roto", broken))
+    assert job.status == FAILED
+    assert job.error == "cuota agotada"
+    assert check_cancelled() is None  # fuera de un trabajo no hace nada
+
+    print("✅ Errors reported")
+    return True
+
+
+def main():
+    """Run all job runner tests"""
+    print("🧪 Running job runner tests...\n")
+
+    tests = [
+        test_result_and_progress_are_polled,
+        test_running_job_is_cancelled_at_next_checkpoint,
+        test_errors_are_reported
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the deterministic LLM response cache
+"""
+
+import os
+import sys
+import tempfile
+from unittest import mock
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from crewai import LLM
+from utils.disk_cache import DiskCache
+from Models.gemini import CachedLLM, bypass_llm_cache
+
+
+def _llm(tmp: str, temperature: float = 0.0) -> CachedLLM:
+    cache = DiskCache(os.path.join(tmp, "llm.sqlite"), max_entries=10)
+    return CachedLLM(model="gemini-2.5-flash", api_key="test", temperature=temperature, cache=cache)
+
+
+def test_repeated_prompt_hits_cache():
+    """Test that near-identical prompts reuse the stored response"""
+    print("🧪 Testing cache hits...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        llm = _llm(tmp)
+        with mock.patch.object(LLM, "call", return_value="respuesta") as remote:
+            assert llm.call("Crea un post   para\nFacebook") == "respuesta"
+            assert llm.call([{"role": "user", "content": "Crea un post para Facebook "}]) == "respuesta"
+
+        assert remote.call_count == 1
+        assert llm.cache_stats()["hits"] == 1
+        llm.cache.close()
+
+    print("✅ Repeated prompts hit the cache")
+    return True
+
+
+def test_bypass_forces_remote_call():
+    """Test that the regenerate bypass skips the cached response"""
+    print("🧪 Testing cache bypass...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        llm = _llm(tmp)
+        with mock.patch.object(LLM, "call", side_effect=["primera", "segunda"]) as remote:
+            llm.call("Crea un post")
+            with bypass_llm_cache():
+                assert llm.call("Crea un post") == "segunda"
+            # La respuesta nueva reemplaza a la anterior
+            assert llm.call("Crea un post") == "segunda"
+
+        assert remote.call_count == 2
+        llm.cache.close()
+
+    print("✅ Bypass forces a fresh call")
+    return True
+
+
+def test_non_deterministic_calls_are_not_cached():
+    """Test that calls with temperature > 0 or native tools go straight to the API"""
+    print("🧪 Testing non-cacheable calls...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        warm = _llm(tmp, temperature=0.7)
+        with mock.patch.object(LLM, "call", return_value="respuesta") as remote:
+            warm.call("Crea un post")
+            warm.call("Crea un post")
+            assert remote.call_count == 2
+
+            cold = CachedLLM(model="gemini-2.5-flash", api_key="test", temperature=0.0, cache=warm.cache)
+            cold.call("Crea un post", tools=[{"name": "herramienta"}])
+            cold.call("Crea un post", tools=[{"name": "herramienta"}])
+            assert remote.call_count == 4
+
+        assert len(warm.cache) == 0
+        warm.cache.close()
+
+    print("✅ Non-deterministic calls bypass the cache")
+    return True
+
+
+def main():
+    """Run all LLM cache tests"""
+    print("🧪 Running LLM cache tests...\n")
+
+    tests = [
+        test_repeated_prompt_hits_cache,
+        test_bypass_forces_remote_call,
+        test_non_deterministic_calls_are_not_cached
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Test script to verify incremental JSON reading of streamed LLM output
+"""
+
+import sys
+import json
+import threading
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from crewai.events import crewai_event_bus, LLMStreamChunkEvent
+from utils.llm_stream import IncrementalJSONReader, stream_task_output
+
+CONTENT = {
+    "title": "Atardecer en \"la playa\"",
+    "hook": "¿Cuándo fue la última vez que miraste el cielo?",
+    "body": ["Primer párrafo.", "Segundo párrafo\ncon salto de línea."],
+    "call_to_action": "Cuéntanos en comentarios",
+    "hashtags": ["#playa"]
+}
+
+
+def test_fields_appear_before_json_is_complete():
+    """Test that title and hook are available as soon as they are written"""
+    print("🧪 Testing partial fields...")
+
+    text = "Thought: listo\nFinal Answer: ```json\n" + json.dumps(CONTENT, ensure_ascii=False) + "\n```"
+    reader = IncrementalJSONReader()
+
+    title_seen_at = None
+    for position in range(0, len(text), 7):
+        fields = reader.feed(text[position:position + 7])
+        if title_seen_at is None and fields.get("title") == CONTENT["title"]:
+            title_seen_at = position
+        assert "body" not in fields or isinstance(fields["body"], list)
+
+    assert title_seen_at is not None and title_seen_at < len(text) // 3
+    final = reader.fields()
+    for name in ("title", "hook", "body", "call_to_action"):
+        assert final[name] == CONTENT[name], (name, final[name])
+
+    print("✅ Partial fields are read incrementally")
+    return True
+
+
+def test_twitter_fields_are_streamed():
+    """Test that Twitter drafts stream main_tweet and the thread like the body"""
+    print("🧪 Testing Twitter fields...")
+
+    tweet = {"title": "Atardecer", "main_tweet": "El cielo se apaga en naranja.",
+             "thread": ["1/2 La playa se vacía.", "2/2 Solo queda el mar."], "hashtags": ["#playa"]}
+    text = "Final Answer: " + json.dumps(tweet, ensure_ascii=False)
+    reader = IncrementalJSONReader()
+
+    partial = reader.feed(text[:text.index("2/2") + 5])
+    assert partial["main_tweet"] == tweet["main_tweet"]
+    assert partial["thread"] == ["1/2 La playa se vacía.", "2/2 S"]
+
+    final = reader.feed(text[text.index("2/2") + 5:])
+    assert final == {name: tweet[name] for name in ("title", "main_tweet", "thread")}
+
+    print("✅ Twitter fields are read incrementally")
+    return True
+
+
+def test_truncated_escape_is_not_emitted():
+    """Test that a chunk ending mid-escape does not produce garbage"""
+    print("🧪 Testing truncated escapes...")
+
+    reader = IncrementalJSONReader()
+    assert reader.feed('{"title": "Hola \\u00') == {"title": "Hola "}
+    assert reader.feed('e1 mundo"')["title"] == "Hola á mundo"
+
+    print("✅ Truncated escapes handled")
+    return True
+
+
+def test_chunks_are_routed_to_the_subscribed_thread():
+    """Test that only the thread running the crew receives its chunks"""
+    print("🧪 Testing chunk routing...")
+
+    received = []
+    with stream_task_output(None, received.append):
+        other = threading.Thread(
+            target=crewai_event_bus.emit,
+            args=(None, LLMStreamChunkEvent(chunk='{"title": "Otra sesión"}'))
+        )
+        other.start()
+        other.join()
+        crewai_event_bus.emit(None, LLMStreamChunkEvent(chunk='{"title": "Mi historia"}'))
+
+    crewai_event_bus.emit(None, LLMStreamChunkEvent(chunk='{"title": "Fuera"}'))
+
+    assert received == [{"title": "Mi historia"}]
+
+    print("✅ Chunks routed per thread")
+    return True
+
+
+def main():
+    """Run all streaming tests"""
+    print("🧪 Running LLM streaming tests...\n")
+
+    tests = [
+        test_fields_appear_before_json_is_complete,
+        test_twitter_fields_are_streamed,
+        test_truncated_escape_is_not_emitted,
+        test_chunks_are_routed_to_the_subscribed_thread
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
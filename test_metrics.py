@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test script to verify per-stage latency spans and the Prometheus export
+"""
+
+import os
+import sys
+import tempfile
+import urllib.request
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from utils.metrics import MetricsRegistry, start_metrics_server
+
+
+def test_percentiles_and_errors():
+    """Test that spans feed the histogram and failures are counted"""
+    print("🧪 Testing latency histogram...")
+
+    registry = MetricsRegistry(window=100)
+    for ms in range(1, 101):
+        registry.observe("llm_call", ms / 1000)
+
+    @registry.timed("supabase_save_story")
+    def failing():
+        raise RuntimeError("sin conexión")
+
+    try:
+        failing()
+    except RuntimeError:
+        pass
+
+    summary = registry.summary()
+    assert summary["llm_call"]["count"] == 100
+    assert abs(summary["llm_call"]["p50"] - 0.051) < 1e-9
+    assert abs(summary["llm_call"]["p95"] - 0.096) < 1e-9
+    assert abs(summary["llm_call"]["p99"] - 0.100) < 1e-9
+    assert summary["supabase_save_story"]["errors"] == 1
+
+    print("✅ Percentiles and errors are tracked")
+    return True
+
+
+def test_returned_failures_count_as_errors():
+    """Test that functions reporting failure in their return value feed the error counter"""
+    print("🧪 Testing returned failures...")
+
+    registry = MetricsRegistry(window=100)
+
+    # Mismo contrato que SupabaseManager: {"success": False, ...} en lugar de una excepción
+    @registry.timed("supabase_upload_image", failed=lambda result: not result.get("success"))
+    def upload(ok):
+        return {"success": ok, "error": None if ok else "bucket no encontrado"}
+
+    assert upload(False) == {"success": False, "error": "bucket no encontrado"}
+    upload(True)
+    upload(False)
+
+    summary = registry.summary()
+    assert summary["supabase_upload_image"]["count"] == 3
+    assert summary["supabase_upload_image"]["errors"] == 2
+
+    print("✅ Returned failures are counted")
+    return True
+
+
+def test_prometheus_file_export():
+    """Test the text exposition written to disk"""
+    print("🧪 Testing Prometheus export...")
+
+    registry = MetricsRegistry()
+    with registry.span("blip_generate"):
+        pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = registry.write_prometheus(os.path.join(tmp, "metrics", "story.prom"))
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+
+    assert "# TYPE story_stage_latency_seconds summary" in text
+    assert 'story_stage_latency_seconds{stage="blip_generate",quantile="0.99"}' in text
+    assert 'story_stage_latency_seconds_count{stage="blip_generate"} 1' in text
+
+    print("✅ Prometheus file is written")
+    return True
+
+
+def test_metrics_endpoint():
+    """Test the local /metrics HTTP endpoint"""
+    print("🧪 Testing metrics endpoint...")
+
+    registry = MetricsRegistry()
+    registry.observe("instagram_publish", 1.5)
+    server = start_metrics_server(port=19451, registry=registry)
+    assert server is not None
+    # Una segunda llamada (rerun de Streamlit) reutiliza el mismo servidor
+    assert start_metrics_server(port=19451, registry=registry) is server
+
+    with urllib.request.urlopen("http://127.0.0.1:19451/metrics", timeout=5) as response:
+        body = response.read().decode("utf-8")
+    assert 'story_stage_latency_seconds_sum{stage="instagram_publish"} 1.500000' in body
+
+    print("✅ Endpoint serves the metrics")
+    return True
+
+
+def main():
+    """Run all metrics tests"""
+    print("🧪 Running metrics tests...\n")
+
+    tests = [
+        test_percentiles_and_errors,
+        test_returned_failures_count_as_errors,
+        test_prometheus_file_export,
+        test_metrics_endpoint
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the local platform rule engine (validation and auto-fix)
+"""
+
+import sys
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from utils.platform_rules import validate_content, enforce_platform_rules, split_tweets
+
+
+class FakeLLM:
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.prompts = []
+
+    def call(self, prompt):
+        self.prompts.append(prompt)
+        return self.answers.pop(0)
+
+
+def _rules(issues):
+    return [issue['rule'] for issue in issues]
+
+
+def test_twitter_is_split_into_a_thread():
+    """Test that an over-length tweet becomes a thread at sentence boundaries without the LLM"""
+    print("🧪 Testing tweet splitting...")
+
+    sentence = "El atardecer convierte la playa en un cuadro naranja y violeta."
+    content = {
+        'title': "Atardecer",
+        'main_tweet': " ".join([sentence] * 8),
+        'thread': ["Y mañana vuelve a empezar."],
+        'hashtags': ["#playa", "#Playa", "atardecer"],
+        'call_to_action': "¿Cuál es tu playa favorita?"
+    }
+    assert set(_rules(validate_content(content, "Twitter/X"))) == {'tweet_chars', 'hashtag_format'}
+
+    llm = FakeLLM([])
+    fixed, report = enforce_platform_rules(content, "Twitter/X", llm=llm)
+    tweets = [fixed['main_tweet']] + fixed['thread']
+    assert all(len(tweet) <= 280 for tweet in tweets)
+    assert all(tweet.endswith(".") or tweet.endswith("?") for tweet in tweets)
+    assert tweets[-1] == "Y mañana vuelve a empezar." and len(tweets) == 3
+    assert fixed['hashtags'] == ["#playa", "#atardecer"]
+    assert report['remaining'] == [] and llm.prompts == [] and report['local_ms'] < 50
+    assert fixed['full_text'].startswith(fixed['main_tweet'])
+
+    assert split_tweets("a" * 600, 280) == ["a" * 280, "a" * 280, "a" * 40]
+
+    print("✅ Tweets are split locally")
+    return True
+
+
+def test_hashtags_and_emojis_are_trimmed():
+    """Test overlong hashtag lists and emoji density on LinkedIn"""
+    print("🧪 Testing hashtags and emojis...")
+
+    content = {
+        'title': "Equipo",
+        'hook': "🚀🚀 Hoy cerramos un proyecto enorme 🎉🎉🎉",
+        'body': ["Gracias a todo el equipo por el esfuerzo de estos meses 🙌🙌 de verdad."],
+        'call_to_action': "Cuéntame qué proyecto te enorgullece 👇",
+        'hashtags': [f"#tema{i}" for i in range(9)],
+        'full_text': "..."
+    }
+    assert set(_rules(validate_content(content, "LinkedIn"))) == {'hashtags_max', 'emoji_density'}
+
+    fixed, report = enforce_platform_rules(content, "LinkedIn")
+    assert fixed['hashtags'] == [f"#tema{i}" for i in range(5)]
+    assert fixed['hook'].startswith("🚀") and "🎉" not in fixed['hook'] and "🙌" not in fixed['body'][0]
+    assert report['remaining'] == [] and set(report['fixed_locally']) == {'hashtags_max', 'emoji_density'}
+
+    print("✅ Hashtags and emojis are trimmed")
+    return True
+
+
+def test_llm_only_for_what_cannot_be_fixed_locally():
+    """Test that missing hashtags trigger one targeted call and unfixable issues are reported"""
+    print("🧪 Testing LLM fallback...")
+
+    content = {
+        'title': "Playa", 'hook': "Mira este cielo.", 'body': ["Un día perfecto."],
+        'call_to_action': "Guarda este post", 'hashtags': ["#playa"], 'full_text': "Mira este cielo."
+    }
+    llm = FakeLLM(['{"hashtags": ["#playa", "#mar", "#verano", "#atardecer", "#viajes", "#sol"]}'])
+    fixed, report = enforce_platform_rules(content, "Instagram", llm=llm)
+    assert len(llm.prompts) == 1 and '"hashtags"' in llm.prompts[0]
+    assert report['llm_repairs'] == ['hashtags_min'] and report['remaining'] == []
+    assert fixed['full_text'].endswith("#sol")
+
+    # Sin LLM (o si no responde) se informa en lugar de insistir
+    _, report = enforce_platform_rules(content, "Instagram")
+    assert _rules(report['remaining']) == ['hashtags_min']
+    _, report = enforce_platform_rules(content, "Instagram", llm=FakeLLM(["no sé"]))
+    assert _rules(report['remaining']) == ['hashtags_min'] and report['llm_repairs'] == []
+
+    print("✅ LLM is only a fallback")
+    return True
+
+
+def main():
+    """Run all platform rule tests"""
+    print("🧪 Running platform rule tests...\n")
+
+    tests = [
+        test_twitter_is_split_into_a_thread,
+        test_hashtags_and_emojis_are_trimmed,
+        test_llm_only_for_what_cannot_be_fixed_locally
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Test script to verify prompt compaction, token budgets and per-task token accounting
+"""
+
+import os
+import sys
+import tempfile
+import contextvars
+from datetime import datetime
+from unittest import mock
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from crewai import LLM
+from utils.disk_cache import DiskCache
+from utils.prompt_budget import (
+    compact_story_data, extra_user_specs, fit_to_budget, track_tokens, STORAGE_FIELDS, TRUNCATION_MARK
+)
+from Models.gemini import CachedLLM
+
+
+class FakeTask:
+    name = "instagram_content"
+
+
+def test_compaction_and_budget():
+    """Test that redundant fields are dropped and budgets warn or truncate"""
+    print("🧪 Testing prompt compaction...")
+
+    specs = {'platform': 'Instagram', 'tone': 'casual', 'additional_specs': '', 'audience': 'surfistas'}
+    assert extra_user_specs(specs) == '{"audience":"surfistas"}'
+    assert extra_user_specs({'platform': 'Instagram', 'tone': 'casual'}) == ""
+
+    story = {
+        'content': {'title': 'Hola'}, 'platform': 'Instagram', 'tone': 'casual', 'image_url': 'https://x/img.jpg',
+        'content_parse': {'method': 'json'}, 'created_at': '2024-01-01', 'image_path': '/tmp/a.jpg', 'id': None
+    }
+    assert set(compact_story_data(story, STORAGE_FIELDS)) == {'content', 'platform', 'tone', 'image_url'}
+
+    text = "palabra " * 400  # ~800 tokens
+    assert fit_to_budget(text, "prueba", budget=100, mode="warn") == text
+    truncated = fit_to_budget(text, "prueba", budget=100, mode="truncate")
+    assert truncated.endswith(TRUNCATION_MARK) and len(truncated) <= 400 + len(TRUNCATION_MARK)
+
+    print("✅ Compaction and budgets work")
+    return True
+
+
+def test_llm_calls_are_accounted_per_task():
+    """Test that provider usage is recorded per task, and cache hits count as cached"""
+    print("🧪 Testing token ledger...")
+
+    def remote(self, messages, tools=None, callbacks=None, *args):
+        # Igual que CrewAI: invoca directamente a los callbacks con el usage y start_time=0
+        for callback in callbacks or []:
+            callback.log_success_event({}, {"usage": {"prompt_tokens": 120, "completion_tokens": 30}}, 0, 0)
+            # Invocación global de litellm (otra llamada, con tiempos reales): debe ignorarse
+            callback.log_success_event({}, {"usage": {"prompt_tokens": 9999, "completion_tokens": 9999}},
+                                       datetime.now(), datetime.now())
+        return "respuesta"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = DiskCache(os.path.join(tmp, "llm.sqlite"), max_entries=10)
+        llm = CachedLLM(model="gemini-2.5-flash", api_key="test", temperature=0.0, cache=cache)
+        with mock.patch.object(LLM, "call", remote), track_tokens() as ledger:
+            llm.call("Crea un post", from_task=FakeTask())
+            llm.call("Crea un post", from_task=FakeTask())
+            llm.call("Repara el título")
+        cache.close()
+
+    usage = ledger.summary()
+    assert usage['tasks']['instagram_content'] == {
+        'calls': 2, 'cached_calls': 1, 'prompt_tokens': 120, 'completion_tokens': 30
+    }
+    assert usage['tasks']['llamada_directa']['prompt_tokens'] == 120
+    assert usage['prompt_tokens'] == 240 and usage['completion_tokens'] == 60
+
+    print("✅ Tokens are accounted per task")
+    return True
+
+
+def test_ledger_follows_context_into_threads():
+    """Test that copy_context carries the story ledger into worker threads"""
+    print("🧪 Testing ledger propagation...")
+
+    import threading
+    from utils.prompt_budget import record_llm_usage
+
+    with track_tokens() as ledger:
+        context = contextvars.copy_context()
+        worker = threading.Thread(target=context.run, args=(record_llm_usage, "facebook_content", 10, 5))
+        worker.start()
+        worker.join()
+    record_llm_usage("facebook_content", 99, 99)  # fuera del bloque: no pertenece a la historia
+
+    assert ledger.summary()['prompt_tokens'] == 10
+
+    print("✅ Ledger follows the context")
+    return True
+
+
+def main():
+    """Run all prompt budget tests"""
+    print("🧪 Running prompt budget tests...\n")
+
+    tests = [
+        test_compaction_and_budget,
+        test_llm_calls_are_accounted_per_task,
+        test_ledger_follows_context_into_threads
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
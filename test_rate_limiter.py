@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the process-wide LLM rate limiter
+"""
+
+import sys
+import time
+import threading
+from unittest import mock
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from utils.rate_limiter import TokenBucket, RateLimiter, backoff_delay, is_rate_limit_error
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def test_token_bucket_spaces_requests():
+    """Test that requests beyond the burst wait for the refill"""
+    print("🧪 Testing token bucket...")
+
+    bucket = TokenBucket(rate_per_minute=600, capacity=2)  # 10 por segundo
+    waits = [bucket.reserve(1) for _ in range(4)]
+
+    assert waits[0] == 0 and waits[1] == 0
+    assert 0.08 < waits[2] < 0.12
+    assert 0.18 < waits[3] < 0.22
+
+    print("✅ Token bucket spaces requests")
+    return True
+
+
+def test_concurrency_cap_and_queue_wait_metric():
+    """Test the in-flight cap and that queue wait is recorded"""
+    print("🧪 Testing concurrency cap...")
+
+    limiter = RateLimiter(max_concurrent=2)
+    peak = [0]
+    lock = threading.Lock()
+
+    def call():
+        with limiter.slot():
+            with lock:
+                peak[0] = max(peak[0], limiter.stats()['in_flight'])
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = limiter.stats()
+    assert peak[0] == 2
+    assert stats['calls'] == 6
+    assert stats['queue_wait_ms_max'] >= 40
+
+    print("✅ Concurrency capped and queue wait measured")
+    return True
+
+
+def test_llm_retries_rate_limit_errors():
+    """Test that a 429 is retried with backoff and other errors are not"""
+    print("🧪 Testing 429 retries...")
+
+    from crewai import LLM
+    from Models.gemini import CachedLLM
+
+    limiter = RateLimiter(max_concurrent=1)
+    llm = CachedLLM(model="gemini-2.5-flash", api_key="test", temperature=0.7,
+                    rate_limiter=limiter, max_retries=3)
+
+    with mock.patch("Models.gemini.backoff_delay", return_value=0), \
+         mock.patch.object(LLM, "call", side_effect=[RateLimitError("429"), RateLimitError("429"), "ok"]) as remote:
+        assert llm.call("hola") == "ok"
+    assert remote.call_count == 3
+    assert limiter.stats()['throttled'] == 2
+
+    with mock.patch.object(LLM, "call", side_effect=ValueError("prompt inválido")) as remote:
+        try:
+            llm.call("hola")
+        except ValueError:
+            pass
+    assert remote.call_count == 1
+
+    assert is_rate_limit_error(Exception("RESOURCE_EXHAUSTED: quota"))
+    assert 0 <= backoff_delay(10, base=1, cap=5) <= 5
+
+    print("✅ 429 errors retried")
+    return True
+
+
+def main():
+    """Run all rate limiter tests"""
+    print("🧪 Running rate limiter tests...\n")
+
+    tests = [
+        test_token_bucket_spaces_requests,
+        test_concurrency_cap_and_queue_wait_metric,
+        test_llm_retries_rate_limit_errors
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
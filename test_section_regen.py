@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test script to verify section-level partial regeneration
+"""
+
+import sys
+import json
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from utils.section_regen import regenerate_section, section_options, build_section_prompt, PLACEHOLDER
+
+CONTENT = {
+    'title': "Atardecer en la costa",
+    'hook': "¿Cuándo fue la última vez que paraste a mirar el cielo?",
+    'body': ["El sol se esconde tras las olas.", "La playa se queda en silencio."],
+    'call_to_action': "Comparte tu atardecer favorito",
+    'hashtags': ["#playa", "#atardecer"],
+    'full_text': "texto anterior"
+}
+
+
+class FakeLLM:
+    """Devuelve una respuesta fija y guarda los prompts recibidos"""
+
+    def __init__(self, response):
+        self.response = response
+        self.prompts = []
+
+    def call(self, prompt):
+        self.prompts.append(prompt)
+        return self.response
+
+
+def test_single_field_is_replaced():
+    """Test that only the requested field changes and full_text is recomposed locally"""
+    print("🧪 Testing hook regeneration...")
+
+    llm = FakeLLM('```json\n{"hook": "El cielo también tiene horario de cierre."}\n```')
+    new_content, report = regenerate_section(llm, CONTENT, "Instagram", "hook", tone="inspiracional")
+
+    assert new_content['hook'] == "El cielo también tiene horario de cierre."
+    assert {k: v for k, v in new_content.items() if k not in ('hook', 'full_text')} == \
+        {k: v for k, v in CONTENT.items() if k not in ('hook', 'full_text')}
+    assert new_content['full_text'].startswith("El cielo también") and "#playa #atardecer" in new_content['full_text']
+    assert len(llm.prompts) == 1 and report['field'] == 'hook'
+    # El prompt lleva el resto del post congelado, pero no el texto completo duplicado
+    assert "texto anterior" not in llm.prompts[0] and "Comparte tu atardecer favorito" in llm.prompts[0]
+
+    print("✅ Only the hook changed")
+    return True
+
+
+def test_one_paragraph_and_hashtags():
+    """Test paragraph-level regeneration and hashtag normalization"""
+    print("🧪 Testing paragraph and hashtags...")
+
+    prompt = build_section_prompt(CONTENT, "Instagram", "body", 1)
+    frozen = json.loads(prompt.splitlines()[1])
+    assert frozen['body'] == ["El sol se esconde tras las olas.", PLACEHOLDER]
+
+    paragraph, _ = regenerate_section(FakeLLM('{"paragraph": "Solo queda el ruido del mar."}'), CONTENT, "Instagram", "body", 1)
+    assert paragraph['body'] == ["El sol se esconde tras las olas.", "Solo queda el ruido del mar."]
+    assert CONTENT['body'][1] == "La playa se queda en silencio."
+
+    hashtags, _ = regenerate_section(FakeLLM('{"hashtags": "#mar, #calma #viajes"}'), CONTENT, "Instagram", "hashtags")
+    assert hashtags['hashtags'] == ["#mar", "#calma", "#viajes"]
+
+    print("✅ Paragraphs and hashtags are regenerated")
+    return True
+
+
+def test_options_and_failures():
+    """Test the section list per platform and errors on bad output"""
+    print("🧪 Testing section options...")
+
+    assert section_options(CONTENT, "Instagram") == [
+        ('title', None), ('hook', None), ('body', 0), ('body', 1), ('call_to_action', None), ('hashtags', None)
+    ]
+    assert ('main_tweet', None) in section_options({'thread': ["1/2", "2/2"]}, "Twitter/X")
+
+    for response, index in (("no sé", None), ('{"paragraph": "x"}', 5)):
+        try:
+            regenerate_section(FakeLLM(response), CONTENT, "Instagram", "body" if index else "title", index)
+            raise AssertionError("debería fallar")
+        except ValueError:
+            pass
+
+    print("✅ Options and failures are handled")
+    return True
+
+
+def main():
+    """Run all section regeneration tests"""
+    print("🧪 Running section regeneration tests...\n")
+
+    tests = [
+        test_single_field_is_replaced,
+        test_one_paragraph_and_hashtags,
+        test_options_and_failures
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
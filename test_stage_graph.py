@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the staged generation graph and its per-stage memoization
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+# Add the current directory to Python path
+sys.path.append('.')
+
+from utils.disk_cache import DiskCache
+from utils.stage_graph import StageGraph, file_fingerprint, CACHED, COMPUTED, GIVEN
+
+
+def _story_graph(cache, calls):
+    """Mismas etapas que StoryPipeline, con funciones que solo cuentan sus ejecuciones"""
+    graph = StageGraph(cache)
+
+    def description(values):
+        calls.append('description')
+        return f"descripción de {os.path.basename(values['image_path'])}"
+
+    def content(values):
+        calls.append('content')
+        specs = values['user_specs']
+        return {'content': {'title': f"{specs['platform']} {specs['tone']}"}, 'content_parse': {}}
+
+    graph.add('description', description, inputs=['image_path', 'mode'])
+    graph.add('content', content, inputs=['description', 'user_specs'])
+    return graph
+
+
+def _run(graph, image_path, **specs):
+    return graph.run(
+        'content',
+        {'image_path': image_path, 'mode': 'direct', 'user_specs': {'platform': 'Instagram', 'tone': 'divertido', **specs}},
+        fingerprints={'image_path': file_fingerprint(image_path)}
+    )
+
+
+def test_only_changed_stages_rerun():
+    """Test that changing tone reruns only content and changing platform reuses the description"""
+    print("🧪 Testing incremental recompute...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image = os.path.join(tmp, "foto.jpg")
+        with open(image, "wb") as f:
+            f.write(b"pixeles")
+        calls = []
+        graph = _story_graph(DiskCache(os.path.join(tmp, "stages.sqlite")), calls)
+
+        first = _run(graph, image)
+        assert first.status == {'image_path': GIVEN, 'mode': GIVEN, 'description': COMPUTED, 'user_specs': GIVEN, 'content': COMPUTED}
+
+        tone = _run(graph, image, tone='profesional')
+        assert tone.status['description'] == CACHED and tone.status['content'] == COMPUTED
+
+        platform = _run(graph, image, platform='LinkedIn')
+        assert platform.status['description'] == CACHED and platform['content']['content']['title'] == "LinkedIn divertido"
+
+        same = _run(graph, image)
+        assert same.status['content'] == CACHED
+        assert calls == ['description', 'content', 'content', 'content']
+        assert graph.stats()['description'] == {'hits': 3, 'misses': 1}
+
+    print("✅ Only the changed stages are recomputed")
+    return True
+
+
+def test_fingerprint_follows_content_not_path():
+    """Test that a copy of the image under another name (a new temp file) hits the cache"""
+    print("🧪 Testing content fingerprints...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image = os.path.join(tmp, "temp_foto.jpg")
+        with open(image, "wb") as f:
+            f.write(b"pixeles")
+        copy = os.path.join(tmp, "temp_otra.jpg")
+        shutil.copy(image, copy)
+        calls = []
+        graph = _story_graph(DiskCache(os.path.join(tmp, "stages.sqlite")), calls)
+
+        _run(graph, image)
+        again = _run(graph, copy)
+        assert again.status['description'] == CACHED and again.status['content'] == CACHED
+
+        # Sin el archivo: basta la huella guardada en la historia
+        os.remove(image)
+        os.remove(copy)
+        stored = graph.run('description', {'image_path': None, 'mode': 'direct'},
+                           fingerprints={'image_path': again.fingerprints['image_path']})
+        assert stored['description'] == "descripción de temp_foto.jpg"
+        assert calls == ['description', 'content']
+
+    print("✅ Stages are keyed by image content")
+    return True
+
+
+def test_refresh_and_given_values():
+    """Test that "Regenerar" recomputes content and known stages are not recomputed"""
+    print("🧪 Testing refresh and given values...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image = os.path.join(tmp, "foto.jpg")
+        with open(image, "wb") as f:
+            f.write(b"pixeles")
+        calls = []
+        graph = _story_graph(DiskCache(os.path.join(tmp, "stages.sqlite")), calls)
+        first = _run(graph, image)
+
+        refreshed = graph.run('content', {'image_path': image, 'mode': 'direct', 'user_specs': first['user_specs']},
+                              fingerprints={'image_path': first.fingerprints['image_path']}, refresh=['content'])
+        assert refreshed.status['description'] == CACHED and refreshed.status['content'] == COMPUTED
+
+        # Fan-out: la descripción entra ya calculada, con la huella de su etapa
+        variant = graph.run('content', {'description': first['description'], 'user_specs': first['user_specs']},
+                            fingerprints={'description': first.fingerprints['description']})
+        assert variant.status['description'] == GIVEN and variant.status['content'] == CACHED
+        assert calls == ['description', 'content', 'content']
+
+    print("✅ Refresh and given values work")
+    return True
+
+
+def test_key_includes_prompt_and_llm():
+    """Test that editing the rendered prompt or the LLM config misses the cache and old entries expire"""
+    print("🧪 Testing prompt and LLM in the content key...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image = os.path.join(tmp, "foto.jpg")
+        with open(image, "wb") as f:
+            f.write(b"pixeles")
+        calls = []
+        config = {'template': "Crea un post para {platform}", 'llm': {'model': "gemini-2.5-flash", 'temperature': 0.0}}
+        cache = DiskCache(os.path.join(tmp, "stages.sqlite"), ttl_seconds=3600)
+        graph = _story_graph(cache, calls)
+        # Como StoryPipeline.content_stage_key: plantilla de la tarea de la plataforma y LLM
+        graph.stages['content'].key_fn = lambda values: {
+            'template': config['template'].format(**values['user_specs']),
+            'llm': config['llm']
+        }
+
+        _run(graph, image)
+        assert _run(graph, image).status['content'] == CACHED
+
+        config['template'] = "Crea un post breve para {platform}"
+        assert _run(graph, image).status['content'] == COMPUTED
+        config['llm'] = {'model': "gemini-2.5-flash", 'temperature': 0.7}
+        edited = _run(graph, image)
+        assert edited.status['content'] == COMPUTED and edited.status['description'] == CACHED
+        assert calls == ['description', 'content', 'content', 'content']
+
+        # Pasado el TTL la salida ya no se sirve aunque la clave coincida
+        cache.ttl_seconds = 0
+        assert _run(graph, image).status['content'] == COMPUTED
+
+    print("✅ Prompt and LLM changes invalidate content")
+    return True
+
+
+def main():
+    """Run all stage graph tests"""
+    print("🧪 Running stage graph tests...\n")
+
+    tests = [
+        test_only_changed_stages_rerun,
+        test_fingerprint_follows_content_not_path,
+        test_refresh_and_given_values,
+        test_key_includes_prompt_and_llm
+    ]
+
+    passed = 0
+    for test in tests:
+        try:
+            if test():
+                passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e}")
+
+    print(f"\n📊 Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
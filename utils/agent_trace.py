@@ -0,0 +1,239 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from crewai.events import (
+    crewai_event_bus,
+    TaskStartedEvent,
+    TaskCompletedEvent,
+    TaskFailedEvent,
+    ToolUsageStartedEvent,
+    ToolUsageFinishedEvent,
+    ToolUsageErrorEvent,
+    LLMCallStartedEvent,
+    LLMCallCompletedEvent,
+    LLMCallFailedEvent,
+)
+
+# on_step(agente, tarea, estado) — mismo formato que el workflow de la interfaz
+StepCallback = Callable[[str, str, str], None]
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="milliseconds") if timestamp else None
+
+
+class AgentTrace:
+    """
+    Ejecución real de los agentes de una historia, construida a partir de los eventos de CrewAI:
+    inicio y fin de cada tarea, duración de cada herramienta y de cada llamada al LLM.
+    """
+
+    def __init__(self, on_step: Optional[StepCallback] = None):
+        self.on_step = on_step
+        self._lock = threading.Lock()
+        self.agents: Dict[str, Dict[str, Any]] = {}
+
+    def _agent(self, role: str) -> Dict[str, Any]:
+        entry = self.agents.get(role)
+        if entry is None:
+            entry = self.agents[role] = {
+                'agent': role, 'tasks': [], 'status': 'pending', 'started_at': None, 'finished_at': None,
+                'tools': [], 'llm_calls': 0, 'llm_seconds': 0.0, '_llm_started': None
+            }
+        return entry
+
+    def _notify(self, role: str, task: str, status: str):
+        if self.on_step is None:
+            return
+        try:
+            self.on_step(role, task, status)
+        except Exception:
+            # El bus de eventos de CrewAI se traga las excepciones de los handlers; una cancelación
+            # del trabajo se vuelve a comprobar en la siguiente llamada al LLM (CachedLLM.call)
+            pass
+
+    def task_started(self, role: str, task_name: str):
+        with self._lock:
+            entry = self._agent(role)
+            entry['tasks'].append(task_name)
+            entry['status'] = 'running'
+            entry['started_at'] = entry['started_at'] or time.time()
+        self._notify(role, f"Ejecutando {task_name}", "running")
+
+    def task_finished(self, role: str, error: Optional[str] = None):
+        with self._lock:
+            entry = self._agent(role)
+            entry['finished_at'] = time.time()
+            entry['status'] = 'failed' if error else 'completed'
+            if error:
+                entry['error'] = error
+            elapsed = entry['finished_at'] - (entry['started_at'] or entry['finished_at'])
+            llm_calls, tools = entry['llm_calls'], len(entry['tools'])
+        if error:
+            self._notify(role, f"Error: {error}", "failed")
+        else:
+            self._notify(role, f"Completado en {elapsed:.1f}s · {llm_calls} llamadas al LLM · {tools} herramientas", "completed")
+
+    def tool_started(self, role: str, tool_name: str):
+        self._notify(role, f"🔧 {tool_name}", "running")
+
+    def tool_finished(self, role: str, tool_name: str, started_at: Optional[datetime], finished_at: Optional[datetime],
+                      from_cache: bool = False, error: Optional[str] = None):
+        finished_at = finished_at or datetime.now()
+        duration = (finished_at - started_at).total_seconds() if started_at else None
+        with self._lock:
+            self._agent(role)['tools'].append({
+                'tool': tool_name,
+                'started_at': started_at.isoformat(timespec="milliseconds") if started_at else None,
+                'duration_s': round(duration, 3) if duration is not None else None,
+                'from_cache': from_cache,
+                'error': error
+            })
+        if duration is not None:
+            self._notify(role, f"🔧 {tool_name} ({duration:.1f}s)", "running")
+
+    def llm_started(self, role: str):
+        with self._lock:
+            entry = self._agent(role)
+            entry['_llm_started'] = time.perf_counter()
+            calls = entry['llm_calls'] + 1
+        self._notify(role, f"💭 Llamada al LLM #{calls}", "running")
+
+    def llm_finished(self, role: str):
+        with self._lock:
+            entry = self._agent(role)
+            entry['llm_calls'] += 1
+            if entry['_llm_started'] is not None:
+                entry['llm_seconds'] += time.perf_counter() - entry['_llm_started']
+                entry['_llm_started'] = None
+
+    @contextmanager
+    def stage(self, name: str, task: str):
+        """Paso que no ejecuta CrewAI (p. ej. BLIP directo), con el mismo registro de tiempos"""
+        self.task_started(name, task)
+        try:
+            yield
+        except Exception as e:
+            self.task_finished(name, error=str(e))
+            raise
+        self.task_finished(name)
+
+    def merge(self, other: "AgentTrace"):
+        """Añade los agentes de otra traza (p. ej. el análisis compartido del fan-out)"""
+        with other._lock:
+            agents = {role: dict(entry, tasks=list(entry['tasks']), tools=list(entry['tools']))
+                      for role, entry in other.agents.items()}
+        with self._lock:
+            for role, entry in agents.items():
+                self.agents.setdefault(role, entry)
+
+    def summary(self, token_usage: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Lista serializable por agente; los tokens salen del registro por tarea de utils.prompt_budget"""
+        task_tokens = (token_usage or {}).get('tasks', {})
+        with self._lock:
+            agents = [dict(entry, tasks=list(entry['tasks']), tools=list(entry['tools'])) for entry in self.agents.values()]
+
+        result = []
+        for entry in agents:
+            started, finished = entry.pop('started_at'), entry.pop('finished_at')
+            entry.pop('_llm_started')
+            # En el fan-out el análisis compartido aparece como "compartido:<tarea>"
+            usage = [task_tokens.get(task) or task_tokens.get(f"compartido:{task}", {}) for task in entry['tasks']]
+            result.append({
+                **entry,
+                'started_at': _iso(started),
+                'finished_at': _iso(finished),
+                'duration_s': round(finished - started, 3) if started and finished else None,
+                'llm_seconds': round(entry['llm_seconds'], 3),
+                'tool_seconds': round(sum(tool['duration_s'] or 0 for tool in entry['tools']), 3),
+                'prompt_tokens': sum(item.get('prompt_tokens', 0) for item in usage),
+                'completion_tokens': sum(item.get('completion_tokens', 0) for item in usage)
+            })
+        return sorted(result, key=lambda item: item['started_at'] or '')
+
+
+# Traza de la historia en curso; los eventos de CrewAI se emiten en el hilo que ejecuta el crew,
+# así que el contextvar (propagado con copy_context) identifica a qué historia pertenecen
+_current_trace: contextvars.ContextVar[Optional[AgentTrace]] = contextvars.ContextVar("agent_trace", default=None)
+
+
+@contextmanager
+def trace_agents(on_step: Optional[StepCallback] = None):
+    """Registra en una AgentTrace nueva los eventos de los crews ejecutados en el bloque"""
+    trace = AgentTrace(on_step)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def _task_role(task: Any) -> Optional[str]:
+    agent = getattr(task, "agent", None)
+    return getattr(agent, "role", None)
+
+
+@crewai_event_bus.on(TaskStartedEvent)
+def _on_task_started(source, event):
+    trace, role = _current_trace.get(), _task_role(event.task)
+    if trace and role:
+        trace.task_started(role, getattr(event.task, "name", None) or "tarea")
+
+
+@crewai_event_bus.on(TaskCompletedEvent)
+def _on_task_completed(source, event):
+    trace, role = _current_trace.get(), _task_role(event.task)
+    if trace and role:
+        trace.task_finished(role)
+
+
+@crewai_event_bus.on(TaskFailedEvent)
+def _on_task_failed(source, event):
+    trace, role = _current_trace.get(), _task_role(event.task)
+    if trace and role:
+        trace.task_finished(role, error=str(event.error))
+
+
+@crewai_event_bus.on(ToolUsageStartedEvent)
+def _on_tool_started(source, event):
+    trace = _current_trace.get()
+    if trace and event.agent_role:
+        trace.tool_started(event.agent_role, event.tool_name)
+
+
+@crewai_event_bus.on(ToolUsageFinishedEvent)
+def _on_tool_finished(source, event):
+    trace = _current_trace.get()
+    if trace and event.agent_role:
+        trace.tool_finished(event.agent_role, event.tool_name, event.started_at, event.finished_at, event.from_cache)
+
+
+@crewai_event_bus.on(ToolUsageErrorEvent)
+def _on_tool_error(source, event):
+    trace = _current_trace.get()
+    if trace and event.agent_role:
+        trace.tool_finished(event.agent_role, event.tool_name, None, None, error=str(event.error))
+
+
+@crewai_event_bus.on(LLMCallStartedEvent)
+def _on_llm_started(source, event):
+    trace = _current_trace.get()
+    if trace and event.agent_role:
+        trace.llm_started(event.agent_role)
+
+
+@crewai_event_bus.on(LLMCallCompletedEvent)
+def _on_llm_completed(source, event):
+    trace = _current_trace.get()
+    if trace and event.agent_role:
+        trace.llm_finished(event.agent_role)
+
+
+@crewai_event_bus.on(LLMCallFailedEvent)
+def _on_llm_failed(source, event):
+    trace = _current_trace.get()
+    if trace and getattr(event, "agent_role", None):
+        trace.llm_finished(event.agent_role)
@@ -3,6 +3,7 @@ import json
 import re
 from datetime import datetime
 from typing import Dict, List, Optional
+from utils.metrics import metrics
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -26,6 +27,7 @@ class FileManager:
         self.base_path = base_path
         os.makedirs(base_path, exist_ok=True)
     
+    @metrics.timed("file_save_json")
     def save_as_json(self, story_data: Dict, filename: str = None) -> str:
         """Guarda la historia como archivo JSON"""
         if not filename:
@@ -39,6 +41,7 @@ class FileManager:
         
         return filepath
     
+    @metrics.timed("file_save_markdown")
     def save_as_markdown(self, story_data: Dict, filename: str = None) -> str:
         """Guarda la historia como archivo Markdown"""
         if not filename:
@@ -80,6 +83,7 @@ class FileManager:
         
         return filepath
     
+    @metrics.timed("file_save_html")
     def save_as_html(self, story_data: Dict, filename: str = None) -> str:
         """Guarda la historia como archivo HTML"""
         if not filename:
@@ -196,6 +200,7 @@ class FileManager:
         
         return filepath
     
+    @metrics.timed("file_save_pdf")
     def save_as_pdf(self, story_data: Dict, filename: str = None) -> str:
         """Guarda la historia como archivo PDF"""
         if not filename:
@@ -0,0 +1,113 @@
+import hashlib
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from typing import Tuple, Union
+from PIL import Image, ImageOps
+
+# Tamaños de las variantes que usa la aplicación
+CAPTION_MIN_SIDE = 384          # BLIP redimensiona a 384x384
+PREVIEW_MAX_SIDE = 800          # Vista previa en Streamlit
+PUBLISH_SIZE = (1080, 1080)     # Publicación en Instagram
+
+_CACHE_MAX_ENTRIES = 8
+
+
+class IngestedImage:
+    """Imagen decodificada una sola vez con sus variantes para caption, vista previa y publicación"""
+
+    def __init__(self, fingerprint: str, original_size: Tuple[int, int],
+                 caption: Image.Image, preview: Image.Image, publish: Image.Image):
+        self.fingerprint = fingerprint
+        self.original_size = original_size
+        self.caption = caption
+        self.preview = preview
+        self.publish = publish
+
+    def preview_bytes(self, quality: int = 85) -> bytes:
+        """Vista previa codificada en JPEG para enviar al navegador"""
+        buffer = BytesIO()
+        self.preview.save(buffer, format="JPEG", quality=quality)
+        return buffer.getvalue()
+
+
+_cache: "OrderedDict[str, IngestedImage]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def ingest_image(source: Union[bytes, str]) -> IngestedImage:
+    """
+    source → bytes de la imagen o ruta en disco
+    Devuelve → IngestedImage (cacheada por hash del contenido)
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source)
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+
+    fingerprint = hashlib.sha256(data).hexdigest()
+    with _cache_lock:
+        cached = _cache.get(fingerprint)
+        if cached is not None:
+            _cache.move_to_end(fingerprint)
+            return cached
+
+    ingested = _decode_variants(data, fingerprint)
+
+    with _cache_lock:
+        _cache[fingerprint] = ingested
+        _cache.move_to_end(fingerprint)
+        while len(_cache) > _CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return ingested
+
+
+def load_for_caption(image_path: str) -> Image.Image:
+    """Variante pequeña lista para BLIP"""
+    return ingest_image(image_path).caption
+
+
+def _decode_variants(data: bytes, fingerprint: str) -> IngestedImage:
+    """Decodifica una vez al tamaño mínimo necesario y deriva todas las variantes"""
+    image = Image.open(BytesIO(data))
+    original_size = image.size
+
+    # La variante más grande es la de publicación; ningún lado debe quedar por debajo
+    target = max(PUBLISH_SIZE)
+    if image.format == "JPEG":
+        # El decodificador JPEG escala por potencias de 2 directamente (mucho más rápido que decodificar a tamaño completo)
+        image.draft("RGB", (target, target))
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGB")
+    image = _reduce_to(image, target)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    publish = image.resize(PUBLISH_SIZE, Image.LANCZOS)
+
+    preview = image.copy()
+    preview.thumbnail((PREVIEW_MAX_SIDE, PREVIEW_MAX_SIDE), Image.LANCZOS)
+
+    caption = _scale_min_side(image, CAPTION_MIN_SIDE)
+
+    return IngestedImage(fingerprint, original_size, caption, preview, publish)
+
+
+def _reduce_to(image: Image.Image, min_side: int) -> Image.Image:
+    """Reducción entera barata (reduce) manteniendo el lado menor >= min_side"""
+    factor = min(image.size) // min_side
+    if factor >= 2:
+        return image.reduce(factor)
+    return image
+
+
+def _scale_min_side(image: Image.Image, min_side: int) -> Image.Image:
+    """Escala manteniendo proporción para que el lado menor mida min_side (sin ampliar)"""
+    width, height = image.size
+    scale = min_side / min(width, height)
+    if scale >= 1:
+        return image.copy()
+    return image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.BICUBIC)
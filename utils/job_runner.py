@@ -0,0 +1,171 @@
+import os
+import time
+import uuid
+import threading
+import contextvars
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Se lanza dentro de un trabajo cuando el usuario lo cancela"""
+
+
+class Job:
+    """Trabajo en segundo plano con progreso, borrador en streaming y resultado consultables"""
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = QUEUED
+        self.progress: List[Dict[str, Any]] = []
+        self.draft: Optional[Dict[str, Any]] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._future: Optional[Future] = None
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_event.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def raise_if_cancelled(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.id)
+
+    def update_step(self, agent: str, task: str, status: str):
+        """Mismo formato que st.session_state.crew_workflow"""
+        step = {
+            'agent': agent,
+            'task': task,
+            'status': status,
+            'timestamp': datetime.now().strftime("%H:%M:%S")
+        }
+        with self._lock:
+            for i, existing in enumerate(self.progress):
+                if existing['agent'] == agent:
+                    self.progress[i] = step
+                    break
+            else:
+                self.progress.append(step)
+
+    def update_draft(self, fields: Dict[str, Any]):
+        with self._lock:
+            self.draft = dict(fields)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copia consistente del estado para pintarla desde el hilo de Streamlit"""
+        with self._lock:
+            elapsed_end = self.finished_at or time.time()
+            return {
+                'id': self.id,
+                'name': self.name,
+                'status': self.status,
+                'progress': [dict(step) for step in self.progress],
+                'draft': dict(self.draft) if self.draft else None,
+                'error': self.error,
+                'cancel_requested': self.cancel_requested,
+                'elapsed': elapsed_end - (self.started_at or elapsed_end)
+            }
+
+
+# Trabajo que se está ejecutando en el contexto actual (hilo del executor y sus hilos hijos)
+_current_job: contextvars.ContextVar[Optional[Job]] = contextvars.ContextVar("current_job", default=None)
+
+
+def current_job() -> Optional[Job]:
+    return _current_job.get()
+
+
+def check_cancelled():
+    """Punto de cancelación cooperativa (p. ej. antes de cada llamada al LLM)"""
+    job = _current_job.get()
+    if job is not None:
+        job.raise_if_cancelled()
+
+
+class JobRunner:
+    """Executor acotado compartido por todas las sesiones de Streamlit"""
+
+    def __init__(self, max_workers: int = 2, max_finished_jobs: int = 50):
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="story-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, name: str, fn: Callable[..., Any], *args, **kwargs) -> str:
+        """
+        Encola `fn(*args, **kwargs)` y devuelve el ID del trabajo.
+        Se ejecuta con una copia del contexto actual (modo de caché del LLM, etc.).
+        """
+        job = Job(name)
+        context = contextvars.copy_context()
+
+        def run():
+            if job.cancel_requested:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+            _current_job.set(job)
+            try:
+                job.result = fn(*args, **kwargs)
+                job.raise_if_cancelled()
+                job.status = COMPLETED
+            except JobCancelled:
+                job.status = CANCELLED
+            except Exception as e:
+                job.error = str(e)
+                job.status = FAILED
+            finally:
+                job.finished_at = time.time()
+
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        job._future = self._executor.submit(context.run, run)
+        return job.id
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancela un trabajo en cola o pide a uno en ejecución que se detenga en el siguiente punto seguro"""
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+        job._cancel_event.set()
+        if job._future is not None and job._future.cancel():
+            job.status = CANCELLED
+            job.finished_at = time.time()
+        return True
+
+    def forget(self, job_id: str):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _prune(self):
+        finished = sorted((job for job in self._jobs.values() if job.done), key=lambda job: job.finished_at or 0)
+        for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job.id]
+
+
+job_runner = JobRunner(max_workers=int(os.getenv("JOB_MAX_WORKERS", "2")))
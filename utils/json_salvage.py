@@ -0,0 +1,369 @@
+import re
+import ast
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from utils.llm_stream import IncrementalJSONReader
+
+# Campos que debe tener el contenido de cada plataforma (ver expected_output en crew/tasks.py)
+REQUIRED_FIELDS = {
+    'facebook': ['title', 'hook', 'body', 'call_to_action', 'full_text'],
+    'linkedin': ['title', 'hook', 'body', 'call_to_action', 'hashtags', 'full_text'],
+    'instagram': ['title', 'hook', 'body', 'call_to_action', 'hashtags', 'full_text'],
+    'twitter': ['title', 'main_tweet', 'hashtags', 'call_to_action', 'full_text'],
+}
+LIST_FIELDS = {'body', 'hashtags', 'thread'}
+# Campos que se piden al LLM por respuesta del agente (repartidos entre todas sus alternativas):
+# sin JSON faltan casi todos y repararlos uno a uno costaría más que la propia generación
+MAX_REPAIR_CALLS = 2
+
+FIELD_DESCRIPTIONS = {
+    'title': "un título breve para el post",
+    'hook': "un gancho inicial atractivo (una o dos frases)",
+    'body': "el cuerpo del post como lista de 2 a 4 párrafos cortos",
+    'call_to_action': "una llamada a la acción específica",
+    'hashtags': "una lista de 3 a 8 hashtags relevantes (cada uno empieza por #)",
+    'main_tweet': "el tweet principal (máximo 280 caracteres)",
+}
+
+_FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA_PATTERN = re.compile(r",\s*([\]}])")
+
+
+def platform_key(platform: str) -> str:
+    platform = (platform or '').lower()
+    return 'twitter' if platform.startswith('twitter') else platform
+
+
+def _balanced_object(text: str) -> Optional[str]:
+    """Primer objeto {...} completo del texto (ignora llaves dentro de strings)"""
+    start = text.find('{')
+    if start == -1:
+        return None
+    depth = 0
+    quote = None
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in ('"', "'"):
+            quote = char
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def _outside_strings(text: str, transform: Callable[[str], str]) -> str:
+    """Aplica `transform` solo al texto fuera de strings (mismo recorrido de comillas que _balanced_object)"""
+    parts = []
+    segment_start = 0
+    quote = None
+    escaped = False
+    for i, char in enumerate(text):
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == quote:
+                quote = None
+                parts.append(text[segment_start:i + 1])
+                segment_start = i + 1
+        elif char in ('"', "'"):
+            parts.append(transform(text[segment_start:i]))
+            quote = char
+            segment_start = i
+    tail = text[segment_start:]
+    parts.append(tail if quote else transform(tail))
+    return "".join(parts)
+
+
+def _python_literals(text: str) -> str:
+    return re.sub(r"\btrue\b", "True", re.sub(r"\bfalse\b", "False", re.sub(r"\bnull\b", "None", text)))
+
+
+def _loads(candidate: str) -> Optional[Dict[str, Any]]:
+    try:
+        data = json.loads(candidate)
+    except (json.JSONDecodeError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _loads_lenient(candidate: str) -> Optional[Dict[str, Any]]:
+    """Comas finales y comillas simples (estilo dict de Python); el texto de los strings no se toca"""
+    cleaned = _outside_strings(candidate, lambda text: _TRAILING_COMMA_PATTERN.sub(r"\1", text))
+    data = _loads(cleaned)
+    if data is not None:
+        return data
+    try:
+        data = ast.literal_eval(_outside_strings(cleaned, _python_literals))
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _close_truncated(text: str) -> Optional[Dict[str, Any]]:
+    """Cierra strings, arrays y objetos abiertos de un JSON cortado a mitad"""
+    start = text.find('{')
+    if start == -1:
+        return None
+    text = text[start:]
+
+    stack: List[str] = []
+    cut_points: List[Tuple[int, List[str]]] = []
+    in_string = False
+    escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            if stack:
+                stack.pop()
+            if not stack:
+                return _loads_lenient(text[:i + 1])
+        elif char == ',':
+            # Justo antes de una coma hay un valor completo: punto de corte seguro
+            cut_points.append((i, list(stack)))
+
+    # 1) Cerrar tal cual (p. ej. cortado dentro del último párrafo)
+    tail = text.rstrip()
+    if in_string:
+        if escaped:
+            tail = tail[:-1]
+        tail += '"'
+    data = _loads_lenient(tail + ''.join(reversed(stack)))
+    if data is not None:
+        return data
+
+    # 2) Retroceder al último valor completo
+    for position, open_stack in reversed(cut_points[-20:]):
+        data = _loads_lenient(text[:position] + ''.join(reversed(open_stack)))
+        if data is not None:
+            return data
+    return None
+
+
+def extract_json_object(text: str) -> Tuple[Optional[Dict[str, Any]], str]:
+    """
+    Extrae el objeto JSON de la salida de un agente.
+    Devuelve (datos, método) donde método indica qué reparación hizo falta:
+    json, fenced, embedded, lenient, truncated, fields o none.
+    """
+    text = (text or '').strip()
+
+    data = _loads(text)
+    if data is not None:
+        return data, 'json'
+
+    for block in _FENCE_PATTERN.findall(text):
+        data = _loads(block.strip())
+        if data is not None:
+            return data, 'fenced'
+
+    obj = _balanced_object(text)
+    if obj is not None:
+        data = _loads(obj)
+        if data is not None:
+            return data, 'embedded'
+        data = _loads_lenient(obj)
+        if data is not None:
+            return data, 'lenient'
+
+    data = _loads_lenient(text)
+    if data is not None:
+        return data, 'lenient'
+
+    # Bloque ```json sin cerrar o respuesta cortada por max_tokens
+    unfenced = re.sub(r"^.*?```(?:json|JSON)?", "", text, count=1, flags=re.DOTALL) if '```' in text else text
+    data = _close_truncated(unfenced)
+    if data is not None:
+        return data, 'truncated'
+
+    reader = IncrementalJSONReader()
+    fields = reader.feed(text)
+    if fields:
+        return fields, 'fields'
+
+    return None, 'none'
+
+
+def normalize_content(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Asegura tipos de lista en body/hashtags/thread"""
+    content = dict(data)
+    for field in LIST_FIELDS:
+        value = content.get(field)
+        if isinstance(value, str):
+            if field == 'hashtags':
+                content[field] = [tag for tag in re.split(r"[\s,]+", value) if tag.startswith('#')]
+            else:
+                content[field] = [part.strip() for part in re.split(r"\n\s*\n", value) if part.strip()]
+    return content
+
+
+def missing_fields(content: Dict[str, Any], platform: str) -> List[str]:
+    return [field for field in REQUIRED_FIELDS.get(platform_key(platform), ['title', 'full_text'])
+            if not content.get(field)]
+
+
+def compose_full_text(content: Dict[str, Any]) -> str:
+    """Reconstruye el texto completo a partir de las secciones (sin llamar al LLM)"""
+    parts = [content.get('hook') or content.get('main_tweet')]
+    parts += list(content.get('body') or content.get('thread') or [])
+    parts.append(content.get('call_to_action'))
+    if content.get('hashtags'):
+        parts.append(' '.join(content['hashtags']))
+    return '\n\n'.join(part for part in parts if part)
+
+
+def repair_field(llm: Any, field: str, content: Dict[str, Any], platform: str, raw_text: str) -> Any:
+    """Pide al LLM únicamente el campo que falta, con el resto del contenido como contexto"""
+    context = json.dumps({k: v for k, v in content.items() if v}, ensure_ascii=False) if content else raw_text[:2000]
+    example = '["..."]' if field in LIST_FIELDS else '"..."'
+    prompt = (
+        f"Este es el contenido de un post para {platform}:\n{context}\n\n"
+        f"Falta el campo \"{field}\": {FIELD_DESCRIPTIONS.get(field, field)}. "
+        f"Mantén el idioma y el tono del contenido. "
+        f"Responde únicamente con JSON válido de la forma {{\"{field}\": {example}}}"
+    )
+    data, _ = extract_json_object(str(llm.call(prompt)))
+    if not data:
+        return None
+    return normalize_content(data).get(field)
+
+
+class SalvageStats:
+    """Contadores por proceso de cómo se obtuvo el JSON de cada historia"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.methods: Dict[str, int] = {}
+        self.repair_calls = 0
+        self.repaired_fields = 0
+        self.stubs = 0
+
+    def record(self, method: str, repair_calls: int, repaired_fields: int, stub: bool):
+        with self._lock:
+            self.methods[method] = self.methods.get(method, 0) + 1
+            self.repair_calls += repair_calls
+            self.repaired_fields += repaired_fields
+            self.stubs += int(stub)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.methods.values())
+            needed_salvage = total - self.methods.get('json', 0)
+            salvaged = needed_salvage - self.stubs
+            return {
+                'total': total,
+                'methods': dict(self.methods),
+                'needed_salvage': needed_salvage,
+                'salvaged': salvaged,
+                'salvage_rate': salvaged / needed_salvage if needed_salvage else 1.0,
+                'repair_calls': self.repair_calls,
+                'repaired_fields': self.repaired_fields,
+                'stubs': self.stubs
+            }
+
+
+salvage_stats = SalvageStats()
+
+
+def complete_content(content: Dict[str, Any], platform: str, raw_text: str, llm: Any = None,
+                     max_repair_calls: Optional[int] = None) -> Tuple[Dict[str, Any], List[str], int, bool]:
+    """
+    Completa el contenido ya extraído: pide al LLM los campos que falten (como mucho `max_repair_calls`),
+    reconstruye full_text y pone un título por defecto. No registra estadísticas: eso se hace una vez
+    por respuesta del agente. Devuelve (contenido, campos reparados, llamadas al LLM, si quedó sin título).
+    """
+    content = normalize_content(content)
+    if not content:
+        # Sin estructura: el texto del agente es el post completo
+        content = {'full_text': raw_text.strip()}
+
+    repaired = []
+    repair_calls = 0
+    for field in missing_fields(content, platform):
+        if field == 'full_text':
+            continue
+        if llm is None or (max_repair_calls is not None and repair_calls >= max_repair_calls):
+            break
+        repair_calls += 1
+        try:
+            value = repair_field(llm, field, content, platform, raw_text)
+        except Exception:
+            value = None
+        if value:
+            content[field] = value
+            repaired.append(field)
+
+    if not content.get('full_text'):
+        content['full_text'] = compose_full_text(content) or raw_text.strip()
+        repaired.append('full_text')
+
+    stub = not content.get('title')
+    if stub:
+        content['title'] = 'Historia Generada'
+    return content, repaired, repair_calls, stub
+
+
+def salvage_story_content(raw_text: str, platform: str, llm: Any = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Convierte la salida del agente de contenido en el dict de la historia.
+    Devuelve (contenido, informe) con el método usado y los campos reparados.
+    """
+    data, method = extract_json_object(raw_text)
+    content, repaired, repair_calls, stub = complete_content(
+        data or {}, platform, raw_text, llm=llm, max_repair_calls=MAX_REPAIR_CALLS
+    )
+    salvage_stats.record(method, repair_calls, len(repaired), stub)
+    return content, {'method': method, 'repaired_fields': repaired, 'repair_calls': repair_calls}
+
+
+def salvage_candidates(raw_text: str, platform: str, llm: Any = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Como salvage_story_content, para una respuesta {"candidates": [...]} con varias alternativas.
+    Si el modelo devolvió un único post (o texto sin estructura), se trata como una sola alternativa.
+    Entre todas las alternativas se piden como mucho MAX_REPAIR_CALLS campos al LLM. Las estadísticas
+    cuentan la respuesta una vez, con el método de extracción de la respuesta completa.
+    """
+    data, method = extract_json_object(raw_text)
+    candidates = [item for item in (data or {}).get('candidates') or [] if isinstance(item, dict)]
+    if not candidates:
+        content, repaired, repair_calls, stub = complete_content(
+            data or {}, platform, raw_text, llm=llm, max_repair_calls=MAX_REPAIR_CALLS
+        )
+        salvage_stats.record(method, repair_calls, len(repaired), stub)
+        return [content], {'method': method, 'repaired_fields': repaired, 'repair_calls': repair_calls, 'candidates': 1}
+
+    contents, repaired, repair_calls, stubs = [], [], 0, False
+    for candidate in candidates:
+        content, fields, calls, stub = complete_content(
+            candidate, platform, json.dumps(candidate, ensure_ascii=False), llm=llm,
+            max_repair_calls=MAX_REPAIR_CALLS - repair_calls
+        )
+        contents.append(content)
+        repaired.append(fields)
+        repair_calls += calls
+        stubs = stubs or stub
+    salvage_stats.record(method, repair_calls, sum(len(fields) for fields in repaired), stubs)
+    return contents, {'method': method, 'repaired_fields': repaired, 'repair_calls': repair_calls, 'candidates': len(contents)}
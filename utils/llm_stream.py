@@ -0,0 +1,139 @@
+import re
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from crewai.events import crewai_event_bus, LLMCallStartedEvent, LLMStreamChunkEvent
+
+# Campos del JSON de contenido que se muestran mientras se generan
+# (Twitter/X no tiene hook ni body: main_tweet y thread ocupan su lugar)
+STREAM_FIELDS = ("title", "hook", "body", "main_tweet", "thread", "call_to_action")
+
+_FIELD_PATTERN = re.compile(r'"(%s)"\s*:\s*' % "|".join(STREAM_FIELDS))
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+def _read_string(buffer: str, start: int) -> Tuple[str, int, bool]:
+    """
+    Lee un string JSON que empieza en `start` (justo después de la comilla).
+    Devuelve (texto, posición siguiente, cerrado). Tolera que el buffer termine a mitad.
+    """
+    chars = []
+    i = start
+    while i < len(buffer):
+        char = buffer[i]
+        if char == '"':
+            return "".join(chars), i + 1, True
+        if char == '\\':
+            if i + 1 >= len(buffer):
+                break
+            escape = buffer[i + 1]
+            if escape == 'u':
+                code = buffer[i + 2:i + 6]
+                if len(code) < 4:
+                    break
+                try:
+                    chars.append(chr(int(code, 16)))
+                except ValueError:
+                    chars.append(code)
+                i += 6
+                continue
+            chars.append(_ESCAPES.get(escape, escape))
+            i += 2
+            continue
+        chars.append(char)
+        i += 1
+    return "".join(chars), len(buffer), False
+
+
+def _read_string_array(buffer: str, start: int) -> List[str]:
+    """Lee los strings (completos o el último a medias) de un array JSON"""
+    items = []
+    i = start
+    while i < len(buffer):
+        char = buffer[i]
+        if char == ']':
+            break
+        if char == '"':
+            text, i, closed = _read_string(buffer, i + 1)
+            items.append(text)
+            if not closed:
+                break
+            continue
+        i += 1
+    return items
+
+
+class IncrementalJSONReader:
+    """
+    Extrae los campos de STREAM_FIELDS de un JSON que llega por trozos
+    (los arrays como body o thread, string a string).
+
+    No necesita que el JSON esté completo ni que sea el único texto de la
+    respuesta (el agente puede escribir "Thought: ..." o un bloque ```json antes).
+    """
+
+    def __init__(self):
+        self.buffer = ""
+
+    def reset(self):
+        self.buffer = ""
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        self.buffer += chunk
+        return self.fields()
+
+    def fields(self) -> Dict[str, Any]:
+        result = {}
+        for match in _FIELD_PATTERN.finditer(self.buffer):
+            name = match.group(1)
+            if name in result:
+                continue
+            position = match.end()
+            if position >= len(self.buffer):
+                continue
+            if self.buffer[position] == '"':
+                result[name] = _read_string(self.buffer, position + 1)[0]
+            elif self.buffer[position] == '[':
+                result[name] = _read_string_array(self.buffer, position + 1)
+        return result
+
+
+# Suscripciones por hilo: CrewAI emite los eventos en el hilo que llama al LLM,
+# así cada sesión de Streamlit solo recibe los trozos de su propia ejecución
+_local = threading.local()
+
+
+@crewai_event_bus.on(LLMCallStartedEvent)
+def _on_llm_call_started(source, event):
+    subscription = getattr(_local, "subscription", None)
+    if subscription and subscription.matches(event):
+        # Un reintento del agente empieza una respuesta nueva
+        subscription.reader.reset()
+
+
+@crewai_event_bus.on(LLMStreamChunkEvent)
+def _on_llm_chunk(source, event):
+    subscription = getattr(_local, "subscription", None)
+    if subscription and subscription.matches(event):
+        subscription.callback(subscription.reader.feed(event.chunk))
+
+
+class _Subscription:
+    def __init__(self, task: Any, callback: Callable[[Dict[str, Any]], None]):
+        self.task_id = str(task.id) if task is not None else None
+        self.callback = callback
+        self.reader = IncrementalJSONReader()
+
+    def matches(self, event) -> bool:
+        return self.task_id is None or getattr(event, "task_id", None) in (None, self.task_id)
+
+
+@contextmanager
+def stream_task_output(task: Optional[Any], callback: Callable[[Dict[str, Any]], None]):
+    """Llama a `callback(campos)` con cada trozo que el LLM genera para `task` en este hilo"""
+    previous = getattr(_local, "subscription", None)
+    _local.subscription = _Subscription(task, callback)
+    try:
+        yield
+    finally:
+        _local.subscription = previous
@@ -0,0 +1,180 @@
+import os
+import time
+import threading
+import functools
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+# Muestras recientes por etapa sobre las que se calculan los percentiles
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1000"))
+METRICS_EXPORT_PATH = os.getenv("METRICS_EXPORT_PATH", os.path.join(".cache", "metrics.prom"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class LatencyHistogram:
+    """Duraciones de una etapa: totales acumulados y ventana reciente para los percentiles"""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float, error: bool = False):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, fraction: float) -> float:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class MetricsRegistry:
+    """Registro de latencias por etapa compartido por todo el proceso"""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages: Dict[str, LatencyHistogram] = {}
+
+    def observe(self, stage: str, seconds: float, error: bool = False):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = LatencyHistogram(self.window)
+            histogram.observe(seconds, error)
+
+    @contextmanager
+    def span(self, stage: str):
+        """Mide el bloque; si lanza una excepción la duración se cuenta también como error"""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - start, error)
+
+    def timed(self, stage: str, failed: Optional[Callable[[Any], bool]] = None) -> Callable:
+        """
+        Decorador equivalente a envolver la función en `span(stage)`. Para funciones que informan
+        del fallo en el valor devuelto en vez de lanzar, `failed(resultado)` decide si cuenta como error.
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                error = True
+                try:
+                    result = fn(*args, **kwargs)
+                    error = failed is not None and bool(failed(result))
+                    return result
+                finally:
+                    self.observe(stage, time.perf_counter() - start, error)
+            return wrapper
+        return decorator
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """{etapa: {count, errors, mean, p50, p95, p99, max}} en segundos"""
+        with self._lock:
+            result = {}
+            for stage, histogram in sorted(self._stages.items()):
+                result[stage] = {
+                    'count': histogram.count,
+                    'errors': histogram.errors,
+                    'mean': histogram.total / histogram.count if histogram.count else 0.0,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'p99': histogram.quantile(0.99),
+                    'max': max(histogram.samples) if histogram.samples else 0.0
+                }
+            return result
+
+    def prometheus_text(self) -> str:
+        """Exposición en formato de texto de Prometheus (tipo summary)"""
+        lines = [
+            "# HELP story_stage_latency_seconds Latencia por etapa de la generación de historias",
+            "# TYPE story_stage_latency_seconds summary"
+        ]
+        errors = [
+            "# HELP story_stage_errors_total Ejecuciones de la etapa que terminaron con excepción",
+            "# TYPE story_stage_errors_total counter"
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._stages.items()):
+                for fraction in QUANTILES:
+                    lines.append(
+                        f'story_stage_latency_seconds{{stage="{stage}",quantile="{fraction}"}} {histogram.quantile(fraction):.6f}'
+                    )
+                lines.append(f'story_stage_latency_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'story_stage_latency_seconds_count{{stage="{stage}"}} {histogram.count}')
+                errors.append(f'story_stage_errors_total{{stage="{stage}"}} {histogram.errors}')
+        return "\n".join(lines + errors) + "\n"
+
+    def write_prometheus(self, path: Optional[str] = None) -> str:
+        """Escribe la exposición en un fichero (escritura atómica, apto para el textfile collector)"""
+        path = path or METRICS_EXPORT_PATH
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        return path
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+metrics = MetricsRegistry()
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, registry: MetricsRegistry = metrics) -> Optional[ThreadingHTTPServer]:
+    """
+    Sirve /metrics en localhost desde un hilo daemon. Idempotente: Streamlit vuelve
+    a ejecutar main.py en cada rerun y el servidor solo debe arrancar una vez.
+    """
+    global _server
+    if port <= 0:
+        return None
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+            except OSError as e:
+                print(f"⚠️ No se pudo abrir el endpoint de métricas en el puerto {port}: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
@@ -0,0 +1,229 @@
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from utils.json_salvage import extract_json_object, normalize_content, compose_full_text, platform_key
+from utils.prompt_budget import compact_json
+
+# Reglas por plataforma (ver las instrucciones de cada tarea en crew/tasks.py):
+#   max_chars: límite del texto completo · tweet_chars: límite de cada tweet
+#   hashtags: (mínimo, máximo) · emoji_per_word: densidad máxima de emojis
+PLATFORM_RULES = {
+    'facebook': {'max_chars': 63206, 'hashtags': (0, 5), 'emoji_per_word': 0.15},
+    'linkedin': {'max_chars': 3000, 'hashtags': (3, 5), 'emoji_per_word': 0.05},
+    'instagram': {'max_chars': 2200, 'hashtags': (5, 30), 'emoji_per_word': 0.2},
+    'twitter': {'tweet_chars': 280, 'hashtags': (1, 3), 'emoji_per_word': 0.15},
+}
+
+_EMOJI_PATTERN = re.compile("[\U0001F1E6-\U0001F1FF\U0001F300-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF]\uFE0F?")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?…])\s+")
+_HASHTAG_INVALID = re.compile(r"[^\w]", re.UNICODE)
+
+# Campos de texto en los que se cuentan (y recortan) los emojis, en orden de lectura
+TEXT_FIELDS = ('hook', 'main_tweet', 'body', 'thread', 'call_to_action')
+
+
+def rules_for(platform: str) -> Dict[str, Any]:
+    return PLATFORM_RULES.get(platform_key(platform), PLATFORM_RULES['facebook'])
+
+
+def count_emojis(text: str) -> int:
+    return len(_EMOJI_PATTERN.findall(text or ""))
+
+
+def normalize_hashtags(hashtags: List[str]) -> List[str]:
+    """'#Playa', 'playa ' y '#playa!' son el mismo hashtag: se normalizan y se quitan duplicados"""
+    result, seen = [], set()
+    for tag in hashtags or []:
+        word = _HASHTAG_INVALID.sub("", str(tag))
+        if word and word.lower() not in seen:
+            seen.add(word.lower())
+            result.append(f"#{word}")
+    return result
+
+
+def split_tweets(text: str, limit: int) -> List[str]:
+    """Parte un texto en tweets de hasta `limit` caracteres por frases (y por palabras si hace falta)"""
+    pieces = []
+    for sentence in _SENTENCE_PATTERN.split(text.strip()):
+        if len(sentence) <= limit:
+            pieces.append(sentence)
+            continue
+        for word in sentence.split():
+            pieces += [word[i:i + limit] for i in range(0, len(word), limit)]
+
+    tweets, current = [], ""
+    for piece in pieces:
+        candidate = f"{current} {piece}" if current else piece
+        if len(candidate) <= limit:
+            current = candidate
+        else:
+            tweets.append(current)
+            current = piece
+    if current:
+        tweets.append(current)
+    return tweets
+
+
+def _text_values(content: Dict[str, Any]) -> List[str]:
+    values = []
+    for field in TEXT_FIELDS:
+        value = content.get(field)
+        values += value if isinstance(value, list) else [value] if value else []
+    return values
+
+
+def validate_content(content: Dict[str, Any], platform: str) -> List[Dict[str, Any]]:
+    """Incumplimientos de las reglas de la plataforma: [{'rule', 'message', ...}]"""
+    rules = rules_for(platform)
+    issues = []
+
+    if 'tweet_chars' in rules:
+        limit = rules['tweet_chars']
+        tweets = [content.get('main_tweet') or ""] + list(content.get('thread') or [])
+        long_tweets = [i for i, tweet in enumerate(tweets) if len(tweet) > limit]
+        if long_tweets:
+            issues.append({'rule': 'tweet_chars', 'message': f"{len(long_tweets)} tweets superan {limit} caracteres"})
+    elif len(content.get('full_text') or "") > rules['max_chars']:
+        issues.append({'rule': 'max_chars',
+                       'message': f"El texto tiene {len(content['full_text'])} caracteres (máximo {rules['max_chars']})"})
+
+    minimum, maximum = rules['hashtags']
+    hashtags = content.get('hashtags') or []
+    if hashtags != normalize_hashtags(hashtags):
+        issues.append({'rule': 'hashtag_format', 'message': "Hashtags repetidos o con caracteres no válidos"})
+    count = len(normalize_hashtags(hashtags))
+    if count > maximum:
+        issues.append({'rule': 'hashtags_max', 'message': f"{count} hashtags (máximo {maximum})"})
+    elif count < minimum:
+        issues.append({'rule': 'hashtags_min', 'message': f"{count} hashtags (mínimo {minimum})"})
+
+    text = " ".join(_text_values(content))
+    words = max(len(text.split()), 1)
+    emojis = count_emojis(text)
+    if emojis > int(words * rules['emoji_per_word']) and emojis > 1:
+        issues.append({'rule': 'emoji_density', 'message': f"{emojis} emojis en {words} palabras"})
+
+    return issues
+
+
+def _strip_emojis(value: str, keep: int) -> Tuple[str, int]:
+    """Conserva los primeros `keep` emojis del texto; devuelve (texto, emojis conservados)"""
+    kept = 0
+
+    def replace(match):
+        nonlocal kept
+        if kept < keep:
+            kept += 1
+            return match.group(0)
+        return ""
+
+    return re.sub(r"[ \t]{2,}", " ", _EMOJI_PATTERN.sub(replace, value)).strip(), kept
+
+
+def fix_locally(content: Dict[str, Any], platform: str) -> Tuple[Dict[str, Any], List[str]]:
+    """Corrige lo que no necesita al LLM; devuelve (contenido, reglas corregidas)"""
+    rules = rules_for(platform)
+    issues = {issue['rule'] for issue in validate_content(content, platform)}
+    content = dict(content)
+    fixed = []
+
+    if issues & {'hashtag_format', 'hashtags_max'}:
+        content['hashtags'] = normalize_hashtags(content.get('hashtags'))[:rules['hashtags'][1]]
+        fixed += sorted(issues & {'hashtag_format', 'hashtags_max'})
+
+    if 'emoji_density' in issues:
+        words = len(" ".join(_text_values(content)).split())
+        remaining = max(int(words * rules['emoji_per_word']), 1)
+        for field in TEXT_FIELDS:
+            value = content.get(field)
+            if isinstance(value, list):
+                content[field] = []
+                for item in value:
+                    item, kept = _strip_emojis(item, remaining)
+                    remaining -= kept
+                    content[field].append(item)
+            elif value:
+                content[field], kept = _strip_emojis(value, remaining)
+                remaining -= kept
+        fixed.append('emoji_density')
+
+    if 'tweet_chars' in issues:
+        limit = rules['tweet_chars']
+        tweets = []
+        for tweet in [content.get('main_tweet') or ""] + list(content.get('thread') or []):
+            tweets += split_tweets(tweet, limit) if len(tweet) > limit else [tweet]
+        content['main_tweet'], content['thread'] = tweets[0], tweets[1:]
+        fixed.append('tweet_chars')
+
+    if fixed:
+        content['full_text'] = compose_full_text(content)
+
+    if 'max_chars' in issues or len(content.get('full_text') or "") > rules.get('max_chars', float('inf')):
+        # El full_text del modelo puede traer relleno que las secciones no tienen
+        composed = compose_full_text(content)
+        if composed and len(composed) <= rules['max_chars']:
+            content['full_text'] = composed
+            fixed.append('max_chars')
+
+    return content, fixed
+
+
+def _llm_repair(llm: Any, content: Dict[str, Any], platform: str, rule: str) -> Optional[Dict[str, Any]]:
+    """Una sola llamada dirigida para la regla que no se pudo corregir localmente"""
+    rules = rules_for(platform)
+    context = compact_json({key: value for key, value in content.items() if key != 'full_text' and value})
+    if rule == 'hashtags_min':
+        minimum, maximum = rules['hashtags']
+        field, example = 'hashtags', '["#..."]'
+        request = f"Devuelve entre {minimum} y {maximum} hashtags relevantes para este post (cada uno empieza por #)."
+    elif rule == 'max_chars':
+        field, example = 'body', '["..."]'
+        request = (f"El post supera los {rules['max_chars']} caracteres de {platform}. Acorta el cuerpo (body) "
+                   f"manteniendo el mensaje, el idioma y el tono, para que el post completo quepa en el límite.")
+    else:
+        return None
+
+    prompt = (
+        f"Este es el contenido de un post para {platform}:\n{context}\n\n{request} "
+        f"Responde únicamente con JSON válido de la forma {{\"{field}\": {example}}}"
+    )
+    data, _ = extract_json_object(str(llm.call(prompt)))
+    value = normalize_content(data or {}).get(field)
+    if not value:
+        return None
+    repaired = dict(content, **{field: value})
+    repaired['full_text'] = compose_full_text(repaired)
+    return repaired
+
+
+def enforce_platform_rules(content: Dict[str, Any], platform: str, llm: Any = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Valida y corrige el contenido según las reglas de la plataforma. Lo que se puede corregir
+    localmente (hashtags sobrantes, emojis, tweets largos) no llega al LLM; solo lo que no
+    (faltan hashtags, el texto sigue sin caber) recibe una llamada dirigida, una por regla.
+    """
+    started = time.perf_counter()
+    issues = validate_content(content, platform)
+    content, fixed = fix_locally(content, platform)
+    local_ms = (time.perf_counter() - started) * 1000
+
+    llm_repairs = []
+    remaining = validate_content(content, platform)
+    if llm is not None:
+        for issue in remaining:
+            try:
+                repaired = _llm_repair(llm, content, platform, issue['rule'])
+            except Exception:
+                repaired = None
+            if repaired is not None:
+                content, _ = fix_locally(repaired, platform)
+                llm_repairs.append(issue['rule'])
+        remaining = validate_content(content, platform)
+
+    return content, {
+        'issues': [issue['rule'] for issue in issues],
+        'fixed_locally': fixed,
+        'llm_repairs': llm_repairs,
+        'remaining': remaining,
+        'local_ms': round(local_ms, 3)
+    }
@@ -0,0 +1,174 @@
+import os
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional
+from litellm.integrations.custom_logger import CustomLogger
+from utils.rate_limiter import estimate_tokens
+
+# Presupuesto para el contexto que se interpola en cada tarea (descripción de imagen, historia, ...)
+PROMPT_CONTEXT_BUDGET = int(os.getenv("PROMPT_CONTEXT_BUDGET", "1500"))
+PROMPT_BUDGET_MODE = os.getenv("PROMPT_BUDGET_MODE", "warn").lower()  # warn | truncate
+
+# Claves de user_specs que las tareas de contenido ya muestran en su propia línea
+RENDERED_SPEC_KEYS = ("platform", "tone", "additional_specs", "candidates")
+
+# Campos de la historia que necesita cada tarea; el resto (metadatos, informes) no llega al prompt
+STORAGE_FIELDS = ("id", "edited_from", "content", "platform", "tone", "image_url", "user_specs", "original_filename")
+PUBLISH_FIELDS = ("content", "platform", "image_url")
+
+TRUNCATION_MARK = " […]"
+
+
+def compact_json(data: Any) -> str:
+    """JSON sin espacios ni escapes ASCII: bastantes menos tokens que el repr de un dict"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def extra_user_specs(user_specs: Dict[str, Any]) -> str:
+    """Especificaciones que no tienen línea propia en el prompt (vacío si no hay ninguna)"""
+    extra = {
+        key: value for key, value in user_specs.items()
+        if key not in RENDERED_SPEC_KEYS and value not in (None, "", [], {})
+    }
+    return compact_json(extra) if extra else ""
+
+
+def compact_story_data(story_data: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+    """Solo los campos que necesita la tarea, sin metadatos de generación ni valores vacíos"""
+    return {key: story_data[key] for key in fields if story_data.get(key) not in (None, "", [], {})}
+
+
+class BudgetStats:
+    """Cuántos bloques de contexto superaron el presupuesto (y cuántos se recortaron)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.over_budget = 0
+        self.truncated = 0
+
+    def record(self, over: bool, truncated: bool):
+        with self._lock:
+            self.checked += 1
+            self.over_budget += over
+            self.truncated += truncated
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"checked": self.checked, "over_budget": self.over_budget, "truncated": self.truncated}
+
+
+budget_stats = BudgetStats()
+
+
+def fit_to_budget(text: str, label: str, budget: Optional[int] = None, mode: Optional[str] = None) -> str:
+    """
+    Comprueba un bloque de contexto contra el presupuesto de tokens.
+    En modo `warn` solo avisa; en modo `truncate` lo recorta al presupuesto.
+    """
+    budget = PROMPT_CONTEXT_BUDGET if budget is None else budget
+    mode = mode or PROMPT_BUDGET_MODE
+    tokens = estimate_tokens(text)
+    if budget <= 0 or tokens <= budget:
+        budget_stats.record(over=False, truncated=False)
+        return text
+
+    truncate = mode == "truncate"
+    budget_stats.record(over=True, truncated=truncate)
+    if not truncate:
+        print(f"⚠️ Prompt: '{label}' ocupa ~{tokens} tokens (presupuesto {budget})")
+        return text
+
+    print(f"✂️ Prompt: '{label}' recortado de ~{tokens} a {budget} tokens")
+    # Misma relación de ~4 caracteres por token que estimate_tokens
+    return text[:budget * 4].rstrip() + TRUNCATION_MARK
+
+
+class TokenLedger:
+    """Tokens de prompt y de respuesta por tarea durante la generación de una historia"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.tasks: Dict[str, Dict[str, int]] = {}
+
+    def record(self, task: str, prompt_tokens: int, completion_tokens: int, cached: bool = False):
+        with self._lock:
+            entry = self.tasks.setdefault(
+                task, {"calls": 0, "cached_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+            )
+            entry["calls"] += 1
+            if cached:
+                entry["cached_calls"] += 1
+            else:
+                entry["prompt_tokens"] += prompt_tokens
+                entry["completion_tokens"] += completion_tokens
+
+    def merge(self, other: "TokenLedger", prefix: str = ""):
+        """Suma las tareas de otro registro (p. ej. el análisis compartido por varias plataformas)"""
+        with other._lock:
+            tasks = {task: dict(entry) for task, entry in other.tasks.items()}
+        with self._lock:
+            for task, entry in tasks.items():
+                target = self.tasks.setdefault(
+                    prefix + task, {"calls": 0, "cached_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+                )
+                for key, value in entry.items():
+                    target[key] += value
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            tasks = {task: dict(entry) for task, entry in self.tasks.items()}
+        return {
+            "tasks": tasks,
+            "prompt_tokens": sum(entry["prompt_tokens"] for entry in tasks.values()),
+            "completion_tokens": sum(entry["completion_tokens"] for entry in tasks.values()),
+            "calls": sum(entry["calls"] for entry in tasks.values())
+        }
+
+
+# Registro de la historia en curso (se propaga a los hilos con copy_context) y acumulado del proceso
+_current_ledger: contextvars.ContextVar[Optional[TokenLedger]] = contextvars.ContextVar("token_ledger", default=None)
+process_token_ledger = TokenLedger()
+
+
+@contextmanager
+def track_tokens():
+    """Registra en un TokenLedger nuevo todas las llamadas al LLM del bloque"""
+    ledger = TokenLedger()
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.reset(token)
+
+
+def record_llm_usage(task: str, prompt_tokens: int, completion_tokens: int, cached: bool = False):
+    """Anota una llamada en la historia en curso (si la hay) y en el acumulado del proceso"""
+    ledger = _current_ledger.get()
+    if ledger is not None:
+        ledger.record(task, prompt_tokens, completion_tokens, cached)
+    process_token_ledger.record(task, prompt_tokens, completion_tokens, cached)
+
+
+class UsageCapture(CustomLogger):
+    """
+    Callback de litellm que CrewAI invoca con el `usage` real de la respuesta, tanto en
+    streaming como sin él. CrewAI además lo registra en `litellm.callbacks` (global): esas
+    invocaciones (con tiempos reales) pueden venir de llamadas de otros hilos y se ignoran.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+
+    def log_success_event(self, kwargs, response_obj, start_time, end_time):
+        usage = (response_obj or {}).get("usage")
+        # CrewAI llama directamente con start_time=0; litellm pasa datetimes
+        if usage is None or start_time != 0:
+            return
+        read = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+        self.prompt_tokens = read("prompt_tokens")
+        self.completion_tokens = read("completion_tokens")
@@ -6,6 +6,7 @@ import time
 from pathlib import Path
 from PIL import Image
 from dotenv import load_dotenv
+from utils.metrics import metrics
 # import logging
 
 # logging.basicConfig(level=logging.INFO)
@@ -22,6 +23,7 @@ def login_user():
     # logger.info("Successfully logged in")
     return cl
 
+@metrics.timed("instagram_publish")
 def post_image(cl, image_path, caption):
     print("entrando a post_image...")
     headers = {'User-Agent':'Instagram 76.0.0.15.395 Android (24/7.0; 640dpi; 1440x2560; samsung; SM-G930F; herolte; samsungexynos8890; en_US; 138226743)'} 
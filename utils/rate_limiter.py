@@ -0,0 +1,129 @@
+import time
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+
+class TokenBucket:
+    """
+    Cubo de tokens que se rellena a `rate_per_minute`.
+    `reserve` descuenta aunque el saldo quede negativo y devuelve cuánto hay que esperar,
+    así las peticiones se atienden en orden de llegada sin sondeos.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """Reserva `amount` tokens y devuelve los segundos de espera necesarios"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+            self._updated = now
+            # Una petición más grande que el cubo entero no debe bloquear para siempre
+            self._tokens -= min(amount, self.capacity)
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate_per_second
+
+
+class RateLimiter:
+    """
+    Control de admisión compartido por todo el proceso: peticiones por minuto,
+    tokens por minuto y número máximo de llamadas simultáneas.
+    Un límite <= 0 desactiva esa restricción.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_concurrent: int = 0, window: int = 500):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self._semaphore = threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=window)
+        self._waiting = 0
+        self._in_flight = 0
+        self.calls = 0
+        self.throttled = 0
+
+    @contextmanager
+    def slot(self, estimated_tokens: int = 0):
+        """Espera turno (cubos + concurrencia) y mantiene ocupada una plaza durante la llamada"""
+        start = time.monotonic()
+        with self._lock:
+            self._waiting += 1
+
+        try:
+            delay = 0.0
+            if self.requests:
+                delay = max(delay, self.requests.reserve(1))
+            if self.tokens and estimated_tokens:
+                delay = max(delay, self.tokens.reserve(estimated_tokens))
+            if delay > 0:
+                time.sleep(delay)
+            if self._semaphore:
+                self._semaphore.acquire()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        with self._lock:
+            self._waits.append(time.monotonic() - start)
+            self._in_flight += 1
+            self.calls += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            if self._semaphore:
+                self._semaphore.release()
+
+    def record_throttle(self):
+        """Cuenta una respuesta 429 del proveedor"""
+        with self._lock:
+            self.throttled += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Tiempo en cola (ms) y ocupación actual"""
+        with self._lock:
+            waits = sorted(self._waits)
+            in_flight, waiting = self._in_flight, self._waiting
+            calls, throttled = self.calls, self.throttled
+
+        def percentile(fraction: float) -> float:
+            return waits[min(len(waits) - 1, int(fraction * len(waits)))] * 1000 if waits else 0.0
+
+        return {
+            'calls': calls,
+            'throttled': throttled,
+            'in_flight': in_flight,
+            'waiting': waiting,
+            'queue_wait_ms_mean': sum(waits) / len(waits) * 1000 if waits else 0.0,
+            'queue_wait_ms_p95': percentile(0.95),
+            'queue_wait_ms_max': waits[-1] * 1000 if waits else 0.0
+        }
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Backoff exponencial con jitter completo (evita que los reintentos lleguen sincronizados)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """429 / RESOURCE_EXHAUSTED de Gemini (vía litellm u otro cliente)"""
+    if getattr(error, 'status_code', None) == 429:
+        return True
+    text = f"{type(error).__name__} {error}"
+    return any(marker in text for marker in ('RateLimitError', '429', 'RESOURCE_EXHAUSTED', 'Too Many Requests'))
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación barata (~4 caracteres por token), suficiente para el cubo de TPM"""
+    return max(1, len(text) // 4)
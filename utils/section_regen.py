@@ -0,0 +1,114 @@
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from utils.json_salvage import (
+    FIELD_DESCRIPTIONS, LIST_FIELDS, extract_json_object, normalize_content, compose_full_text, platform_key
+)
+from utils.prompt_budget import compact_json, track_tokens
+from utils.metrics import metrics
+
+# Secciones que se pueden regenerar por separado; body/thread se regeneran párrafo a párrafo
+SECTION_FIELDS = {
+    'twitter': ['title', 'main_tweet', 'thread', 'call_to_action', 'hashtags'],
+    'default': ['title', 'hook', 'body', 'call_to_action', 'hashtags'],
+}
+PARAGRAPH_FIELDS = {'body', 'thread'}
+
+SECTION_LABELS = {
+    'title': "Título",
+    'hook': "Gancho",
+    'main_tweet': "Tweet principal",
+    'call_to_action': "Llamada a la acción",
+    'hashtags': "Hashtags",
+}
+
+# Marca la posición de la sección dentro del contexto congelado
+PLACEHOLDER = "<<SECCIÓN A REESCRIBIR>>"
+
+
+def section_options(content: Dict[str, Any], platform: str) -> List[Tuple[str, Optional[int]]]:
+    """(campo, índice de párrafo) de cada sección regenerable del contenido"""
+    fields = SECTION_FIELDS.get(platform_key(platform), SECTION_FIELDS['default'])
+    options = []
+    for field in fields:
+        if field in PARAGRAPH_FIELDS:
+            options += [(field, index) for index in range(len(content.get(field) or []))]
+        else:
+            options.append((field, None))
+    return options
+
+
+def section_label(field: str, index: Optional[int] = None) -> str:
+    if field in PARAGRAPH_FIELDS:
+        return f"{'Tweet' if field == 'thread' else 'Párrafo'} {index + 1}"
+    return SECTION_LABELS.get(field, field)
+
+
+def build_section_prompt(content: Dict[str, Any], platform: str, field: str, index: Optional[int] = None,
+                         tone: str = "", instructions: str = "") -> str:
+    """Prompt corto: el resto del post como contexto fijo y solo la sección pedida como respuesta"""
+    frozen = {key: value for key, value in content.items() if key != 'full_text' and value not in (None, "", [])}
+    if field in PARAGRAPH_FIELDS:
+        paragraphs = list(frozen.get(field) or [])
+        current = paragraphs[index]
+        paragraphs[index] = PLACEHOLDER
+        frozen[field] = paragraphs
+        description = f"el {section_label(field, index).lower()} del post"
+        key, example = 'paragraph', '"..."'
+    else:
+        current = frozen.get(field)
+        frozen[field] = PLACEHOLDER
+        description = FIELD_DESCRIPTIONS.get(field, field)
+        key, example = field, '["..."]' if field in LIST_FIELDS else '"..."'
+
+    current_text = compact_json(current) if current else "(vacío)"
+    lines = [
+        f"Post para {platform}{f' con tono {tone}' if tone else ''}. Todo es definitivo salvo {PLACEHOLDER}:",
+        compact_json(frozen),
+        "",
+        f"Reescribe solo esa sección: {description}. Valor actual: {current_text}.",
+        "Debe encajar con el resto del post sin repetirlo y mantener su idioma.",
+    ]
+    if instructions and instructions.strip():
+        lines.append(f"Indicaciones: {instructions.strip()}")
+    lines.append(f"Responde únicamente con JSON válido de la forma {{\"{key}\": {example}}}")
+    return "\n".join(lines)
+
+
+def regenerate_section(llm: Any, content: Dict[str, Any], platform: str, field: str, index: Optional[int] = None,
+                       tone: str = "", instructions: str = "") -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Regenera una única sección con una llamada pequeña al LLM. Devuelve (contenido nuevo, informe con
+    tokens y segundos); el resto del contenido no cambia y `full_text` se recompone sin llamar al LLM.
+    """
+    if field in PARAGRAPH_FIELDS and (index is None or not 0 <= index < len(content.get(field) or [])):
+        raise ValueError(f"Índice de párrafo fuera de rango: {index}")
+
+    prompt = build_section_prompt(content, platform, field, index, tone, instructions)
+    started = time.perf_counter()
+    with track_tokens() as ledger, metrics.span("section_regenerate"):
+        data, _ = extract_json_object(str(llm.call(prompt)))
+
+    if field in PARAGRAPH_FIELDS:
+        value = (data or {}).get('paragraph')
+        value = value.strip() if isinstance(value, str) else None
+    else:
+        value = normalize_content(data or {}).get(field)
+    if not value:
+        raise ValueError(f"El LLM no devolvió la sección '{section_label(field, index)}'")
+
+    new_content = dict(content)
+    if field in PARAGRAPH_FIELDS:
+        new_content[field] = list(content[field])
+        new_content[field][index] = value
+    else:
+        new_content[field] = value
+    new_content['full_text'] = compose_full_text(new_content)
+
+    usage = ledger.summary()
+    return new_content, {
+        'field': field,
+        'index': index,
+        'prompt_tokens': usage['prompt_tokens'],
+        'completion_tokens': usage['completion_tokens'],
+        'seconds': round(time.perf_counter() - started, 3)
+    }
@@ -0,0 +1,162 @@
+import os
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional, Set
+
+# Trabajo especulativo que se abandona sin reclamar (sesión cerrada, recarga...) caduca a los N segundos
+SPECULATIVE_TTL_SECONDS = float(os.getenv("SPECULATIVE_TTL_SECONDS", "900"))
+
+
+class SpeculativeEntry:
+    """Trabajos lanzados para una imagen antes de que el usuario pulse "Generar" """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.futures: Dict[str, Future] = {}
+        self.on_abandon: Dict[str, Callable[[Any], None]] = {}
+        self.owners: Set[str] = set()
+        self.created_at = time.time()
+        self.cancelled = threading.Event()
+
+    def result(self, name: str, timeout: Optional[float] = None) -> Any:
+        """Resultado de una tarea (esperando como mucho `timeout`); None si no existe, falló o no llegó a tiempo"""
+        future = self.futures.get(name)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            return None
+        except Exception as e:
+            print(f"⚠️ Trabajo especulativo '{name}' falló: {e}")
+            return None
+
+
+class SpeculativeRunner:
+    """
+    Ejecuta en segundo plano el trabajo que casi seguro se va a necesitar (caption,
+    subida de la imagen) indexado por el hash del contenido. Si el usuario cambia
+    de imagen, lo que aún no empezó se cancela y lo ya hecho se deshace con
+    `on_abandon` (p. ej. borrar la imagen subida).
+    """
+
+    def __init__(self, max_workers: int = 2, ttl_seconds: float = SPECULATIVE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._entries: Dict[str, SpeculativeEntry] = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.claimed = 0
+        self.abandoned = 0
+
+    def start(self, key: str, owner: str, tasks: Dict[str, Callable[[], Any]],
+              on_abandon: Optional[Dict[str, Callable[[Any], None]]] = None) -> SpeculativeEntry:
+        """Lanza las tareas que aún no existan para `key` (idempotente entre reruns y sesiones)"""
+        with self._lock:
+            expired = self._pop_expired()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = SpeculativeEntry(key)
+            entry.owners.add(owner)
+            for name, fn in tasks.items():
+                if name not in entry.futures:
+                    entry.futures[name] = self._executor.submit(self._run, entry, fn)
+                    self.started += 1
+            entry.on_abandon.update(on_abandon or {})
+        for old in expired:
+            self._abandon(old)
+        return entry
+
+    @staticmethod
+    def _run(entry: SpeculativeEntry, fn: Callable[[], Any]) -> Any:
+        # Una tarea en cola cuyo dueño ya cambió de imagen no llega a ejecutarse
+        if entry.cancelled.is_set():
+            return None
+        return fn()
+
+    def result(self, key: str, name: str, timeout: Optional[float] = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry.result(name, timeout) if entry else None
+
+    def claim(self, key: str) -> Optional[SpeculativeEntry]:
+        """La generación se queda con los resultados: ya no se deshacen al cambiar de imagen"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.claimed += 1
+        return entry
+
+    def release(self, key: str, owner: str):
+        """El dueño cambió de imagen; si nadie más la usa se cancela y se deshace lo hecho"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.owners.discard(owner)
+            if entry.owners:
+                return
+            del self._entries[key]
+        self._abandon(entry)
+
+    def _pop_expired(self):
+        now = time.time()
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl_seconds]
+        return [self._entries.pop(key) for key in expired]
+
+    def _abandon(self, entry: SpeculativeEntry):
+        with self._lock:
+            self.abandoned += 1
+        entry.cancelled.set()
+        for name, future in entry.futures.items():
+            if future.cancel():
+                continue
+            undo = entry.on_abandon.get(name)
+            if undo is not None:
+                # Se deshace cuando termine, en el executor para no bloquear el rerun de la interfaz
+                future.add_done_callback(lambda done, undo=undo: self._executor.submit(self._undo, done, undo))
+
+    @staticmethod
+    def _undo(future: Future, undo: Callable[[Any], None]):
+        if future.cancelled() or future.exception() is not None:
+            return
+        result = future.result()
+        if result is not None:
+            try:
+                undo(result)
+            except Exception as e:
+                print(f"⚠️ No se pudo deshacer un trabajo especulativo: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'pending': len(self._entries),
+                'started': self.started,
+                'claimed': self.claimed,
+                'abandoned': self.abandoned
+            }
+
+
+def write_temp_image(data: bytes, filename: str, prefix: str) -> str:
+    """Escribe la imagen en un temporal de nombre único (conserva la extensión) y devuelve su ruta"""
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=os.path.splitext(filename)[1])
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return path
+
+
+@contextmanager
+def temp_copy(data: bytes, filename: str):
+    """Copia propia de la imagen para el trabajo especulativo (el temporal de cada generación es de su trabajo)"""
+    path = write_temp_image(data, filename, prefix="speculative_")
+    try:
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+speculative_runner = SpeculativeRunner(max_workers=int(os.getenv("SPECULATIVE_MAX_WORKERS", "2")))
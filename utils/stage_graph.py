@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from utils.disk_cache import DiskCache
+
+STAGE_CACHE_ENABLED = os.getenv("STAGE_CACHE_ENABLED", "true").lower() == "true"
+
+# Estados de una etapa en una ejecución
+GIVEN = "given"
+CACHED = "cached"
+COMPUTED = "computed"
+
+
+def value_fingerprint(value: Any) -> str:
+    """Huella de un valor serializable (orden de claves estable)"""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(path: str) -> str:
+    """Hash del contenido del archivo: el mismo que calcula utils.image_ingest para la imagen subida"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Stage:
+    """
+    Etapa del grafo: `fn(values)` recibe todos los valores conocidos, pero la clave de caché solo depende
+    de `inputs` y, si se indica, de `key_fn(values)` (lo que la etapa deriva de ellos y también decide
+    su salida, como el prompt ya renderizado o la configuración del LLM)
+    """
+
+    def __init__(self, name: str, fn: Callable[[Dict[str, Any]], Any], inputs: List[str],
+                 version: str = "1", cached: bool = True, key_fn: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs
+        self.version = version
+        self.cached = cached
+        self.key_fn = key_fn
+
+
+class StageRun:
+    """Valores, huellas y estado (given/cached/computed) de cada nodo resuelto en una ejecución"""
+
+    def __init__(self, values: Dict[str, Any], fingerprints: Dict[str, str]):
+        self.values = dict(values)
+        self.fingerprints = dict(fingerprints)
+        self.status: Dict[str, str] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        return self.values[name]
+
+
+class StageGraph:
+    """
+    Grafo explícito de etapas con memoización por huella de las entradas.
+    La huella de una etapa se deriva de las huellas de sus entradas (no de su salida), así que
+    cambiar un valor solo invalida las etapas que dependen de él: cambiar el tono recalcula el
+    contenido pero reutiliza la descripción de la imagen.
+    """
+
+    def __init__(self, cache: Optional[DiskCache] = None):
+        self.cache = cache
+        self.stages: Dict[str, Stage] = {}
+        self._lock = threading.Lock()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+
+    def add(self, name: str, fn: Callable[[Dict[str, Any]], Any], inputs: List[str],
+            version: str = "1", cached: bool = True,
+            key_fn: Optional[Callable[[Dict[str, Any]], Any]] = None) -> Stage:
+        stage = self.stages[name] = Stage(name, fn, inputs, version, cached, key_fn)
+        return stage
+
+    def run(self, target: str, values: Dict[str, Any], fingerprints: Optional[Dict[str, str]] = None,
+            refresh: Iterable[str] = (), on_hit: Optional[Callable[[str], None]] = None) -> StageRun:
+        """
+        Resuelve `target` y sus dependencias. `values` trae las entradas (y, opcionalmente, etapas ya
+        conocidas, que no se recalculan); `fingerprints` sustituye la huella de una entrada (p. ej. el
+        hash del archivo en lugar de su ruta); las etapas de `refresh` ignoran la caché al leer.
+        """
+        run = StageRun(values, fingerprints or {})
+        self._resolve(target, run, set(refresh), on_hit)
+        return run
+
+    def _resolve(self, name: str, run: StageRun, refresh: set, on_hit) -> str:
+        if name in run.status:
+            return run.fingerprints[name]
+
+        stage = self.stages.get(name)
+        if name in run.values or stage is None:
+            if name not in run.values:
+                raise KeyError(f"Falta la entrada '{name}' del grafo de etapas")
+            run.fingerprints.setdefault(name, value_fingerprint(run.values[name]))
+            run.status[name] = GIVEN
+            return run.fingerprints[name]
+
+        input_fingerprints = [self._resolve(dependency, run, refresh, on_hit) for dependency in stage.inputs]
+        if stage.key_fn is not None:
+            input_fingerprints.append(value_fingerprint(stage.key_fn(run.values)))
+        key = hashlib.sha256(
+            f"{stage.name}|{stage.version}|{'|'.join(input_fingerprints)}".encode("utf-8")
+        ).hexdigest()
+        run.fingerprints[name] = key
+
+        use_cache = self.cache is not None and stage.cached and STAGE_CACHE_ENABLED
+        if use_cache and name not in refresh:
+            cached = self.cache.get(key)
+            if cached is not None:
+                run.values[name] = cached
+                run.status[name] = CACHED
+                self._count(self.hits, name)
+                if on_hit:
+                    on_hit(name)
+                return key
+
+        value = stage.fn(run.values)
+        if use_cache and value is not None:
+            self.cache.set(key, value)
+        run.values[name] = value
+        run.status[name] = COMPUTED
+        self._count(self.misses, name)
+        return key
+
+    def _count(self, counter: Dict[str, int], name: str):
+        with self._lock:
+            counter[name] = counter.get(name, 0) + 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Aciertos y recálculos por etapa (por proceso)"""
+        with self._lock:
+            return {
+                name: {'hits': self.hits.get(name, 0), 'misses': self.misses.get(name, 0)}
+                for name in self.stages
+            }
+
+
+# Salidas de las etapas de generación (descripción de la imagen, contenido por plataforma)
+stage_cache = DiskCache(
+    os.getenv("STAGE_CACHE_PATH", os.path.join(".cache", "stages.sqlite")),
+    max_entries=int(os.getenv("STAGE_CACHE_MAX_ENTRIES", "1000")),
+    ttl_seconds=float(os.getenv("STAGE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+)
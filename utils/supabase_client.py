@@ -3,6 +3,12 @@ from supabase import create_client, Client
 from typing import Dict, List, Optional
 import json
 from datetime import datetime
+from utils.metrics import metrics
+
+
+def request_failed(result: Dict) -> bool:
+    """Los métodos del gestor devuelven {"success": False, ...} en lugar de lanzar: cuenta como error en las métricas"""
+    return not result.get("success")
 
 class SupabaseManager:
     def __init__(self):
@@ -11,6 +17,7 @@ class SupabaseManager:
         self.secret_key = os.getenv("SUPABASE_SECRET_KEY")
         self.client: Client = create_client(self.url, self.secret_key)
     
+    @metrics.timed("supabase_save_story", failed=request_failed)
     def save_story(self, user_id: str, title: str, content: Dict, tone: str, 
                    images: List[str] = None, metadata: Dict = None, story_id: str = None) -> Dict:
         """Guarda una historia en la base de datos o actualiza una existente"""
@@ -101,6 +108,7 @@ class SupabaseManager:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    @metrics.timed("supabase_upload_image", failed=request_failed)
     def upload_image(self, file_path: str, user_id: str, file_name: str) -> Dict:
         """Sube una imagen al storage de Supabase"""
         try:
@@ -125,7 +133,7 @@ class SupabaseManager:
             # Obtener URL pública
             public_url = self.client.storage.from_("story-images").get_public_url(storage_path)
             
-            return {"success": True, "url": public_url}
+            return {"success": True, "url": public_url, "path": storage_path}
         except Exception as e:
             return {"success": False, "error": str(e)}
     